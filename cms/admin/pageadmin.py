@@ -34,6 +34,7 @@ from cms.admin.forms import (PageForm, AdvancedSettingsForm, PagePermissionForm,
                              PublicationDatesForm)
 from cms.admin.permissionadmin import (PERMISSION_ADMIN_INLINES, PagePermissionInlineAdmin, ViewRestrictionInlineAdmin)
 from cms.admin.views import revert_plugins
+from cms.cache.invalidation import invalidation_deferred
 from cms.models import Page, Title, CMSPlugin, PagePermission, PageModeratorState, EmptyTitle, GlobalPagePermission, \
     titlemodels, StaticPlaceholder
 from cms.models.managers import PagePermissionsPermissionManager
@@ -931,6 +932,7 @@ class PageAdmin(PlaceholderAdmin, ModelAdmin):
 
     #TODO: Make the change form buttons use POST
     #@require_POST
+    @invalidation_deferred
     @transaction.commit_on_success
     @create_revision()
     def publish_page(self, request, page_id, language):
@@ -1010,6 +1012,7 @@ class PageAdmin(PlaceholderAdmin, ModelAdmin):
         return HttpResponseRedirect(path)
 
     @require_POST
+    @invalidation_deferred
     def unpublish(self, request, page_id, language):
         """
         Publish or unpublish a language of a page
@@ -1043,6 +1046,7 @@ class PageAdmin(PlaceholderAdmin, ModelAdmin):
 
     #TODO: Make the change form buttons use POST
     #@require_POST
+    @invalidation_deferred
     @transaction.commit_on_success
     def revert_page(self, request, page_id, language):
         page = get_object_or_404(Page, id=page_id)
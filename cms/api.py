@@ -7,6 +7,8 @@ You must implement the necessary permission checks in your own code before
 calling these methods!
 """
 import datetime
+import time
+from collections import defaultdict
 from cms.utils import copy_plugins
 from cms.utils.compat.type_checks import string_types
 from cms.utils.conf import get_cms_setting
@@ -15,6 +17,7 @@ from cms.utils.i18n import get_language_list
 
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
+from django.db import transaction
 from django.db.models import Max
 from django.template.defaultfilters import slugify
 from menus.menu_pool import menu_pool
@@ -22,6 +25,7 @@ from menus.menu_pool import menu_pool
 from cms.admin.forms import save_permissions
 from cms.app_base import CMSApp
 from cms.apphook_pool import apphook_pool
+from cms.cache.invalidation import deferred_invalidation
 from cms.models.pagemodel import Page
 from cms.models.permissionmodels import PageUser, PagePermission, GlobalPagePermission, ACCESS_PAGE_AND_DESCENDANTS
 from cms.models.placeholdermodel import Placeholder
@@ -359,6 +363,11 @@ def assign_user_to_page(page, user, grant_on=ACCESS_PAGE_AND_DESCENDANTS,
     return page_permission
 
 
+class _FakeRequest(object):
+    def __init__(self, user):
+        self.user = user
+
+
 def publish_page(page, user, language):
     """
     Publish a page. This sets `page.published` to `True` and calls publish()
@@ -367,18 +376,51 @@ def publish_page(page, user, language):
     See docs/extending_cms/api_reference.rst for more info
     """
     page = page.reload()
-
-    class FakeRequest(object):
-        def __init__(self, user):
-            self.user = user
-
-    request = FakeRequest(user)
+    request = _FakeRequest(user)
     if not page.has_publish_permission(request):
         raise PermissionDenied()
     page.publish(language)
     return page.reload()
 
 
+def publish_tree(page, user, languages=None):
+    """
+    Publishes a page and all its descendants in one transaction, parents
+    before their children. The caches are cleared once, after the commit.
+
+    See docs/extending_cms/api_reference.rst for more info
+    """
+    page = page.reload()
+    if not page.publisher_is_draft:
+        page = page.publisher_draft
+    pages = list(page.get_descendants(include_self=True).filter(
+        publisher_is_draft=True).order_by('tree_id', 'lft'))
+    request = _FakeRequest(user)
+    for draft in pages:
+        if not draft.has_publish_permission(request):
+            raise PermissionDenied()
+    page_languages = defaultdict(list)
+    titles = Title.objects.filter(page__in=pages).values_list('page_id', 'language', 'published')
+    for page_id, language, published in titles:
+        if (published if languages is None else language in languages):
+            page_languages[page_id].append(language)
+    report = []
+    with deferred_invalidation():
+        with transaction.commit_on_success():
+            for draft in pages:
+                if not page_languages[draft.pk]:
+                    continue
+                start = time.time()
+                published = []
+                for language in page_languages[draft.pk]:
+                    # pages below an unpublished page wait for it
+                    if draft.publish(language, batch=True):
+                        published.append(language)
+                report.append((draft, published, time.time() - start))
+            menu_pool.clear_nodes(site_id=page.site_id)
+    return report
+
+
 def get_page_draft(page):
     """
     Returns the draft version of a page, regardless if the passed in
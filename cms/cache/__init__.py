@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.cache import cache
+
+
+def _new_generation():
+    # A counter that expired must never go back to a value that was already
+    # used, so new counters start at the current time in milliseconds.
+    return int(time.time() * 1000)
+
+
+def get_generation(key):
+    """
+    Returns the version counter stored under ``key``, creating it if needed.
+
+    Counters are kept for the default timeout of the cache backend rather
+    than one of the ``CMS_CACHE_DURATIONS``: they have to outlive the entries
+    they version.
+    """
+    version = cache.get(key)
+    if version is None:
+        version = _new_generation()
+        cache.add(key, version)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_generation(key):
+    """
+    Bumps the version counter stored under ``key``.
+    """
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the counter is not in the cache (yet or anymore)
+        cache.set(key, _new_generation())
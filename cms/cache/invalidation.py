@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Deferred cache invalidation for bulk operations.
+
+Within a ``deferred_invalidation()`` block the cache clearing helpers (menus,
+routing tables, permissions) only record what is dirty. When the outermost
+block exits, every distinct invalidation is made once. Wrap the transaction
+with the block (not the other way round), so other processes can't rebuild
+the caches from data which isn't committed yet.
+"""
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    from threading import local
+except ImportError:
+    from django.utils._threading_local import local
+
+_thread_locals = local()
+
+
+def is_deferred():
+    return getattr(_thread_locals, 'depth', 0) > 0
+
+
+def defer(key, func, *args, **kwargs):
+    """
+    Records the call ``func(*args, **kwargs)`` to be made when the deferred
+    invalidations are flushed. Calls with a key that was already recorded are
+    dropped.
+
+    Returns False, without recording anything, if invalidation isn't deferred
+    in this thread.
+    """
+    if not is_deferred():
+        return False
+    if key not in _thread_locals.keys:
+        _thread_locals.keys.add(key)
+        _thread_locals.calls.append((func, args, kwargs))
+    return True
+
+
+@contextmanager
+def deferred_invalidation():
+    """
+    Defers the cache invalidations made in the block to its end. Blocks can
+    be nested, the outermost one flushes.
+    """
+    depth = getattr(_thread_locals, 'depth', 0)
+    if not depth:
+        _thread_locals.keys = set()
+        _thread_locals.calls = []
+    _thread_locals.depth = depth + 1
+    try:
+        yield
+    finally:
+        _thread_locals.depth = depth
+        if not depth:
+            # flush even if the block failed: what was saved before the error
+            # may have been committed
+            calls = _thread_locals.calls
+            _thread_locals.keys = set()
+            _thread_locals.calls = []
+            for func, args, kwargs in calls:
+                func(*args, **kwargs)
+
+
+def invalidation_deferred(func):
+    """
+    Decorator running the decorated function in a deferred_invalidation block.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with deferred_invalidation():
+            return func(*args, **kwargs)
+    return wrapper
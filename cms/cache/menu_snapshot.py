@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot of the public pages of a site in one language, used by CMSMenu to
+build the page nodes without loading full Page and Title instances.
+
+The snapshot only holds the columns needed by the menu, grouped per page tree
+(keyed by the id of the root page, as tree ids may shift when trees are
+inserted). It is stored in the cache and refreshed tree by tree when a public
+page or title is saved (so when a page is published or unpublished); moves and
+deletions drop it altogether, and so does ``menu_pool.clear``.
+"""
+from collections import namedtuple
+
+from cms.cache import bump_generation, get_generation
+from cms.utils.conf import get_cms_setting
+from django.core.cache import cache
+from django.utils import timezone
+
+
+SnapshotPage = namedtuple('SnapshotPage', [
+    'pk', 'parent_id', 'is_home', 'in_navigation', 'soft_root',
+    'login_required', 'reverse_id', 'limit_visibility_in_menu',
+    'navigation_extenders', 'application_urls', 'publication_date',
+    'publication_end_date', 'title', 'menu_title', 'path', 'slug', 'redirect',
+])
+
+# the columns of the snapshot query, tree_id and lft are only used for grouping
+# and ordering
+SNAPSHOT_FIELDS = (
+    'page__tree_id', 'page__lft', 'page_id', 'page__parent_id', 'page__is_home',
+    'page__in_navigation', 'page__soft_root', 'page__login_required',
+    'page__reverse_id', 'page__limit_visibility_in_menu',
+    'page__navigation_extenders', 'page__application_urls',
+    'page__publication_date', 'page__publication_end_date', 'title',
+    'menu_title', 'path', 'slug', 'redirect',
+)
+
+
+def get_cache_version_key(site_id=None):
+    return "%s:menu_snapshot:%s:version" % (get_cms_setting('CACHE_PREFIX'), site_id or 'all')
+
+
+def get_cache_version(site_id):
+    return "%s.%s" % (get_generation(get_cache_version_key()),
+                      get_generation(get_cache_version_key(site_id)))
+
+
+def get_cache_key(site_id, language):
+    return "%s:menu_snapshot:%s:%s:%s" % (get_cms_setting('CACHE_PREFIX'), site_id,
+                                          get_cache_version(site_id), language)
+
+
+def clear_menu_snapshot(site_id=None):
+    """
+    Drops the snapshots of all languages of the given site, or of all sites.
+    """
+    bump_generation(get_cache_version_key(site_id))
+
+
+def _get_titles(site_id, language):
+    from cms.models.titlemodels import Title
+
+    return Title.objects.filter(
+        language=language,
+        published=True,
+        page__site=site_id,
+        page__publisher_is_draft=False,
+    ).order_by('page__tree_id', 'page__lft')
+
+
+def _get_roots(site_id):
+    """
+    Returns the ``(tree_id, page_id)`` tuples of the public root pages of a
+    site, ordered by tree.
+    """
+    from cms.models.pagemodel import Page
+
+    return list(Page.objects.public().filter(site=site_id, parent__isnull=True).order_by(
+        'tree_id').values_list('tree_id', 'pk'))
+
+
+def _collect(titles, roots):
+    trees = {}
+    root_ids = dict(roots)
+    for row in titles.values_list(*SNAPSHOT_FIELDS):
+        root_id = root_ids.get(row[0])
+        if root_id is not None:
+            trees.setdefault(root_id, []).append(SnapshotPage(*row[2:]))
+    return trees
+
+
+def build_menu_snapshot(site_id, language):
+    """
+    Builds the snapshot from scratch with two queries.
+    """
+    roots = _get_roots(site_id)
+    snapshot = {
+        'roots': [root_id for tree_id, root_id in roots],
+        'trees': _collect(_get_titles(site_id, language), roots),
+    }
+    cache.set(get_cache_key(site_id, language), snapshot,
+              get_cms_setting('CACHE_DURATIONS')['menus'])
+    return snapshot
+
+
+def get_menu_snapshot(site_id, language):
+    snapshot = cache.get(get_cache_key(site_id, language))
+    if snapshot is None:
+        snapshot = build_menu_snapshot(site_id, language)
+    return snapshot
+
+
+def refresh_menu_snapshot(site_id, language, page_id):
+    """
+    Reloads the tree of the given public page in an existing snapshot. Does
+    nothing if there is no snapshot yet, it will be built when needed.
+    """
+    from cms.models.pagemodel import Page
+
+    key = get_cache_key(site_id, language)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        return
+    tree_id = list(Page.objects.filter(pk=page_id).values_list('tree_id', flat=True))
+    tree_id = tree_id[0] if tree_id else None
+    roots = _get_roots(site_id)
+    root_ids = dict(roots)
+    root_id = root_ids.get(tree_id)
+    known = set(snapshot['roots'])
+    known.add(root_id)
+    if root_id is None or set(root_ids.values()) - known:
+        # the tree of the page is unknown or another tree appeared: start over
+        cache.delete(key)
+        return
+    trees = snapshot['trees']
+    trees.pop(root_id, None)
+    trees.update(_collect(_get_titles(site_id, language).filter(page__tree_id=tree_id), roots))
+    snapshot['roots'] = [pk for tree_id, pk in roots]
+    for pk in set(trees) - set(snapshot['roots']):
+        del trees[pk]
+    cache.set(key, snapshot, get_cms_setting('CACHE_DURATIONS')['menus'])
+
+
+def get_snapshot_pages(snapshot):
+    """
+    Returns the currently visible pages of a snapshot, ordered as in the page
+    tree.
+    """
+    now = timezone.now()
+    pages = []
+    for root_id in snapshot['roots']:
+        for page in snapshot['trees'].get(root_id, ()):
+            if page.publication_date is not None and page.publication_date > now:
+                continue
+            if page.publication_end_date is not None and page.publication_end_date <= now:
+                continue
+            pages.append(page)
+    return pages
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the responses of cms.views.details for anonymous users, enabled
+with ``CMS_PAGE_CACHE``.
+
+Responses are keyed by site, language and path together with a version per
+site, which is bumped when pages are published, unpublished, moved or
+deleted: a publish can change the menus, and so the output, of every page of
+the site.
+"""
+from hashlib import md5
+
+from cms.cache import bump_generation, get_generation
+from cms.utils.conf import get_cms_setting, get_site_id
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+def get_cache_version_key(site_id):
+    return "%s:page:%s:version" % (get_cms_setting('CACHE_PREFIX'), site_id)
+
+
+def get_cache_version(site_id):
+    return get_generation(get_cache_version_key(site_id))
+
+
+def clear_page_cache(site_id):
+    """
+    Invalidates the cached responses of all the pages of a site.
+    """
+    bump_generation(get_cache_version_key(site_id))
+
+
+def get_cache_key(request, language, site_id=None):
+    site_id = get_site_id(site_id)
+    return "%s:page:%s:%s:%s:%s" % (
+        get_cms_setting('CACHE_PREFIX'), site_id, get_cache_version(site_id), language,
+        md5(request.path.encode('utf-8')).hexdigest())
+
+
+def is_cacheable_request(request):
+    """
+    Only plain anonymous GET requests without query string, toolbar or
+    edit/build session flags are served from the cache.
+    """
+    if not get_cms_setting('PAGE_CACHE'):
+        return False
+    if request.method not in ('GET', 'HEAD') or request.GET:
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return False
+    session = getattr(request, 'session', None)
+    if session is not None and (session.get('cms_edit') or session.get('cms_build')):
+        return False
+    toolbar = getattr(request, 'toolbar', None)
+    if toolbar is not None and (toolbar.show_toolbar or toolbar.edit_mode or toolbar.build_mode):
+        return False
+    return True
+
+
+def get_page_cache(request, language):
+    """
+    Returns the cached response for the request or None.
+    """
+    cached = cache.get(get_cache_key(request, language))
+    if cached is None:
+        return None
+    response = HttpResponse(cached['content'], status=cached['status'])
+    for header, value in cached['headers']:
+        response[header] = value
+    return response
+
+
+def set_page_uncacheable(request):
+    """
+    Keeps the response to the request out of the cache, called when a plugin
+    whose output can't be cached or varies per visitor is rendered
+    (``CMSPluginBase.cache``).
+    """
+    request._cms_page_uncacheable = True
+
+
+def set_page_cache(request, language, response):
+    """
+    Stores a rendered response unless it is not a plain 200, it uses a csrf
+    token or cookies, which are specific to a visitor, or a plugin opted out.
+    """
+    if request.method != 'GET' or response.status_code != 200:
+        return
+    if getattr(request, '_cms_page_uncacheable', False):
+        return
+    if request.META.get('CSRF_COOKIE_USED') or response.cookies:
+        return
+    cache.set(get_cache_key(request, language), {
+        'content': response.content,
+        'status': response.status_code,
+        'headers': list(response.items()),
+    }, get_cms_setting('CACHE_DURATIONS')['content'])
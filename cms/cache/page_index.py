@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+In-process index of the pages of a site by pk, used by the page_url and
+page_attribute template tags to find the draft or public version of a page
+without querying. Lookups by reverse_id go through cms.cache.reverse_ids.
+
+One index is kept per site. It shares the version of the routing tables (see
+cms.cache.routing), which is bumped when pages are saved, published,
+unpublished, moved or deleted.
+"""
+from cms.cache.routing import get_cache_version
+
+
+# site_id -> PageIndex
+_indexes = {}
+
+
+def reset_page_indexes():
+    """
+    Drops the indexes of this process only. Mostly useful for tests.
+    """
+    _indexes.clear()
+
+
+class PageIndex(object):
+    def __init__(self, site_id, version):
+        self.site_id = site_id
+        self.version = version
+        # pk of the draft or public page -> (draft pk, public pk)
+        self.pks = {}
+
+    def build(self):
+        from cms.models.pagemodel import Page
+
+        pages = Page.objects.filter(site=self.site_id).values_list(
+            'pk', 'publisher_is_draft', 'publisher_public_id')
+        orphans = []
+        for pk, is_draft, public_id in pages:
+            if is_draft:
+                self.pks[pk] = (pk, public_id)
+                if public_id:
+                    self.pks[public_id] = (pk, public_id)
+            else:
+                orphans.append(pk)
+        for pk in orphans:
+            # public pages whose draft is gone
+            self.pks.setdefault(pk, (None, pk))
+        return self
+
+    def get_pk(self, pk, draft=False):
+        """
+        Returns the pk of the draft or public version of the page with the
+        given pk, None if it has no such version, or raises KeyError if there
+        is no such page.
+        """
+        draft_pk, public_pk = self.pks[pk]
+        return draft_pk if draft else public_pk
+
+
+def get_page_index(site_id):
+    version = get_cache_version(site_id)
+    index = _indexes.get(site_id)
+    if index is None or index.version != version:
+        index = PageIndex(site_id, version).build()
+        _indexes[site_id] = index
+    return index
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the placeholders attached to a page, used by
+``Page.rescan_placeholders`` so that rendering a page does not need to query
+its placeholders.
+
+Entries are dropped when placeholders are added to or removed from a page,
+when a placeholder is deleted and when the page itself is deleted.
+"""
+from cms.utils.conf import get_cms_setting
+from django.core.cache import cache
+
+
+def get_cache_key(page_id):
+    return "%s:page_placeholders:%s" % (get_cms_setting('CACHE_PREFIX'), page_id)
+
+
+def get_page_placeholders(page_id):
+    """
+    Returns the cached list of placeholders of a page or None.
+    """
+    return cache.get(get_cache_key(page_id))
+
+
+def set_page_placeholders(page_id, placeholders):
+    cache.set(get_cache_key(page_id), list(placeholders),
+              get_cms_setting('CACHE_DURATIONS')['content'])
+
+
+def clear_page_placeholders(*page_ids):
+    if page_ids:
+        cache.delete_many([get_cache_key(page_id) for page_id in page_ids])
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from cms.cache.invalidation import defer
 from cms.utils import get_cms_setting
 from django.conf import settings
 from django.core.cache import cache
@@ -9,7 +10,7 @@ PERMISSION_KEYS = [
     'can_change', 'can_add', 'can_delete',
     'can_change_advanced_settings', 'can_publish',
     'can_change_permissions', 'can_move_page',
-    'can_moderate', 'can_view']
+    'can_moderate', 'can_view', 'view_profile']
 
 
 def get_cache_key(user, key):
@@ -49,14 +50,36 @@ def clear_user_permission_cache(user):
     """
     Cleans permission cache for given user.
     """
+    if defer(('permissions', user.username), clear_user_permission_cache, user):
+        return
     for key in PERMISSION_KEYS:
         cache.delete(get_cache_key(user, key), version=get_cache_version())
 
 
 def clear_permission_cache():
+    if defer(('permissions',), clear_permission_cache):
+        return
     version = get_cache_version()
     if version > 1:
         cache.incr(get_cache_version_key())
     else:
         cache.set(get_cache_version_key(), 2,
                 get_cms_setting('CACHE_DURATIONS')['permissions'])
+
+
+def get_view_restrictions_cache_key(site_id):
+    return "%s:permission:view_restrictions:%s" % (
+        get_cms_setting('CACHE_PREFIX'), site_id)
+
+
+def get_view_restrictions_cache(site_id):
+    return cache.get(get_view_restrictions_cache_key(site_id))
+
+
+def set_view_restrictions_cache(site_id, restrictions):
+    cache.set(get_view_restrictions_cache_key(site_id), restrictions,
+              get_cms_setting('CACHE_DURATIONS')['permissions'])
+
+
+def clear_view_restrictions_cache(site_id):
+    cache.delete(get_view_restrictions_cache_key(site_id))
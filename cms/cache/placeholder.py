@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the rendered content of placeholders, enabled with
+``CMS_PLACEHOLDER_CACHE``.
+
+Entries are keyed by placeholder, language, site and a content version which
+is bumped whenever a plugin of the placeholder changes or the placeholder is
+published. Plugins declare through ``CMSPluginBase.cache`` whether their
+output can be cached and which request values it depends on; this
+information is stored next to the content so that a hit needs no query.
+"""
+from hashlib import md5
+
+from cms.cache import bump_generation, get_generation
+from cms.utils.conf import get_cms_setting, get_site_id
+from django.core.cache import cache
+
+
+def get_cache_version_key(placeholder_id):
+    return "%s:placeholder:%s:version" % (get_cms_setting('CACHE_PREFIX'), placeholder_id)
+
+
+def get_cache_version(placeholder_id):
+    return get_generation(get_cache_version_key(placeholder_id))
+
+
+def clear_placeholder_cache(placeholder_id):
+    """
+    Invalidates the cached content of a placeholder in all languages.
+    """
+    bump_generation(get_cache_version_key(placeholder_id))
+
+
+def _get_base_key(placeholder, lang, site_id=None):
+    return "%s:placeholder:%s:%s:%s:%s" % (
+        get_cms_setting('CACHE_PREFIX'), placeholder.pk, lang, get_site_id(site_id),
+        get_cache_version(placeholder.pk))
+
+
+def _get_vary_key(base_key, vary, request):
+    values = []
+    for name in vary:
+        if name == 'user':
+            values.append(str(request.user.pk) if request.user.is_authenticated() else '')
+        else:
+            values.append(request.META.get(name, ''))
+    return "%s:%s" % (base_key, md5("\n".join(values).encode('utf-8')).hexdigest())
+
+
+def get_plugins_vary(plugins):
+    """
+    Returns the sorted names of the request values the output of the plugins
+    (and their children) varies on, or None if one of them can not be cached.
+    """
+    from cms.plugin_pool import plugin_pool
+
+    vary = set()
+    stack = list(plugins)
+    while stack:
+        plugin = stack.pop()
+        try:
+            plugin_cache = plugin_pool.get_plugin(plugin.plugin_type).cache
+        except KeyError:
+            return None
+        if not plugin_cache:
+            return None
+        if plugin_cache is not True:
+            vary.update(plugin_cache)
+        stack.extend(getattr(plugin, 'child_plugin_instances', None) or [])
+    return tuple(sorted(vary))
+
+
+def get_placeholder_cache(placeholder, lang, request, site_id=None):
+    """
+    Returns the cached ``{'content': ..., 'sekizai': ..., 'vary': ...}`` entry
+    of the placeholder or None.
+    """
+    base_key = _get_base_key(placeholder, lang, site_id)
+    vary = cache.get(base_key)
+    if vary is None:
+        return None
+    return cache.get(_get_vary_key(base_key, vary, request))
+
+
+def set_placeholder_cache(placeholder, lang, request, plugins, content, sekizai, site_id=None):
+    vary = get_plugins_vary(plugins)
+    if vary is None:
+        return
+    base_key = _get_base_key(placeholder, lang, site_id)
+    duration = get_cms_setting('CACHE_DURATIONS')['content']
+    cache.set(base_key, vary, duration)
+    cache.set(_get_vary_key(base_key, vary, request),
+              {'content': content, 'sekizai': sekizai, 'vary': vary}, duration)
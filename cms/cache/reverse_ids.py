@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Per-site table of the pages with a ``reverse_id``, stored in the cache backend
+so that the page_url, page_attribute and show_placeholder template tags can
+resolve a reverse_id without querying.
+
+The table maps each reverse_id to ``(draft pk, public pk, urls)`` where
+``urls`` holds the url of the public page for each language of the site. Its
+key carries the version of the routing tables (see cms.cache.routing), which
+is bumped when pages or titles are saved, published, unpublished, moved or
+deleted, so a new table is built after any of those.
+"""
+from cms.cache.routing import get_cache_version
+from cms.utils.conf import get_cms_setting
+from cms.utils.i18n import force_language, get_language_list, get_fallback_languages
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+
+
+def get_cache_key(site_id):
+    return "%s:reverse_ids:%s:%s" % (get_cms_setting('CACHE_PREFIX'), site_id,
+                                     get_cache_version(site_id))
+
+
+def _get_urls(is_home, paths, site_id):
+    urls = {}
+    for language in get_language_list(site_id):
+        path = paths.get(language)
+        if path is None:
+            for fallback in get_fallback_languages(language, site_id):
+                path = paths.get(fallback)
+                if path is not None:
+                    break
+        if path is None:
+            continue
+        with force_language(language):
+            if is_home:
+                urls[language] = reverse('pages-root')
+            else:
+                urls[language] = reverse('pages-details-by-slug', kwargs={'slug': path})
+    return urls
+
+
+def build_reverse_id_table(site_id):
+    from cms.models import Page, Title
+
+    pages = Page.objects.filter(site=site_id, reverse_id__isnull=False).exclude(
+        reverse_id='').values_list('pk', 'reverse_id', 'publisher_is_draft', 'is_home')
+    drafts = {}
+    public = {}
+    homes = set()
+    for pk, reverse_id, is_draft, is_home in pages:
+        if is_draft:
+            drafts[reverse_id] = pk
+        else:
+            public[reverse_id] = pk
+            if is_home:
+                homes.add(pk)
+    paths = {}
+    if public:
+        titles = Title.objects.filter(page__in=list(public.values())).values_list(
+            'page_id', 'language', 'path', 'slug')
+        for page_id, language, path, slug in titles:
+            paths.setdefault(page_id, {})[language] = path or slug
+    table = {}
+    for reverse_id in set(drafts) | set(public):
+        public_pk = public.get(reverse_id)
+        urls = {}
+        if public_pk is not None:
+            urls = _get_urls(public_pk in homes, paths.get(public_pk, {}), site_id)
+        table[reverse_id] = (drafts.get(reverse_id), public_pk, urls)
+    return table
+
+
+def get_reverse_id_table(site_id):
+    """
+    Returns the table of the site, building and storing it if needed.
+    """
+    key = get_cache_key(site_id)
+    table = cache.get(key)
+    if table is None:
+        table = build_reverse_id_table(site_id)
+        cache.set(key, table, get_cms_setting('CACHE_DURATIONS')['menus'])
+    return table
+
+
+def get_reverse_id_pk(site_id, reverse_id, draft=False):
+    """
+    Returns the pk of the draft or public page with the given reverse_id, or
+    None if there is no such page.
+    """
+    entry = get_reverse_id_table(site_id).get(reverse_id)
+    if entry is None:
+        return None
+    return entry[0] if draft else entry[1]
+
+
+def get_reverse_id_url(site_id, reverse_id, language):
+    """
+    Returns the url of the public page with the given reverse_id in the given
+    language, or None if it is not known.
+    """
+    entry = get_reverse_id_table(site_id).get(reverse_id)
+    if entry is None:
+        return None
+    return entry[2].get(language)
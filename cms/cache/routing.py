@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+In-process routing table mapping ``Title.path`` to page ids.
+
+One table is kept per site and per mode (public, preview, draft). Tables are
+built lazily with a single query and are tagged with a version number stored
+in the cache backend, so every process notices when another process bumps the
+version (publish, unpublish, move, page or title save) and rebuilds on the
+next lookup. The rows of the pages resolved through a table are kept with it,
+so resolving a path the table already served costs no query.
+"""
+from cms.cache import bump_generation, get_generation
+from cms.cache.invalidation import defer
+from cms.utils.conf import get_cms_setting
+from django.db import router
+from django.utils import timezone
+
+
+MODE_PUBLIC = 'public'
+MODE_PREVIEW = 'preview'
+MODE_DRAFT = 'draft'
+
+# (site_id, mode) -> RoutingTable
+_tables = {}
+
+
+def get_cache_version_key(site_id):
+    return "%s:routing:%s:version" % (get_cms_setting('CACHE_PREFIX'), site_id)
+
+
+def get_cache_version(site_id):
+    return get_generation(get_cache_version_key(site_id))
+
+
+def clear_routing_cache(site_id):
+    """
+    Invalidates the routing tables of all processes for the given site.
+    """
+    if defer(('routing', site_id), clear_routing_cache, site_id):
+        return
+    bump_generation(get_cache_version_key(site_id))
+
+
+def reset_routing_tables():
+    """
+    Drops the tables of this process only. Mostly useful for tests.
+    """
+    _tables.clear()
+
+
+def get_mode(preview=False, draft=False):
+    if draft:
+        return MODE_DRAFT
+    if preview:
+        return MODE_PREVIEW
+    return MODE_PUBLIC
+
+
+class RoutingTable(object):
+    """
+    Holds, for one site and one mode, every path and the candidate pages
+    (ordered by tree_id, lft) together with the data needed to check their
+    visibility without hitting the database.
+    """
+    def __init__(self, site_id, mode, version):
+        self.site_id = site_id
+        self.mode = mode
+        self.version = version
+        self.paths = {}
+        self.pages = {}
+        self.roots = []
+        self.homes = []
+        # page id -> values of the fields of the page, see get_page
+        self.rows = {}
+
+    def build(self):
+        from cms.models.titlemodels import Title
+
+        titles = Title.objects.filter(
+            page__site=self.site_id,
+            page__publisher_is_draft=self.mode == MODE_DRAFT,
+        ).order_by('page__tree_id', 'page__lft').values_list(
+            'path', 'published', 'page_id', 'page__parent_id', 'page__is_home',
+            'page__publication_date', 'page__publication_end_date',
+        )
+        for path, published, page_id, parent_id, is_home, start, end in titles:
+            if page_id not in self.pages:
+                self.pages[page_id] = [False, start, end]
+                if not parent_id:
+                    self.roots.append(page_id)
+                if is_home:
+                    self.homes.append(page_id)
+            if published:
+                self.pages[page_id][0] = True
+            candidates = self.paths.setdefault(path, [])
+            if page_id not in candidates:
+                candidates.append(page_id)
+        return self
+
+    def is_visible(self, page_id, now):
+        if self.mode != MODE_PUBLIC:
+            return True
+        published, start, end = self.pages[page_id]
+        if not published:
+            return False
+        if start is not None and start > now:
+            return False
+        if end is not None and end <= now:
+            return False
+        return True
+
+    def resolve(self, path):
+        """
+        Returns a tuple ``(found, page_id)``. ``found`` is False if the table
+        can not answer unambiguously and the caller should fall back to the
+        database.
+        """
+        now = timezone.now()
+        if not any(self.is_visible(page_id, now) for page_id in self.roots):
+            return True, None
+        if not path:
+            for page_id in self.homes:
+                if self.is_visible(page_id, now):
+                    return True, page_id
+        candidates = [page_id for page_id in self.paths.get(path, [])
+                      if self.is_visible(page_id, now)]
+        if len(candidates) > 1:
+            return False, None
+        if candidates:
+            return True, candidates[0]
+        return True, None
+
+
+    def get_page(self, page_id):
+        """
+        Returns a new Page instance for the given id, or None if the page is
+        gone. Its row is loaded once per table.
+        """
+        from cms.models.pagemodel import Page
+
+        row = self.rows.get(page_id)
+        if row is None:
+            rows = list(Page.objects.filter(pk=page_id).values_list(
+                *[field.attname for field in Page._meta.fields]))
+            if not rows:
+                return None
+            row = self.rows[page_id] = rows[0]
+        # built like the instances of a queryset
+        page = Page(*row)
+        page._state.adding = False
+        page._state.db = router.db_for_read(Page)
+        return page
+
+
+def get_routing_table(site_id, mode):
+    version = get_cache_version(site_id)
+    table = _tables.get((site_id, mode))
+    if table is None or table.version != version:
+        table = RoutingTable(site_id, mode, version).build()
+        _tables[(site_id, mode)] = table
+    return table
+
+
+def resolve_page(path, site_id, preview=False, draft=False):
+    """
+    Returns a tuple ``(found, page)``, see RoutingTable.resolve.
+    """
+    table = get_routing_table(site_id, get_mode(preview, draft))
+    found, page_id = table.resolve(path)
+    if not found or page_id is None:
+        return found, None
+    page = table.get_page(page_id)
+    if page is None:
+        # deleted without the version being bumped, let the database answer
+        return False, None
+    return True, page
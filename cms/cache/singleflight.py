@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Stampede protection for expensive cached values.
+
+``get_or_build`` makes sure only one worker rebuilds a missing or expired
+value at a time: the worker that wins the lock rebuilds it, the others serve
+the previous (stale) value if there is one, or wait for the winner otherwise.
+
+Entries are stored as ``(expires, value)`` tuples. ``expires`` is the soft
+expiry time; the cache backend keeps the entry for twice the timeout so that
+a stale value is still around while it is being rebuilt.
+
+The lock is taken with ``cache.add``, which is atomic on every backend
+shipped with Django. Backends without ``add`` fall back to a lock local to
+the process.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+
+# seconds after which a lock is considered abandoned
+LOCK_TIMEOUT = 30
+# seconds between two checks while waiting for another worker
+WAIT_INTERVAL = 0.05
+
+_local_locks = {}
+_local_locks_lock = threading.Lock()
+
+
+def _get_local_lock(key):
+    with _local_locks_lock:
+        return _local_locks.setdefault(key, threading.Lock())
+
+
+def _get_lock_key(key):
+    return '%s:lock' % key
+
+
+def acquire_lock(key):
+    """
+    Tries to take the build lock of ``key`` without blocking. Returns a
+    callable releasing the lock, or None if another worker holds it.
+    """
+    lock_key = _get_lock_key(key)
+    try:
+        acquired = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    except NotImplementedError:
+        lock = _get_local_lock(lock_key)
+        if lock.acquire(False):
+            return lock.release
+        return None
+    if acquired:
+        return lambda: cache.delete(lock_key)
+    return None
+
+
+def is_locked(key):
+    lock_key = _get_lock_key(key)
+    lock = _local_locks.get(lock_key)
+    if lock is not None and lock.locked():
+        return True
+    return cache.get(lock_key) is not None
+
+
+def _unwrap(entry):
+    if isinstance(entry, tuple) and len(entry) == 2:
+        return entry
+    return None, None
+
+
+def set_entry(key, value, timeout, stale_key=None):
+    entry = (time.time() + timeout, value)
+    cache.set(key, entry, timeout * 2)
+    if stale_key:
+        cache.set(stale_key, entry, timeout * 2)
+
+
+def get_or_build(key, build, timeout, stale_key=None):
+    """
+    Returns the value cached under ``key``, calling ``build`` to compute it
+    when it is missing or expired. ``None`` is never cached.
+
+    ``stale_key`` is an optional second key holding the latest value built
+    for a family of keys (e.g. all generations of a menu), which is served
+    while a new key is being built.
+    """
+    expires, value = _unwrap(cache.get(key))
+    if expires is not None and expires > time.time():
+        return value
+    if expires is None and stale_key:
+        expires, value = _unwrap(cache.get(stale_key))
+    release = acquire_lock(key)
+    if release is None:
+        if expires is not None:
+            # somebody else is rebuilding it
+            return value
+        deadline = time.time() + LOCK_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            expires, value = _unwrap(cache.get(key))
+            if expires is not None:
+                return value
+            if not is_locked(key):
+                break
+        # the other worker gave up or failed, build it ourselves
+        release = acquire_lock(key)
+    try:
+        value = build()
+        if value is not None:
+            set_entry(key, value, timeout, stale_key)
+    finally:
+        if release is not None:
+            release()
+    return value
@@ -8,6 +8,7 @@ from cms.management.commands.subcommands.uninstall import UninstallCommand
 from cms.management.commands.subcommands.mptt import FixMPTTCommand
 from cms.management.commands.subcommands.copy_lang import CopyLangCommand
 from cms.management.commands.subcommands.delete_orphaned_plugins import DeleteOrphanedPluginsCommand
+from cms.management.commands.subcommands.publish import PublishCommand
 from django.core.management.base import BaseCommand
 from optparse import make_option
 
@@ -31,6 +32,7 @@ class Command(SubcommandsCommand):
         'copy-lang': CopyLangCommand,
         'delete_orphaned_plugins': DeleteOrphanedPluginsCommand,
         'check': CheckInstallation,
+        'publish': PublishCommand,
     }
 
     @property
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from cms.cache.invalidation import deferred_invalidation
 from django.core.management.base import BaseCommand, CommandError
 import sys
 
@@ -21,7 +22,8 @@ class SubcommandsCommand(BaseCommand):
                 handle_command = self.subcommands.get(args[0])()
                 handle_command.stdout = stdout
                 handle_command.stderr = stderr
-                handle_command.handle(*args[1:], **options)
+                with deferred_invalidation():
+                    handle_command.handle(*args[1:], **options)
             else:
                 stderr.write("%r is not a valid subcommand for %r\n" % (args[0], self.command_name))
                 stderr.write("Available subcommands are:\n")
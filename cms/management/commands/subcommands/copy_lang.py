@@ -62,10 +62,7 @@ class CopyLangCommand(BaseCommand):
                     self.stdout.write('Skipping page %s, language %s not defined\n' % (page, from_lang))
 
         for static_placeholder in StaticPlaceholder.objects.all():
-            plugin_list = []
-            for plugin in static_placeholder.draft.get_plugins():
-                if plugin.language == from_lang:
-                    plugin_list.append(plugin)
+            plugin_list = static_placeholder.draft.get_plugins_list(from_lang)
 
             if plugin_list:
                 if verbose:
@@ -4,6 +4,7 @@ from cms.models import Page
 from cms.models.pluginmodel import CMSPlugin
 from cms.models.titlemodels import Title
 from cms.plugin_pool import plugin_pool
+from cms.utils.plugins import warm_placeholders_cache
 from django.core.management.base import NoArgsCommand
 from django.db.utils import DatabaseError
 
@@ -83,9 +84,21 @@ class ListPluginsCommand(NoArgsCommand):
             self.stdout.write(u"  instance(s): %s \n" % instances)
 
                    
+class ListPlaceholdersCommand(NoArgsCommand):
+
+    help = 'Lists the placeholders of all templates in CMS_TEMPLATES'
+    def handle_noargs(self, **options):
+        slots = warm_placeholders_cache()
+        for template in sorted(slots):
+            self.stdout.write(u"%s\n" % template)
+            for slot in slots[template]:
+                self.stdout.write(u"    %s\n" % slot)
+
+
 class ListCommand(SubcommandsCommand):
     help = 'List commands'
     subcommands = {
         'apphooks': ListApphooksCommand,
-        'plugins': ListPluginsCommand
-    }
\ No newline at end of file
+        'plugins': ListPluginsCommand,
+        'placeholders': ListPlaceholdersCommand,
+    }
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cms.api import publish_tree
+from cms.models import Page
+from cms.utils.compat.dj import force_unicode
+from cms.utils.permissions import set_current_user
+
+
+class PublishCommand(BaseCommand):
+    args = '[page=<page id>] [language=<language code>] [site=<site id>]'
+    help = u'publish a page and its descendants (or all the pages of a site) in one transaction per tree'
+
+    def handle(self, *args, **kwargs):
+        from django.contrib.auth.models import User
+
+        page_ids = [arg.split("=")[1] for arg in args if arg.startswith("page=")]
+        languages = [arg.split("=")[1] for arg in args if arg.startswith("language=")] or None
+        site = [arg.split("=")[1] for arg in args if arg.startswith("site=")]
+        if site:
+            site = site.pop()
+        else:
+            site = settings.SITE_ID
+
+        try:
+            user = User.objects.filter(is_active=True, is_staff=True, is_superuser=True)[0]
+        except IndexError:
+            raise CommandError("No super user found, create one using `manage.py createsuperuser`.")
+        # thread locals middleware needs to know who is publishing
+        set_current_user(user)
+
+        if page_ids:
+            roots = Page.objects.drafts().filter(pk__in=page_ids)
+        else:
+            roots = Page.objects.drafts().on_site(site).filter(parent__isnull=True)
+        # pages below another selected page are published with it
+        selected = []
+        for root in roots.order_by('tree_id', 'lft'):
+            last = selected[-1] if selected else None
+            if last and last.tree_id == root.tree_id and last.lft < root.lft < last.rght:
+                continue
+            selected.append(root)
+        pages_published = 0
+        total_time = 0
+        for root in selected:
+            for page, published, seconds in publish_tree(root, user, languages):
+                total_time += seconds
+                if published:
+                    pages_published += 1
+                    marker = '*'
+                else:
+                    marker = ' '
+                self.stdout.write(u"%s %s [%d] %s %.3fs\n" % (
+                    marker, force_unicode(page), page.pk, ','.join(published), seconds))
+        self.stdout.write(u"published %d pages in %.3fs\n" % (pages_published, total_time))
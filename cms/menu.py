@@ -1,23 +1,28 @@
 # -*- coding: utf-8 -*-
-from collections import defaultdict
+import re
 from cms.apphook_pool import apphook_pool
-from cms.models.permissionmodels import (ACCESS_DESCENDANTS,
-    ACCESS_PAGE_AND_DESCENDANTS, ACCESS_CHILDREN, ACCESS_PAGE_AND_CHILDREN, ACCESS_PAGE)
-from cms.models.permissionmodels import PagePermission, GlobalPagePermission
+from cms.cache.menu_snapshot import get_menu_snapshot, get_snapshot_pages
+from cms.models.permissionmodels import GlobalPagePermission
 from cms.models.titlemodels import Title
 from cms.utils import get_language_from_request
 from cms.utils.conf import get_cms_setting
 from cms.utils.i18n import get_fallback_languages, hide_untranslated
 from cms.utils.page_resolver import get_page_queryset
 from cms.utils.moderator import get_title_queryset, use_draft
-from cms.utils.plugins import current_site
+from cms.utils.permissions import get_user_group_ids, get_view_restrictions
+from cms.utils.plugins import current_site_id
 from menus.base import Menu, NavigationNode, Modifier
 from menus.menu_pool import menu_pool
 
+from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.urlresolvers import reverse
 from django.db.models.query_utils import Q
 from django.utils.translation import get_language
 
+# the slugs accepted by the pages-details-by-slug url, see cms.urls
+SLUG_RE = re.compile(r'^[0-9A-Za-z-_.//]+$')
+
 
 def get_visible_pages(request, pages, site=None):
     """
@@ -32,33 +37,15 @@ def get_visible_pages(request, pages, site=None):
     is_setting_public_staff = public_for == 'staff'
     is_auth_user = request.user.is_authenticated()
     visible_page_ids = []
-    restricted_pages = defaultdict(list)
-    page_permissions = PagePermission.objects.filter(can_view=True).select_related('page', 'group__users')
-
-    for perm in page_permissions:
-
-        # collect the pages that are affected by permissions
-        if site and perm.page.site_id != site.pk:
-            continue
-        if perm is not None and perm not in restricted_pages[perm.page.pk]:
-            # affective restricted pages gathering
-            # using mptt functions 
-            # add the page with the perm itself
-            if perm.grant_on in [ACCESS_PAGE, ACCESS_PAGE_AND_CHILDREN, ACCESS_PAGE_AND_DESCENDANTS]:
-                restricted_pages[perm.page.pk].append(perm)
-                restricted_pages[perm.page.publisher_public_id].append(perm)
-                # add children
-            if perm.grant_on in [ACCESS_CHILDREN, ACCESS_PAGE_AND_CHILDREN]:
-                child_ids = perm.page.get_children().values_list('id', 'publisher_public_id')
-                for id, public_id in child_ids:
-                    restricted_pages[id].append(perm)
-                    restricted_pages[public_id].append(perm)
-            # add descendants
-            elif perm.grant_on in [ACCESS_DESCENDANTS, ACCESS_PAGE_AND_DESCENDANTS]:
-                child_ids = perm.page.get_descendants().values_list('id', 'publisher_public_id')
-                for id, public_id in child_ids:
-                    restricted_pages[id].append(perm)
-                    restricted_pages[public_id].append(perm)
+    if site is not None:
+        site_id = site.pk
+    elif is_auth_user:
+        # only staff switch sites through the request or the admin session
+        site_id = current_site_id(request)
+    else:
+        site_id = settings.SITE_ID
+    # page id -> (user_id, group_id) of the view grants, cached per site
+    restricted_pages = get_view_restrictions(site_id)
 
     # anonymous
     # no restriction applied at all
@@ -67,14 +54,11 @@ def get_visible_pages(request, pages, site=None):
         not restricted_pages):
         return [page.pk for page in pages]
 
-    if site is None:
-        site = current_site(request)
-
     # authenticated user and global permission
     if is_auth_user:
         global_page_perm_q = Q(
             Q(user=request.user) | Q(group__user=request.user)
-        ) & Q(can_view=True) & Q(Q(sites__in=[site.pk]) | Q(sites__isnull=True))
+        ) & Q(can_view=True) & Q(Q(sites__in=[site_id]) | Q(sites__isnull=True))
         global_view_perms = GlobalPagePermission.objects.filter(global_page_perm_q).exists()
 
         #no page perms edge case - all visible
@@ -103,17 +87,12 @@ def get_visible_pages(request, pages, site=None):
         PagePermission user group membership tests
         """
         user_pk = request.user.pk
-        page_pk = page.pk
-        has_perm = False
-        for perm in restricted_pages[page_pk]:
-            if perm.user_id == user_pk:
-                has_perm = True
-            if not perm.group_id:
-                continue
-            group_user_ids = perm.group.user_set.values_list('pk', flat=True)
-            if user_pk in group_user_ids:
-                has_perm = True
-        return has_perm
+        for user_id, group_id in restricted_pages[page.pk]:
+            if user_id == user_pk:
+                return True
+            if group_id and group_id in get_user_group_ids(request):
+                return True
+        return False
 
     for page in pages:
         to_add = False
@@ -218,11 +197,72 @@ def page_to_node(page, home, cut):
     return ret_node
 
 
+def get_snapshot_url(page, root_url):
+    """
+    Builds the url of a snapshot page from the reversed url of the root page,
+    as Page.get_absolute_url would.
+    """
+    if page.is_home:
+        return root_url
+    path = page.path or page.slug
+    if not SLUG_RE.match(path):
+        return reverse('pages-details-by-slug', kwargs={"slug": path})
+    if settings.APPEND_SLASH:
+        return '%s%s/' % (root_url, path)
+    return root_url + path
+
+
+def snapshot_to_node(page, home, cut, root_url):
+    """
+    Transform a page of the menu snapshot into a navigation node, see
+    page_to_node.
+    """
+    attr = {'soft_root': page.soft_root,
+        'auth_required': page.login_required,
+        'reverse_id': page.reverse_id, }
+
+    parent_id = page.parent_id
+    if home and page.parent_id == home.pk and cut:
+        parent_id = None
+
+    if page.limit_visibility_in_menu == None:
+        attr['visible_for_authenticated'] = True
+        attr['visible_for_anonymous'] = True
+    else:
+        attr['visible_for_authenticated'] = page.limit_visibility_in_menu == 1
+        attr['visible_for_anonymous'] = page.limit_visibility_in_menu == 2
+    attr['is_home'] = page.is_home
+    extenders = []
+    if page.navigation_extenders:
+        extenders.append(page.navigation_extenders)
+    if page.application_urls:
+        app = apphook_pool.get_apphook(page.application_urls)
+        for menu in app.menus:
+            extenders.append(menu.__name__)
+    if extenders:
+        attr['navigation_extenders'] = extenders
+    attr['redirect_url'] = page.redirect
+
+    return NavigationNode(
+        page.menu_title or page.title,
+        get_snapshot_url(page, root_url),
+        page.pk,
+        parent_id,
+        attr=attr,
+        visible=page.in_navigation,
+    )
+
+
 class CMSMenu(Menu):
+    shared_by_permission_profile = True
+
     def get_nodes(self, request):
-        page_queryset = get_page_queryset(request)
         site = Site.objects.get_current()
         lang = get_language_from_request(request)
+        if (not use_draft(request) and lang == get_language() and
+                (hide_untranslated(lang, site.pk) or not get_fallback_languages(lang, site.pk))):
+            return self.get_snapshot_nodes(request, site, lang)
+        page_queryset = get_page_queryset(request)
 
         filters = {
             'site': site,
@@ -276,6 +316,34 @@ class CMSMenu(Menu):
                 nodes.append(page_to_node(page, home, home_cut))
         return nodes
 
+    def get_snapshot_nodes(self, request, site, lang):
+        """
+        Builds the nodes of the public pages from the menu snapshot. Every page
+        in the snapshot has a published title in ``lang``, so it is only used
+        when no fallback titles apply.
+        """
+        pages = get_snapshot_pages(get_menu_snapshot(site.pk, lang))
+        visible_pages = set(get_visible_pages(request, pages, site))
+        nodes = []
+        first = True
+        home_cut = False
+        home = None
+        actual_pages = []
+        for page in pages:
+            if page.pk not in visible_pages:
+                continue
+            if not home:
+                home = page
+            if first and page.pk != home.pk:
+                home_cut = True
+            if (page.pk == home.pk and home.in_navigation) or page.pk != home.pk:
+                first = False
+            actual_pages.append(page)
+        root_url = reverse('pages-root')
+        for page in actual_pages:
+            nodes.append(snapshot_to_node(page, home, home_cut, root_url))
+        return nodes
+
 
 menu_pool.register_menu(CMSMenu)
 
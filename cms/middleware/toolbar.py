@@ -48,13 +48,13 @@ class ToolbarMiddleware(object):
         """
         if 'edit' in request.GET and not request.session.get('cms_edit', False):
             if not request.session.get('cms_edit', False):
-                menu_pool.clear()
+                menu_pool.clear_nodes()
             request.session['cms_edit'] = True
             if request.session.get('cms_build', False):
                 request.session['cms_build'] = False
         if 'edit_off' in request.GET and request.session.get('cms_edit', True):
             if request.session.get('cms_edit', True):
-                menu_pool.clear()
+                menu_pool.clear_nodes()
             request.session['cms_edit'] = False
             if request.session.get('cms_build', False):
                 request.session['cms_build'] = False
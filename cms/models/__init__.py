@@ -17,6 +17,7 @@ from .static_placeholder import *
 import django.core.urlresolvers
 # must be last
 from cms import signals as s_import
+from cms import startup as startup_import
 
 
 def validate_settings():
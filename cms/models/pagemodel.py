@@ -4,6 +4,7 @@ from django.utils.timezone import now
 
 from os.path import join
 from cms import constants
+from cms.cache.invalidation import invalidation_deferred
 from cms.constants import PUBLISHER_STATE_DEFAULT, PUBLISHER_STATE_PENDING, PUBLISHER_STATE_DIRTY, TEMPLATE_INHERITANCE_MAGIC
 from cms.exceptions import PublicIsUnmodifiable
 from cms.models.managers import PageManager, PagePermissionsPermissionManager
@@ -16,11 +17,11 @@ from cms.utils.compat import DJANGO_1_5
 from cms.utils.compat.dj import force_unicode, python_2_unicode_compatible
 from cms.utils.compat.metaclasses import with_metaclass
 from cms.utils.conf import get_cms_setting
-from cms.utils.copy_plugins import copy_plugins_to
+from cms.utils.copy_plugins import copy_plugins_to, sync_plugins_to
 from cms.utils.helpers import reversion_register
 from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import connection, models
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils.translation import get_language, ugettext_lazy as _
@@ -205,11 +206,16 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
         """
         Copy all the plugins to a new page.
         :param target: The page where the new content should be stored
+
+        When publishing with ``CMS_INCREMENTAL_PUBLISH`` only the plugin trees
+        which differ are rewritten, see cms.utils.copy_plugins.sync_plugins_to.
         """
-        # TODO: Make this into a "graceful" copy instead of deleting and overwriting
-        # copy the placeholders (and plugins on those placeholders!)
-        CMSPlugin.objects.filter(placeholder__page=target, language=language).delete()
+        incremental = self.publisher_is_draft and get_cms_setting('INCREMENTAL_PUBLISH')
+        if not incremental:
+            CMSPlugin.objects.filter(placeholder__page=target, language=language).delete()
+        slots = []
         for ph in self.placeholders.all():
+            slots.append(ph.slot)
             plugins = ph.get_plugins_list(language)
             try:
                 ph = target.placeholders.get(slot=ph.slot)
@@ -218,8 +224,16 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
                 ph.save()
                 target.placeholders.add(ph)
                 # update the page copy
-            if plugins:
+            if incremental:
+                sync_plugins_to(plugins, ph, language)
+            elif plugins:
                 copy_plugins_to(plugins, ph)
+        if incremental:
+            # plugins of placeholders the draft doesn't have anymore
+            stale = CMSPlugin.objects.filter(placeholder__page=target, language=language)
+            if slots:
+                stale = stale.exclude(placeholder__slot__in=slots)
+            stale.delete()
 
     def _copy_attributes(self, target):
         """
@@ -365,7 +379,7 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
                     copy_plugins_to(plugins, ph)
 
         # invalidate the menu for this site
-        menu_pool.clear(site_id=site.pk)
+        menu_pool.clear_nodes(site_id=site.pk)
         return page_copy  # return the page_copy or None
 
     def save(self, no_signals=False, commit=True, **kwargs):
@@ -374,9 +388,11 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
             commit: True if model should be really saved
         """
 
-        # delete template cache
+        # delete template and placeholder cache
         if hasattr(self, '_template_cache'):
             delattr(self, '_template_cache')
+        if hasattr(self, '_placeholder_cache'):
+            delattr(self, '_placeholder_cache')
 
         created = not bool(self.pk)
         if self.reverse_id == "":
@@ -436,10 +452,13 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
         title.save()
         return title
 
-    def publish(self, language):
+    @invalidation_deferred
+    def publish(self, language, batch=False):
         """Overrides Publisher method, because there may be some descendants, which
         are waiting for parent to publish, so publish them if possible.
 
+        :param batch: set by cms.api.publish_tree, which publishes the
+            descendants itself and clears the menu cache once at the end.
         :returns: True if page was successfully published.
         """
         # Publish can only be called on draft pages
@@ -481,7 +500,8 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
             #trigger home update
             public_page.save()
             # invalidate the menu for this site
-            menu_pool.clear(site_id=self.site_id)
+            if not batch:
+                menu_pool.clear_nodes(site_id=self.site_id)
 
             # taken from Publisher - copy_page needs to call self._publisher_save_public(copy) for mptt insertion
             # insert_at() was maybe calling _create_tree_space() method, in this
@@ -523,8 +543,11 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
 
         # Check if there are some children which are waiting for parents to
         # become published.
-        publish_set = self.get_descendants().filter(title_set__published=True,
-                                                    title_set__language=language).select_related('publisher_public')
+        if batch:
+            publish_set = []
+        else:
+            publish_set = self.get_descendants().filter(
+                title_set__published=True, title_set__language=language).select_related('publisher_public')
         for page in publish_set:
             if page.publisher_public:
                 if page.publisher_public.parent.is_published(language):
@@ -550,6 +573,7 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
 
         return published
 
+    @invalidation_deferred
     def unpublish(self, language):
         """
         Removes this page from the public site
@@ -1058,23 +1082,59 @@ class Page(with_metaclass(PageMetaClass, MPTTModel)):
 
         return obj
 
-    def rescan_placeholders(self):
+    def get_placeholders_list(self):
+        """
+        Returns the placeholders attached to this page. They are kept on the
+        instance and in the cache, and taken from the prefetched objects if the
+        page was loaded with ``prefetch_related('placeholders')``.
+        """
+        from cms.cache.page_placeholders import get_page_placeholders, set_page_placeholders
+
+        if hasattr(self, '_placeholder_cache'):
+            return self._placeholder_cache
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('placeholders')
+        if prefetched is not None:
+            placeholders = list(prefetched)
+        else:
+            placeholders = get_page_placeholders(self.pk)
+            if placeholders is None:
+                placeholders = list(self.placeholders.all())
+                set_page_placeholders(self.pk, placeholders)
+        self._placeholder_cache = placeholders
+        return placeholders
+
+    def rescan_placeholders(self, create=True):
         """
         Rescan and if necessary create placeholders in the current template.
+
+        Missing placeholders are only created if ``create`` is True.
         """
         # inline import to prevent circular imports
+        from cms.cache.page_placeholders import set_page_placeholders
         from cms.utils.plugins import get_placeholders
 
         placeholders = get_placeholders(self.get_template())
         found = {}
-        for placeholder in self.placeholders.all():
+        for placeholder in self.get_placeholders_list():
             if placeholder.slot in placeholders:
                 found[placeholder.slot] = placeholder
-        for placeholder_name in placeholders:
-            if not placeholder_name in found:
-                placeholder = Placeholder.objects.create(slot=placeholder_name)
-                self.placeholders.add(placeholder)
-                found[placeholder_name] = placeholder
+        missing = [name for name in placeholders if name not in found]
+        if missing and create:
+            created = [Placeholder(slot=name) for name in missing]
+            if getattr(connection.features, 'can_return_ids_from_bulk_insert', False):
+                Placeholder.objects.bulk_create(created)
+            else:
+                # the backend does not give us the ids of bulk inserted rows
+                for placeholder in created:
+                    placeholder.save()
+            through = Page.placeholders.through
+            through.objects.bulk_create([
+                through(page_id=self.pk, placeholder_id=placeholder.pk) for placeholder in created
+            ])
+            for placeholder in created:
+                found[placeholder.slot] = placeholder
+            self._placeholder_cache = self.get_placeholders_list() + created
+            set_page_placeholders(self.pk, self._placeholder_cache)
         return found
 
 
@@ -4,6 +4,7 @@ import os
 import warnings
 import json
 
+from cms.cache.page import set_page_uncacheable
 from cms.exceptions import DontUsePageAttributeWarning
 from cms.models.placeholdermodel import Placeholder
 from cms.plugin_rendering import PluginContext, render_plugin
@@ -180,6 +181,8 @@ class CMSPlugin(with_metaclass(PluginModelBase, MPTTModel)):
         instance, plugin = self.get_plugin_instance()
 
         if instance and not (admin and not plugin.admin_preview):
+            # the index and total given by render_plugins
+            instance._render_meta = self._render_meta
             if not isinstance(placeholder, Placeholder):
                 placeholder = instance.placeholder
             placeholder_slot = placeholder.slot
@@ -190,6 +193,9 @@ class CMSPlugin(with_metaclass(PluginModelBase, MPTTModel)):
             page = None
             if request:
                 page = request.current_page
+                if plugin.cache is not True:
+                    # per visitor or uncacheable output
+                    set_page_uncacheable(request)
             context['allowed_child_classes'] = plugin.get_child_classes(placeholder_slot, page)
             if plugin.render_plugin:
                 template = hasattr(instance, 'render_template') and instance.render_template or plugin.render_template
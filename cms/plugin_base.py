@@ -104,6 +104,20 @@ class CMSPluginBase(with_metaclass(CMSPluginBaseMetaclass, admin.ModelAdmin)):
     # Should the plugin be rendered at all, or doesn't it have any output?
     render_plugin = True
 
+    # Can the output be stored in the placeholder cache (CMS_PLACEHOLDER_CACHE)?
+    # True, False, or a tuple of request values the output varies on: keys of
+    # request.META (e.g. 'HTTP_ACCEPT_LANGUAGE') or 'user'.
+    cache = True
+
+    # Can the plugin be rendered in another thread than the request's
+    # (CMS_PLACEHOLDER_RENDERING_THREADS)?
+    thread_safe = True
+
+    # Relations of the model used by render, fetched together with the plugin
+    # instances of a placeholder.
+    select_related = ()
+    prefetch_related = ()
+
     model = CMSPlugin
     text_enabled = False
     page_only = False
@@ -42,6 +42,8 @@ class PluginPool(object):
             )
         plugin.value = plugin_name
         self.plugins[plugin_name] = plugin
+        from cms.signals import connect_plugin_placeholder_signals
+        connect_plugin_placeholder_signals(plugin.model)
 
         if 'reversion' in settings.INSTALLED_APPS:
             try:
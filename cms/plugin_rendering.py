@@ -1,15 +1,27 @@
 # -*- coding: utf-8 -*-
+from copy import copy
+from multiprocessing.pool import ThreadPool
+import re
+import threading
+from uuid import uuid4
+from cms.cache.page import set_page_uncacheable
+from cms.cache.placeholder import get_placeholder_cache, set_placeholder_cache
 from cms.models.placeholdermodel import Placeholder
 from cms.plugin_processors import (plugin_meta_context_processor, mark_safe_plugin_processor)
 from cms.utils import get_language_from_request
 from cms.utils.compat.type_checks import string_types
 from cms.utils.conf import get_cms_setting
 from cms.utils.django_load import iterload_objects
-from cms.utils.placeholder import get_placeholder_conf
+from cms.utils.placeholder import get_placeholder_conf, restore_sekizai
 from cms.utils.i18n import get_fallback_languages
-from django.template import Template, Context
-from django.template.loader import render_to_string
+from django.conf import settings
+from django.db import connections
+from django.template import Template, Context, loader
+from cms.utils.compat.dj import setting_changed
+from django.utils import timezone, translation
 from django.utils.safestring import mark_safe
+from sekizai.data import SekizaiDictionary
+from sekizai.helpers import Watcher, get_varname
 
 # these are always called before all other plugin context processors
 DEFAULT_PLUGIN_CONTEXT_PROCESSORS = (
@@ -21,6 +33,60 @@ DEFAULT_PLUGIN_PROCESSORS = (
     mark_safe_plugin_processor,
 )
 
+# setting name -> imported processors, see get_processors
+_processors_cache = {}
+
+
+def get_processors(setting):
+    """
+    Returns the processors listed in the given setting (``PLUGIN_PROCESSORS``
+    or ``PLUGIN_CONTEXT_PROCESSORS``), which are only imported once.
+    """
+    processors = _processors_cache.get(setting)
+    if processors is None:
+        processors = _processors_cache[setting] = tuple(iterload_objects(get_cms_setting(setting)))
+    return processors
+
+
+def reset_processors_cache(**kwargs):
+    _processors_cache.clear()
+
+
+def _reset_processors_cache_on_change(setting, **kwargs):
+    if setting in ('CMS_PLUGIN_PROCESSORS', 'CMS_PLUGIN_CONTEXT_PROCESSORS'):
+        reset_processors_cache()
+
+setting_changed.connect(_reset_processors_cache_on_change, dispatch_uid="cms.plugin_processors_cache")
+
+# (plugin type, template name) -> compiled template, see get_cached_template
+_templates_cache = {}
+
+
+def get_cached_template(template, plugin_type=None):
+    """
+    Returns the compiled template, which is loaded once per plugin type and
+    template name whatever the template loaders are, except in DEBUG mode
+    where it is loaded every time so that changes to it are picked up.
+    """
+    if settings.DEBUG:
+        return loader.get_template(template)
+    key = (plugin_type, template)
+    compiled = _templates_cache.get(key)
+    if compiled is None:
+        compiled = _templates_cache[key] = loader.get_template(template)
+    return compiled
+
+
+def reset_templates_cache(**kwargs):
+    _templates_cache.clear()
+
+
+def _reset_templates_cache_on_change(setting, **kwargs):
+    if setting.startswith('TEMPLATE') or setting == 'INSTALLED_APPS':
+        reset_templates_cache()
+
+setting_changed.connect(_reset_templates_cache_on_change, dispatch_uid="cms.plugin_templates_cache")
+
 
 class PluginContext(Context):
     """
@@ -36,7 +102,7 @@ class PluginContext(Context):
             processors = []
         for processor in DEFAULT_PLUGIN_CONTEXT_PROCESSORS:
             self.update(processor(instance, placeholder, self))
-        for processor in iterload_objects(get_cms_setting('PLUGIN_CONTEXT_PROCESSORS')):
+        for processor in get_processors('PLUGIN_CONTEXT_PROCESSORS'):
             self.update(processor(instance, placeholder, self))
         for processor in processors:
             self.update(processor(instance, placeholder, self))
@@ -50,12 +116,16 @@ def render_plugin(context, instance, placeholder, template, processors=None, cur
     if not processors:
         processors = []
     if isinstance(template, string_types):
-        content = render_to_string(template, context_instance=context)
+        context.push()
+        try:
+            content = get_cached_template(template, instance.plugin_type).render(context)
+        finally:
+            context.pop()
     elif isinstance(template, Template):
         content = template.render(context)
     else:
         content = ''
-    for processor in iterload_objects(get_cms_setting('PLUGIN_PROCESSORS')):
+    for processor in get_processors('PLUGIN_PROCESSORS'):
         content = processor(instance, placeholder, content, context)
     for processor in processors:
         content = processor(instance, placeholder, content, context)
@@ -76,6 +146,9 @@ def render_plugins(plugins, context, placeholder, processors=None):
     out = []
     total = len(plugins)
     for index, plugin in enumerate(plugins):
+        # the render meta of the plugin model is shared by every rendering of
+        # the process, each plugin gets its own copy
+        plugin._render_meta = copy(plugin._render_meta)
         plugin._render_meta.total = total
         plugin._render_meta.index = index
         context.push()
@@ -84,10 +157,214 @@ def render_plugins(plugins, context, placeholder, processors=None):
     return out
 
 
-def render_placeholder(placeholder, context_to_copy, name_fallback="Placeholder", lang=None, default=None):
+_rendering_pool = None
+_rendering_pool_lock = threading.Lock()
+
+
+def get_rendering_pool():
+    """
+    Returns the thread pool used to render placeholders concurrently, or None
+    if CMS_PLACEHOLDER_RENDERING_THREADS is not set.
+    """
+    global _rendering_pool
+    size = get_cms_setting('PLACEHOLDER_RENDERING_THREADS')
+    if not size:
+        return None
+    with _rendering_pool_lock:
+        if _rendering_pool is None:
+            _rendering_pool = ThreadPool(size)
+        return _rendering_pool
+
+
+def reset_rendering_pool(**kwargs):
+    global _rendering_pool
+    with _rendering_pool_lock:
+        if _rendering_pool is not None:
+            # running renderings are finished before the threads exit
+            _rendering_pool.close()
+        _rendering_pool = None
+
+
+def _reset_rendering_pool_on_change(setting, **kwargs):
+    if setting == 'CMS_PLACEHOLDER_RENDERING_THREADS':
+        reset_rendering_pool()
+
+setting_changed.connect(_reset_rendering_pool_on_change, dispatch_uid="cms.placeholder_rendering_pool")
+
+
+def is_thread_safe(plugins):
+    """
+    Returns True if the plugins (and their children) can be rendered in
+    another thread, see CMSPluginBase.thread_safe.
+    """
+    from cms.plugin_pool import plugin_pool
+
+    stack = list(plugins)
+    while stack:
+        plugin = stack.pop()
+        try:
+            plugin_class = plugin_pool.get_plugin(plugin.plugin_type)
+        except KeyError:
+            return False
+        if not plugin_class.thread_safe:
+            return False
+        stack.extend(getattr(plugin, 'child_plugin_instances', None) or [])
+    return True
+
+
+def _render_in_thread(placeholder, plugins, context, language, tz):
+    if language:
+        translation.activate(language)
+    timezone.activate(tz)
+    try:
+        content = "".join(render_plugins(plugins, context, placeholder))
+        context['content'] = mark_safe(content) if content else ''
+        context['placeholder'] = ''
+        context['edit'] = False
+        result = get_cached_template("cms/toolbar/content.html").render(Context(context))
+        sekizai = dict((key, list(values)) for key, values in context[get_varname()].items())
+        return result, content, sekizai
+    finally:
+        translation.deactivate()
+        timezone.deactivate()
+        # the connections of the pool threads are not kept between renderings
+        for connection in connections.all():
+            connection.close()
+
+
+class _JoiningSekizaiDictionary(SekizaiDictionary):
+    """
+    The sekizai data of a template while some of its placeholders are
+    rendered on the pool: reading or adding data waits for them first, so
+    that their data comes in the order of the template.
+    """
+
+    def __getitem__(self, item):
+        self._cms_rendering.join()
+        return super(_JoiningSekizaiDictionary, self).__getitem__(item)
+
+
+_MARKER = u'<!--cms-placeholder:%s:%d-->'
+_MARKER_RE = re.compile(r'<!--cms-placeholder:([0-9a-f]{32}):(\d+)-->')
+
+
+class ConcurrentRendering(object):
+    """
+    The placeholders of a response rendered on the rendering pool, see
+    render_concurrently.
+
+    A placeholder tag submits its plugins together with a snapshot of the
+    context at the tag, so ``with`` and ``for`` scopes are the ones of the
+    tag, and outputs a marker which finish replaces with the result. Each
+    rendering gets its own copy of the request: the memos it adds to it (for
+    instance that the page can't be cached) are added to the request when
+    its result is used, unless the request got them meanwhile.
+    """
+
+    def __init__(self, request, pool):
+        self.request = request
+        self.pool = pool
+        self.token = uuid4().hex
+        self.results = []
+        self.pending = []
+        self.sekizai = []
+
+    def submit(self, placeholder, plugins, context, lang, use_cache):
+        """
+        Starts rendering the plugins of the placeholder and returns its
+        marker, or None if the sekizai data of the context can't be joined.
+        """
+        varname = get_varname()
+        sekizai = context.get(varname)
+        if sekizai is not None and sekizai.__class__ is not _JoiningSekizaiDictionary:
+            if sekizai.__class__ is not SekizaiDictionary:
+                return None
+            sekizai.__class__ = _JoiningSekizaiDictionary
+            sekizai._cms_rendering = self
+            self.sekizai.append(sekizai)
+        data = {}
+        for dict_ in context.dicts:
+            data.update(dict_)
+        request = data['request'] = copy(self.request)
+        data[varname] = SekizaiDictionary()
+        snapshot = Context(data, autoescape=context.autoescape, current_app=context.current_app,
+                           use_l10n=context.use_l10n, use_tz=context.use_tz)
+        result = self.pool.apply_async(_render_in_thread, (
+            placeholder, plugins, snapshot, translation.get_language(), timezone.get_current_timezone()))
+        index = len(self.results)
+        self.results.append(None)
+        self.pending.append((index, result, request, sekizai, placeholder, plugins, lang, use_cache))
+        return _MARKER % (self.token, index)
+
+    def join(self):
+        """
+        Waits for the placeholders submitted so far and adds their sekizai
+        data, in the order they were submitted.
+        """
+        while self.pending:
+            index, result, request, sekizai, placeholder, plugins, lang, use_cache = self.pending.pop(0)
+            self.results[index], content, changes = result.get()
+            for key, value in request.__dict__.items():
+                self.request.__dict__.setdefault(key, value)
+            if sekizai is not None:
+                for key, values in changes.items():
+                    namespace = SekizaiDictionary.__getitem__(sekizai, key)
+                    for value in values:
+                        namespace.append(value)
+            if use_cache:
+                set_placeholder_cache(placeholder, lang, self.request, plugins, content, changes)
+
+    def finish(self, content):
+        """
+        Returns ``content`` with the markers replaced by the placeholders, or
+        None if the template changed or copied markers (``{% cache %}`` does).
+        """
+        self.join()
+        expected = [(self.token, str(index)) for index in range(len(self.results))]
+        if sorted(_MARKER_RE.findall(content)) != sorted(expected):
+            return None
+        return _MARKER_RE.sub(lambda match: self.results[int(match.group(2))], content)
+
+    def stop(self):
+        del self.pending[:]
+        for sekizai in self.sekizai:
+            sekizai.__class__ = SekizaiDictionary
+            del sekizai._cms_rendering
+        if getattr(self.request, '_cms_concurrent_rendering', None) is self:
+            del self.request._cms_concurrent_rendering
+
+
+def render_concurrently(request, render):
+    """
+    Calls ``render``, which renders a template for ``request`` and returns
+    the content, letting the placeholder tags of the template render their
+    plugins on the rendering pool (CMS_PLACEHOLDER_RENDERING_THREADS).
+
+    The template is rendered again in the request thread if the markers of
+    the placeholders can't all be found in the content.
+    """
+    pool = get_rendering_pool()
+    if pool is None:
+        return render()
+    rendering = request._cms_concurrent_rendering = ConcurrentRendering(request, pool)
+    try:
+        content = rendering.finish(render())
+    finally:
+        rendering.stop()
+    if content is None:
+        content = render()
+    return content
+
+
+def render_placeholder(placeholder, context_to_copy, name_fallback="Placeholder", lang=None, default=None,
+                       concurrent=False):
     """
     Renders plugins for a placeholder on the given page using shallow copies of the
     given context, and returns a string containing the rendered output.
+
+    With ``concurrent``, the plugins may be rendered on the rendering pool if
+    the template is rendered with render_concurrently, and a marker is
+    returned instead of the output.
     """
     from cms.plugins.utils import get_plugins
     context = context_to_copy
@@ -108,8 +385,6 @@ def render_placeholder(placeholder, context_to_copy, name_fallback="Placeholder"
     else:
         lang = get_language_from_request(request)
         save_language = lang
-    plugins = [plugin for plugin in get_plugins(request, placeholder, template, lang=lang)]
-
     # Add extra context as defined in settings, but do not overwrite existing context variables,
     # since settings are general and database/template are specific
     # TODO this should actually happen as a plugin context processor, but these currently overwrite
@@ -138,7 +413,35 @@ def render_placeholder(placeholder, context_to_copy, name_fallback="Placeholder"
     else:
         processors = None
 
-    content.extend(render_plugins(plugins, context, placeholder, processors))
+    use_cache = (get_cms_setting('PLACEHOLDER_CACHE') and not edit and
+                 placeholder and placeholder.pk)
+    cached = get_placeholder_cache(placeholder, lang, request) if use_cache else None
+    if cached is not None:
+        # the plugins are not rendered, so they can't keep the page out of
+        # the page cache themselves
+        if cached.get('vary') != ():
+            set_page_uncacheable(request)
+        restore_sekizai(context, cached['sekizai'])
+        if cached['content']:
+            content.append(cached['content'])
+    else:
+        plugins = [plugin for plugin in get_plugins(request, placeholder, template, lang=lang)]
+        rendering = getattr(request, '_cms_concurrent_rendering', None) if concurrent and not edit else None
+        if rendering is not None and plugins and is_thread_safe(plugins):
+            marker = rendering.submit(placeholder, plugins, context, lang, use_cache)
+            if marker is not None:
+                context.pop()
+                return marker
+        if use_cache:
+            if rendering is not None:
+                # the sekizai data of the placeholders rendered on the pool
+                # is not part of this one
+                rendering.join()
+            watcher = Watcher(context)
+        content.extend(render_plugins(plugins, context, placeholder, processors))
+        if use_cache:
+            set_placeholder_cache(placeholder, lang, request, plugins, "".join(content),
+                                  watcher.get_changes())
     toolbar_content = ''
 
     if edit:
@@ -158,7 +461,7 @@ def render_placeholder(placeholder, context_to_copy, name_fallback="Placeholder"
     context['content'] = content
     context['placeholder'] = toolbar_content
     context['edit'] = edit
-    result = render_to_string("cms/toolbar/content.html", context)
+    result = get_cached_template("cms/toolbar/content.html").render(Context(context))
     context.pop()
     return result
 
@@ -185,6 +488,6 @@ def render_placeholder_toolbar(placeholder, context, name_fallback, save_languag
     context['placeholder'] = placeholder
     context['language'] = save_language
     context['page'] = page
-    toolbar = render_to_string("cms/toolbar/placeholder.html", context)
+    toolbar = get_cached_template("cms/toolbar/placeholder.html").render(Context(context))
     context.pop()
     return toolbar
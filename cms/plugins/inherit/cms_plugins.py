@@ -19,6 +19,7 @@ class InheritPagePlaceholderPlugin(CMSPluginBase):
     form = InheritForm
     admin_preview = False
     page_only = True
+    select_related = ('from_page',)
     
     def render(self, context, instance, placeholder):
         template_vars = {
@@ -11,6 +11,7 @@ class LinkPlugin(CMSPluginBase):
     form = LinkForm
     name = _("Link")
     render_template = "cms/plugins/link.html"
+    select_related = ('page_link',)
     text_enabled = True
 
     def render(self, context, instance, placeholder):
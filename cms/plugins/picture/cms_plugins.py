@@ -8,6 +8,7 @@ class PicturePlugin(CMSPluginBase):
     model = Picture
     name = _("Picture")
     render_template = "cms/plugins/picture.html"
+    select_related = ('page_link',)
     text_enabled = True
 
     def render(self, context, instance, placeholder):
@@ -12,6 +12,7 @@ class SnippetPlugin(CMSPluginBase):
     model = SnippetPtr
     name = _("Snippet")
     render_template = "cms/plugins/snippet.html"
+    select_related = ('snippet',)
     text_enabled = True
 
     def render(self, context, instance, placeholder):
@@ -7,6 +7,7 @@ class TeaserPlugin(CMSPluginBase):
     model = Teaser
     name = _("Teaser")
     render_template = "cms/plugins/teaser.html"
+    select_related = ('page_link',)
     
     def render(self, context, instance, placeholder):
         if instance.url:
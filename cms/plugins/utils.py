@@ -32,15 +32,24 @@ def requires_reload(action, plugins):
     return False
 
 
-def assign_plugins(request, placeholders, template, lang=None, no_fallback=False):
+def assign_plugins(request, placeholders, template, lang=None, no_fallback=False, templates=None,
+                   default_placeholders=None):
     """
     Fetch all plugins for the given ``placeholders`` and
     cast them down to the concrete instances in one query
     per type.
+
+    ``templates`` optionally maps placeholder ids to the template of their
+    page, for placeholders of several pages; ``template`` is used for the
+    others.
+
+    Default plugins are created in the empty placeholders whose id is in
+    ``default_placeholders``, or in all empty placeholders if it is None.
     """
     placeholders = list(placeholders)
     if not placeholders:
         return
+    templates = templates or {}
     lang = lang or get_language_from_request(request)
     request_lang = lang
     qs = get_cmsplugin_queryset(request).filter(placeholder__in=placeholders, language=request_lang).order_by(
@@ -48,26 +57,28 @@ def assign_plugins(request, placeholders, template, lang=None, no_fallback=False
     plugins = list(qs)
     # If no plugin is present in the current placeholder we loop in the fallback languages
     # and get the first available set of plugins
-
+    found = set(plugin.placeholder_id for plugin in plugins)
+    empty = [placeholder for placeholder in placeholders if placeholder.pk not in found]
+    assigned = set()
     if not no_fallback:
-        for placeholder in placeholders:
-            found = False
-            for plugin in plugins:
-                if plugin.placeholder_id == placeholder.pk:
-                    found = True
-                    break
-            if found:
-                continue
-            elif placeholder and get_placeholder_conf("language_fallback", placeholder.slot, template, False):
+        for placeholder in empty:
+            placeholder_template = templates.get(placeholder.pk, template)
+            if get_placeholder_conf("language_fallback", placeholder.slot, placeholder_template, False):
                 fallbacks = get_fallback_languages(lang)
                 for fallback_language in fallbacks:
-                    assign_plugins(request, [placeholder], template, fallback_language, no_fallback=True)
-                    plugins = placeholder._plugins_cache
-                    if plugins:
+                    assign_plugins(request, [placeholder], placeholder_template, fallback_language,
+                                   no_fallback=True, default_placeholders=default_placeholders)
+                    if placeholder._plugins_cache:
+                        assigned.add(placeholder.pk)
                         break
     # If no plugin is present, create default plugins if enabled)
-    if not plugins:
-        plugins = create_default_plugins(request, placeholders, template, lang)
+    for placeholder in empty:
+        if placeholder.pk in assigned:
+            continue
+        if default_placeholders is not None and placeholder.pk not in default_placeholders:
+            continue
+        plugins.extend(create_default_plugins(
+            request, [placeholder], templates.get(placeholder.pk, template), lang))
     plugin_list = downcast_plugins(plugins, placeholders)
     # split the plugins up by placeholder
     groups = dict((key, list(plugins)) for key, plugins in groupby(plugin_list, operator.attrgetter('placeholder_id')))
@@ -75,7 +86,8 @@ def assign_plugins(request, placeholders, template, lang=None, no_fallback=False
     for group in groups:
         groups[group] = build_plugin_tree(groups[group])
     for placeholder in placeholders:
-        setattr(placeholder, '_plugins_cache', list(groups.get(placeholder.pk, [])))
+        if placeholder.pk not in assigned:
+            setattr(placeholder, '_plugins_cache', list(groups.get(placeholder.pk, [])))
 
 
 def create_default_plugins(request, placeholders, template, lang):
@@ -120,6 +132,7 @@ def build_plugin_tree(plugin_list):
 def downcast_plugins(queryset, placeholders=None, select_placeholder=False):
     plugin_types_map = defaultdict(list)
     plugin_lookup = {}
+    placeholders_by_id = dict((placeholder.pk, placeholder) for placeholder in placeholders or ())
 
     # make a map of plugin types, needed later for downcasting
     for plugin in queryset:
@@ -128,18 +141,22 @@ def downcast_plugins(queryset, placeholders=None, select_placeholder=False):
         cls = plugin_pool.get_plugin(plugin_type)
         # get all the plugins of type cls.model
         plugin_qs = cls.model.objects.filter(pk__in=pks)
+        select_related = list(cls.select_related)
         if select_placeholder:
-            plugin_qs = plugin_qs.select_related('placeholder')
+            select_related.append('placeholder')
+        if select_related:
+            plugin_qs = plugin_qs.select_related(*select_related)
+        if cls.prefetch_related:
+            plugin_qs = plugin_qs.prefetch_related(*cls.prefetch_related)
 
         # put them in a map so we can replace the base CMSPlugins with their
         # downcasted versions
         for instance in plugin_qs:
             plugin_lookup[instance.pk] = instance
             # cache the placeholder
-            if placeholders:
-                for pl in placeholders:
-                    if instance.placeholder_id == pl.pk:
-                        instance.placeholder = pl
+            placeholder = placeholders_by_id.get(instance.placeholder_id)
+            if placeholder is not None:
+                instance.placeholder = placeholder
             # make the equivalent list of qs, but with downcasted instances
     plugin_list = []
     for p in queryset:
@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
 from cms.exceptions import NoHomeFound
 from cms.utils.conf import get_cms_setting
+from cms.utils.i18n import get_fallback_languages, get_language_list
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import signals
+from django.db.models.expressions import ExpressionNode
 from django.dispatch import Signal
 
-from cms.cache.permissions import clear_user_permission_cache, clear_permission_cache
+from cms.cache.invalidation import defer, deferred_invalidation
+from cms.cache.permissions import (clear_user_permission_cache, clear_permission_cache,
+    clear_view_restrictions_cache)
+from cms.cache.menu_snapshot import clear_menu_snapshot, refresh_menu_snapshot
+from cms.cache.page import clear_page_cache
+from cms.cache.page_placeholders import clear_page_placeholders
+from cms.cache.placeholder import clear_placeholder_cache
+from cms.cache.routing import clear_routing_cache
 from cms.models import Page, Title, CMSPlugin, PagePermission, GlobalPagePermission, PageUser, PageUserGroup, PlaceholderReference, Placeholder
+from cms.models.static_placeholder import StaticPlaceholder
 from django.conf import settings
+from django.contrib.sites.models import Site
 from menus.menu_pool import menu_pool
 
 # fired after page location is changed - is moved from one node to other
@@ -36,6 +47,72 @@ def update_plugin_positions(**kwargs):
 signals.post_delete.connect(update_plugin_positions, sender=CMSPlugin, dispatch_uid="cms.plugin.update_position")
 
 
+def remember_plugin_placeholder(instance, **kwargs):
+    # the placeholder a plugin was loaded with, so that moving it to another
+    # placeholder can invalidate both without asking the database
+    instance._old_placeholder_id = instance.__dict__.get('placeholder_id')
+
+
+def pre_save_plugin_placeholder(instance, raw, **kwargs):
+    if not instance.pk or not get_cms_setting('PLACEHOLDER_CACHE'):
+        return
+    if '_old_placeholder_id' not in instance.__dict__:
+        # deferred instances don't send post_init for their model
+        old_placeholder_ids = CMSPlugin.objects.filter(pk=instance.pk).values_list('placeholder_id', flat=True)
+        instance._old_placeholder_id = old_placeholder_ids[0] if old_placeholder_ids else None
+
+
+def invalidate_plugin_placeholder(instance, **kwargs):
+    old_placeholder_id = instance.__dict__.get('_old_placeholder_id')
+    instance._old_placeholder_id = instance.placeholder_id
+    if not get_cms_setting('PLACEHOLDER_CACHE'):
+        return
+    if instance.placeholder_id:
+        clear_placeholder_cache(instance.placeholder_id)
+    if old_placeholder_id and old_placeholder_id != instance.placeholder_id:
+        clear_placeholder_cache(old_placeholder_id)
+
+
+def connect_plugin_placeholder_signals(model):
+    """
+    Invalidates the placeholder cache when plugins of the given model are
+    saved, moved or deleted. Called for every model registered in the plugin
+    pool.
+    """
+    dispatch_uid = "cms.plugin.placeholder_cache.%s.%s" % (model._meta.app_label, model.__name__)
+    signals.post_init.connect(remember_plugin_placeholder, sender=model, dispatch_uid=dispatch_uid)
+    signals.pre_save.connect(pre_save_plugin_placeholder, sender=model, dispatch_uid=dispatch_uid)
+    signals.post_save.connect(invalidate_plugin_placeholder, sender=model, dispatch_uid=dispatch_uid)
+    signals.post_delete.connect(invalidate_plugin_placeholder, sender=model, dispatch_uid=dispatch_uid)
+
+
+def invalidate_page_placeholders(instance, **kwargs):
+    for placeholder_id in instance.placeholders.values_list('pk', flat=True):
+        clear_placeholder_cache(placeholder_id)
+    if instance.publisher_public_id:
+        for placeholder_id in Placeholder.objects.filter(
+                page=instance.publisher_public_id).values_list('pk', flat=True):
+            clear_placeholder_cache(placeholder_id)
+
+
+def invalidate_static_placeholder(instance, **kwargs):
+    for placeholder_id in (instance.draft_id, instance.public_id):
+        if placeholder_id:
+            clear_placeholder_cache(placeholder_id)
+    # static placeholders can be on any page of any site
+    for site_id in Site.objects.values_list('pk', flat=True):
+        clear_page_cache(site_id)
+
+
+def invalidate_page_cache(instance, **kwargs):
+    clear_page_cache(instance.site_id)
+
+
+connect_plugin_placeholder_signals(CMSPlugin)
+signals.post_save.connect(invalidate_static_placeholder, sender=StaticPlaceholder,
+                          dispatch_uid="cms.static_placeholder.placeholder_cache")
+
+
 def update_home(instance, **kwargs):
     """
     Updates the is_home flag of page instances after they are saved or moved.
@@ -84,8 +161,9 @@ signals.post_delete.connect(update_home, sender=Page)
 def update_title_paths(instance, **kwargs):
     """Update child pages paths in case when page was moved.
     """
-    for title in instance.title_set.all():
-        title.save()
+    with deferred_invalidation():
+        for title in instance.title_set.all():
+            title.save()
 
 
 page_moved.connect(update_title_paths, sender=Page, dispatch_uid="cms.title.update_path")
@@ -118,7 +196,7 @@ def pre_save_title(instance, raw, **kwargs):
         instance.page._publisher_keep_state = True
         instance.page.save(no_signals=True)
     if not instance.page.publisher_is_draft:
-        menu_pool.clear(instance.page.site_id)
+        menu_pool.clear_nodes(instance.page.site_id)
     if instance.id and not hasattr(instance, "tmp_path"):
         instance.tmp_path = None
         try:
@@ -149,25 +227,104 @@ def pre_delete_title(instance, **kwargs):
 signals.pre_save.connect(pre_save_title, sender=Title, dispatch_uid="cms.title.presave")
 
 
+class _ValuesByPk(ExpressionNode):
+    """
+    ``CASE pk WHEN <pk> THEN <value> ... ELSE <field> END``, to set a field to
+    a value per row with a single QuerySet.update.
+    """
+    def __init__(self, values, field):
+        super(_ValuesByPk, self).__init__(None, None, False)
+        self.values = values
+        self.field = field
+
+    def prepare(self, evaluator, query, allow_joins):
+        self.opts = query.model._meta
+
+    def evaluate(self, evaluator, qn, connection):
+        sql = ['CASE %s' % qn(self.opts.pk.column)]
+        params = []
+        for pk, value in self.values.items():
+            sql.append('WHEN %s THEN %s')
+            params.extend((pk, value))
+        sql.append('ELSE %s END' % qn(self.opts.get_field(self.field).column))
+        return ' '.join(sql), params
+
+
+def update_descendant_paths(title):
+    """
+    Recomputes the paths of the titles below the page of ``title`` in its
+    language, as saving each of them would, in a single pass.
+
+    The descendants are walked in tree order, so the paths of their parents
+    are known already, and the changed paths are written with one update.
+    No title is saved and no signal is sent, the caches of the site are
+    invalidated once.
+    """
+    page = title.page
+    language = title.language
+    subtree = Title.objects.filter(
+        page__tree_id=page.tree_id,
+        page__lft__gte=page.lft,
+        page__rght__lte=page.rght,
+    )
+    # page id -> {language: path}
+    paths = {}
+    titles = {}
+    for pk, page_id, title_language, slug, path, has_url_overwrite in subtree.values_list(
+            'pk', 'page_id', 'language', 'slug', 'path', 'has_url_overwrite'):
+        paths.setdefault(page_id, {})[title_language] = path
+        if title_language == language and not has_url_overwrite:
+            titles[page_id] = (pk, slug, path)
+    paths.setdefault(page.pk, {})[language] = title.path
+    # as in update_title, only looked up when a parent isn't translated
+    fallbacks = None
+
+    rows = []
+    descendants = Page.objects.filter(
+        tree_id=page.tree_id, lft__gt=page.lft, rght__lt=page.rght,
+    ).order_by('lft').values_list('pk', 'parent_id', 'is_home')
+    for page_id, parent_id, is_home in descendants:
+        if page_id not in titles:
+            continue
+        pk, slug, old_path = titles[page_id]
+        if is_home:
+            path = ''
+        else:
+            path = u'%s' % slug
+            parent_paths = paths.get(parent_id, {})
+            parent_language = language
+            if parent_language not in parent_paths:
+                if fallbacks is None:
+                    fallbacks = get_fallback_languages(language)
+                parent_language = None
+                for fallback in fallbacks:
+                    if fallback in parent_paths:
+                        parent_language = fallback
+                        break
+            if parent_language is not None:
+                path = (u'%s/%s' % (parent_paths[parent_language], slug)).lstrip("/")
+        paths[page_id][language] = path
+        if path != old_path:
+            rows.append((path, pk))
+    if not rows:
+        return
+
+    # a few hundred rows per statement keeps below the limit of query
+    # parameters of sqlite
+    for start in range(0, len(rows), 300):
+        paths_by_pk = dict((pk, path) for path, pk in rows[start:start + 300])
+        Title.objects.filter(pk__in=paths_by_pk).update(path=_ValuesByPk(paths_by_pk, 'path'))
+    clear_routing_cache(page.site_id)
+    if not page.publisher_is_draft:
+        menu_pool.clear_nodes(page.site_id)
+        refresh_page_menu_snapshot(page.site_id, language, page.pk)
+
+
 def post_save_title(instance, raw, created, **kwargs):
     # Update descendants only if path changed
-    application_changed = False
     prevent_descendants = hasattr(instance, 'tmp_prevent_descendant_update')
     if instance.path != getattr(instance, 'tmp_path', None) and not prevent_descendants:
-        descendant_titles = Title.objects.filter(
-            page__lft__gt=instance.page.lft,
-            page__rght__lt=instance.page.rght,
-            page__tree_id__exact=instance.page.tree_id,
-            language=instance.language,
-            has_url_overwrite=False, # TODO: what if child has no url overwrite?
-        ).order_by('page__tree_id', 'page__parent', 'page__lft')
-
-        for descendant_title in descendant_titles:
-            descendant_title.path = ''  # just reset path
-            descendant_title.tmp_prevent_descendant_update = True
-            descendant_title._publisher_keep_state = True
-            descendant_title.save()
-            # remove temporary attributes
+        update_descendant_paths(instance)
     if hasattr(instance, 'tmp_path'):
         del instance.tmp_path
     if prevent_descendants:
@@ -257,11 +414,100 @@ def post_save_page(instance, **kwargs):
 
 def update_placeholders(instance, **kwargs):
     if not kwargs.get('raw'):
+        if kwargs.get('created'):
+            # anything cached for this pk was left by a rolled back transaction
+            clear_page_placeholders(instance.pk)
         instance.rescan_placeholders()
 
 
 def invalidate_menu_cache(instance, **kwargs):
-    menu_pool.clear(instance.site_id)
+    menu_pool.clear_nodes(instance.site_id)
+
+
+def invalidate_routing_cache(instance, **kwargs):
+    if isinstance(instance, Title):
+        try:
+            instance = instance.page
+        except Page.DoesNotExist:
+            return
+    clear_routing_cache(instance.site_id)
+
+
+def refresh_page_menu_snapshot(site_id, language, page_id):
+    """
+    Reloads the tree of the given public page in the menu snapshot of a
+    language, at the end of the deferred_invalidation block if there is one.
+    """
+    if defer(('menu_snapshot', site_id, language, page_id),
+             refresh_page_menu_snapshot, site_id, language, page_id):
+        return
+    refresh_menu_snapshot(site_id, language, page_id)
+    # node sets built while the snapshot was being refreshed are stale
+    menu_pool.clear_nodes(site_id)
+
+
+def update_menu_snapshot(instance, raw=False, **kwargs):
+    if raw or instance.publisher_is_draft:
+        return
+    if isinstance(instance, Title):
+        refresh_page_menu_snapshot(instance.page.site_id, instance.language, instance.page_id)
+    else:
+        for language in get_language_list(instance.site_id):
+            refresh_page_menu_snapshot(instance.site_id, language, instance.pk)
+
+
+def invalidate_menu_snapshot(instance, **kwargs):
+    if isinstance(instance, Title):
+        if instance.publisher_is_draft:
+            return
+        try:
+            instance = instance.page
+        except Page.DoesNotExist:
+            return
+    clear_menu_snapshot(instance.site_id)
+
+
+def invalidate_view_restrictions(instance, **kwargs):
+    if isinstance(instance, PagePermission):
+        try:
+            instance = instance.page
+        except Page.DoesNotExist:
+            return
+        if instance is None:
+            return
+    clear_view_restrictions_cache(instance.site_id)
+
+
+def invalidate_permission_page_cache(instance, **kwargs):
+    # view restrictions change what anonymous users get
+    if isinstance(instance, PagePermission) and instance.page_id:
+        try:
+            clear_page_cache(instance.page.site_id)
+            return
+        except Page.DoesNotExist:
+            pass
+    for site_id in Site.objects.values_list('pk', flat=True):
+        clear_page_cache(site_id)
+
+
+def invalidate_page_placeholders_list(instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            if hasattr(instance, '_placeholder_cache'):
+                del instance._placeholder_cache
+            clear_page_placeholders(instance.pk)
+    elif action == 'pre_clear':
+        # the pages of a placeholder are about to be unlinked
+        clear_page_placeholders(*Page.objects.filter(placeholders=instance).values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        clear_page_placeholders(*pk_set)
+
+
+def invalidate_placeholder_pages(instance, **kwargs):
+    # the links to the pages are deleted with the placeholder without any
+    # m2m_changed or post_delete signal for them
+    clear_page_placeholders(*Page.objects.filter(placeholders=instance).values_list('pk', flat=True))
+
 
 def delete_placeholders(instance, **kwargs):
     instance.placeholders.all().delete()
@@ -275,6 +521,45 @@ signals.pre_save.connect(invalidate_menu_cache, sender=Page)
 signals.pre_delete.connect(invalidate_menu_cache, sender=Page)
 signals.pre_delete.connect(delete_placeholders, sender=Page)
 signals.pre_delete.connect(pre_delete_title, sender=Title)
+signals.post_save.connect(invalidate_routing_cache, sender=Page, dispatch_uid="cms.page.routing")
+signals.post_delete.connect(invalidate_routing_cache, sender=Page, dispatch_uid="cms.page.routing")
+signals.post_save.connect(invalidate_routing_cache, sender=Title, dispatch_uid="cms.title.routing")
+signals.post_delete.connect(invalidate_routing_cache, sender=Title, dispatch_uid="cms.title.routing")
+page_moved.connect(invalidate_routing_cache, sender=Page, dispatch_uid="cms.page.moved.routing")
+post_publish.connect(invalidate_routing_cache, sender=Page, dispatch_uid="cms.page.publish.routing")
+post_unpublish.connect(invalidate_routing_cache, sender=Page, dispatch_uid="cms.page.unpublish.routing")
+post_publish.connect(invalidate_page_placeholders, sender=Page, dispatch_uid="cms.page.publish.placeholder_cache")
+post_unpublish.connect(invalidate_page_placeholders, sender=Page, dispatch_uid="cms.page.unpublish.placeholder_cache")
+post_publish.connect(invalidate_page_cache, sender=Page, dispatch_uid="cms.page.publish.page_cache")
+post_unpublish.connect(invalidate_page_cache, sender=Page, dispatch_uid="cms.page.unpublish.page_cache")
+page_moved.connect(invalidate_page_cache, sender=Page, dispatch_uid="cms.page.moved.page_cache")
+signals.post_delete.connect(invalidate_page_cache, sender=Page, dispatch_uid="cms.page.page_cache")
+signals.post_save.connect(update_menu_snapshot, sender=Page, dispatch_uid="cms.page.menu_snapshot")
+signals.post_save.connect(update_menu_snapshot, sender=Title, dispatch_uid="cms.title.menu_snapshot")
+page_moved.connect(invalidate_menu_snapshot, sender=Page, dispatch_uid="cms.page.moved.menu_snapshot")
+signals.post_delete.connect(invalidate_menu_snapshot, sender=Page, dispatch_uid="cms.page.menu_snapshot")
+signals.post_delete.connect(invalidate_menu_snapshot, sender=Title, dispatch_uid="cms.title.menu_snapshot")
+signals.m2m_changed.connect(invalidate_page_placeholders_list, sender=Page.placeholders.through,
+                            dispatch_uid="cms.page.placeholders_list")
+signals.pre_delete.connect(invalidate_placeholder_pages, sender=Placeholder,
+                           dispatch_uid="cms.placeholder.placeholders_list")
+signals.post_save.connect(invalidate_view_restrictions, sender=Page, dispatch_uid="cms.page.view_restrictions")
+signals.post_delete.connect(invalidate_view_restrictions, sender=Page, dispatch_uid="cms.page.view_restrictions")
+page_moved.connect(invalidate_view_restrictions, sender=Page, dispatch_uid="cms.page.moved.view_restrictions")
+signals.post_save.connect(invalidate_view_restrictions, sender=PagePermission,
+                          dispatch_uid="cms.pagepermission.view_restrictions")
+signals.post_delete.connect(invalidate_view_restrictions, sender=PagePermission,
+                            dispatch_uid="cms.pagepermission.view_restrictions")
+signals.post_save.connect(invalidate_permission_page_cache, sender=PagePermission,
+                          dispatch_uid="cms.pagepermission.page_cache")
+signals.post_delete.connect(invalidate_permission_page_cache, sender=PagePermission,
+                            dispatch_uid="cms.pagepermission.page_cache")
+signals.post_save.connect(invalidate_permission_page_cache, sender=GlobalPagePermission,
+                          dispatch_uid="cms.globalpagepermission.page_cache")
+signals.post_delete.connect(invalidate_permission_page_cache, sender=GlobalPagePermission,
+                            dispatch_uid="cms.globalpagepermission.page_cache")
+signals.m2m_changed.connect(invalidate_permission_page_cache, sender=GlobalPagePermission.sites.through,
+                            dispatch_uid="cms.globalpagepermission.sites.page_cache")
 
 
 def clear_placeholder_ref(instance, **kwargs):
@@ -326,7 +611,7 @@ def pre_delete_pagepermission(instance, **kwargs):
 
 def pre_save_globalpagepermission(instance, raw, **kwargs):
     _clear_users_permissions(instance)
-    menu_pool.clear(all=True)
+    menu_pool.clear_nodes(all=True)
 
 
 def pre_delete_globalpagepermission(instance, **kwargs):
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Work done once in every process, when it serves its first request. By then
+all apps, template libraries and template loaders can be imported, which is
+not the case yet while ``cms.models`` is being imported.
+"""
+from logging import getLogger
+
+from django.conf import settings
+from django.core.signals import request_started
+
+log = getLogger('cms.startup')
+
+
+def warm_caches(**kwargs):
+    request_started.disconnect(warm_caches, dispatch_uid="cms.startup")
+    if settings.DEBUG:
+        # templates are scanned on every use while developing
+        return
+    from cms.utils.plugins import warm_placeholders_cache
+    try:
+        warm_placeholders_cache()
+    except Exception:
+        # the page using a broken template raises the error again when it
+        # is rendered
+        log.exception("Could not scan the placeholders of CMS_TEMPLATES")
+
+
+request_started.connect(warm_caches, dispatch_uid="cms.startup")
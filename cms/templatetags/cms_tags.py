@@ -8,6 +8,10 @@ from classytags.core import Options, Tag
 from classytags.helpers import InclusionTag, AsTag
 from classytags.parser import Parser
 from cms import __version__
+from cms.cache.page_index import get_page_index
+from cms.cache.reverse_ids import get_reverse_id_table
+from cms.cache.routing import get_cache_version
+from cms.cache.singleflight import get_or_build
 from cms.exceptions import PlaceholderNotFound
 from cms.models import Page, Placeholder as PlaceholderModel, CMSPlugin, StaticPlaceholder
 from cms.plugin_pool import plugin_pool
@@ -18,11 +22,11 @@ from cms.utils.compat.type_checks import string_types, int_types
 from cms.utils.i18n import force_language
 from cms.utils.moderator import use_draft
 from cms.utils.page_resolver import get_page_queryset
-from cms.utils.placeholder import validate_placeholder_name, get_toolbar_plugin_struct
+from cms.utils.placeholder import (validate_placeholder_name, get_toolbar_plugin_struct,
+    restore_sekizai as _restore_sekizai)
 from django import template
 from django.conf import settings
 from django.contrib.sites.models import Site
-from django.core.cache import cache
 from django.core.mail import mail_managers
 from django.core.urlresolvers import reverse
 from django.template.loader import render_to_string
@@ -60,6 +64,50 @@ def _get_cache_key(name, page_lookup, lang, site_id):
     return name + '__page_lookup:' + page_key + '_site:' + str(site_id) + '_lang:' + str(lang)
 
 
+def _get_reverse_id_entry(request, site_id, reverse_id):
+    """
+    Returns the entry of the reverse_id table for the given reverse_id, or
+    None. The table is read from the cache once per request.
+    """
+    tables = getattr(request, '_cms_reverse_ids', None)
+    if tables is None:
+        tables = request._cms_reverse_ids = {}
+    if site_id not in tables:
+        tables[site_id] = get_reverse_id_table(site_id)
+    return tables[site_id].get(reverse_id)
+
+
+def _get_indexed_page(page_lookup, request, site_id):
+    """
+    Finds the page of a pk or reverse_id lookup through the page index and
+    the reverse_id table. The pages found are kept on the request, so that
+    each page costs at most one query per request.
+    """
+    draft = bool(request and use_draft(request))
+    if 'pk' in page_lookup:
+        try:
+            pk = get_page_index(site_id).get_pk(int(page_lookup['pk']), draft)
+        except KeyError:
+            raise Page.DoesNotExist
+        if pk is None:
+            # the page exists, but not in the requested version
+            return None
+    else:
+        entry = _get_reverse_id_entry(request, site_id, page_lookup['reverse_id'])
+        pk = entry and entry[0 if draft else 1]
+        if pk is None:
+            raise Page.DoesNotExist
+    pages = getattr(request, '_cms_page_lookups', None)
+    if pages is None:
+        pages = request._cms_page_lookups = {}
+    if pk not in pages:
+        found = list(Page.objects.filter(pk=pk)[:1])
+        pages[pk] = found[0] if found else None
+    if pages[pk] is None:
+        raise Page.DoesNotExist
+    return pages[pk]
+
+
 def _get_page_by_untyped_arg(page_lookup, request, site_id):
     """
     The `page_lookup` argument can be of any of the following types:
@@ -84,7 +132,9 @@ def _get_page_by_untyped_arg(page_lookup, request, site_id):
         raise TypeError('The page_lookup argument can be either a Dictionary, Integer, Page, or String.')
     page_lookup.update({'site': site_id})
     try:
-        if 'pk' in page_lookup:
+        if request and len(page_lookup) == 2 and ('pk' in page_lookup or 'reverse_id' in page_lookup):
+            return _get_indexed_page(page_lookup, request, site_id)
+        elif 'pk' in page_lookup:
             page = Page.objects.all().get(**page_lookup)
             if request and use_draft(request):
                 if page.publisher_is_draft:
@@ -132,13 +182,23 @@ class PageUrl(InclusionTag):
             return {'content': ''}
         if lang is None:
             lang = get_language_from_request(request)
-        cache_key = _get_cache_key('page_url', page_lookup, lang, site_id) + '_type:absolute_url'
-        url = cache.get(cache_key)
-        if not url:
+        if (isinstance(page_lookup, string_types) and lang == get_language()
+                and not use_draft(request)):
+            # public urls of pages with a reverse_id are known without query
+            entry = _get_reverse_id_entry(request, site_id, page_lookup)
+            url = entry and entry[2].get(lang)
+            if url:
+                return {'content': url}
+        # the routing version changes when pages are published or moved
+        cache_key = _get_cache_key('page_url', page_lookup, lang, site_id) + '_type:absolute_url_v:%s' % (
+            get_cache_version(site_id))
+
+        def build():
             page = _get_page_by_untyped_arg(page_lookup, request, site_id)
             if page:
-                url = page.get_absolute_url(language=lang)
-                cache.set(cache_key, url, get_cms_setting('CACHE_DURATIONS')['content'])
+                return page.get_absolute_url(language=lang)
+
+        url = get_or_build(cache_key, build, get_cms_setting('CACHE_DURATIONS')['content'])
         if url:
             return {'content': url}
         return {'content': ''}
@@ -149,28 +209,65 @@ register.tag(PageUrl)
 register.tag('page_id_url', PageUrl)
 
 
-def _get_placeholder(current_page, page, context, name):
+def _load_placeholders(current_page, pages, context):
+    """
+    Fetches the placeholders of the given pages, unless they are already
+    loaded for this request, and assigns their plugins in one pass.
+    """
     placeholder_cache = getattr(current_page, '_tmp_placeholders_cache', {})
-    if page.pk in placeholder_cache:
-        placeholder = placeholder_cache[page.pk].get(name, None)
-        if placeholder:
-            return placeholder
-    placeholder_cache[page.pk] = {}
-    placeholders = page.rescan_placeholders().values()
-    assign_plugins(context['request'], placeholders, page.get_template(),  get_language())
-    for placeholder in placeholders:
-        placeholder_cache[page.pk][placeholder.slot] = placeholder
-        placeholder.page = page
+    placeholders = []
+    templates = {}
+    # default plugins are only created in the draft of the rendered page,
+    # never in its ancestors nor in public pages
+    default_placeholders = set()
+    for page in pages:
+        if page.pk in placeholder_cache:
+            continue
+        placeholder_cache[page.pk] = {}
+        template = page.get_template()
+        # public pages get their placeholders when they are published, never
+        # write while rendering them
+        for placeholder in page.rescan_placeholders(create=page.publisher_is_draft).values():
+            placeholder_cache[page.pk][placeholder.slot] = placeholder
+            placeholder.page = page
+            templates[placeholder.pk] = template
+            placeholders.append(placeholder)
+            if page.pk == current_page.pk and page.publisher_is_draft:
+                default_placeholders.add(placeholder.pk)
+    assign_plugins(context['request'], placeholders, None, get_language(), templates=templates,
+                   default_placeholders=default_placeholders)
     current_page._tmp_placeholders_cache = placeholder_cache
-    placeholder = placeholder_cache[page.pk].get(name, None)
+
+
+def _get_placeholder(current_page, page, context, name):
+    placeholder_cache = getattr(current_page, '_tmp_placeholders_cache', {})
+    loaded = placeholder_cache.get(page.pk)
+    # missing placeholders of drafts get created by a new scan
+    if loaded is None or (name not in loaded and page.publisher_is_draft):
+        placeholder_cache.pop(page.pk, None)
+        pages = [page]
+        if page.pk == current_page.pk and not _is_edit_mode(context['request']):
+            # load the plugins of the parent pages together with the ones of the
+            # current page if the template inherits any placeholder
+            from cms.utils.plugins import get_inherited_placeholders
+
+            if get_inherited_placeholders(page.get_template()):
+                pages.extend(page.get_cached_ancestors(ascending=True))
+        _load_placeholders(current_page, pages, context)
+        loaded = current_page._tmp_placeholders_cache[page.pk]
+    placeholder = loaded.get(name, None)
     if page.application_urls and not placeholder:
         raise PlaceholderNotFound(
             '"%s" placeholder not found in an apphook application. Please use a static placeholder instead.' % name)
     return placeholder
 
 
+def _is_edit_mode(request):
+    return getattr(request, 'toolbar', None) and getattr(request.toolbar, 'edit_mode')
+
+
 def get_placeholder_content(context, request, current_page, name, inherit, default):
-    edit_mode = getattr(request, 'toolbar', None) and getattr(request.toolbar, 'edit_mode')
+    edit_mode = _is_edit_mode(request)
     pages = [current_page]
     # don't display inherited plugins in edit mode, so that the user doesn't
     # mistakenly edit/delete them. This is a fix for issue #1303. See the discussion
@@ -265,12 +362,24 @@ class Placeholder(Tag):
 
             return ''
 
+        if not inherit and not nodelist:
+            # the tag doesn't need the output, so the plugins can be rendered
+            # on the rendering pool (CMS_PLACEHOLDER_RENDERING_THREADS)
+            placeholder = _get_placeholder(page, page, context, name)
+            return render_placeholder(placeholder, context, name, concurrent=True)
         content = get_placeholder_content(context, request, page, name, inherit, nodelist)
         return content
 
     def get_name(self):
         return self.kwargs['name'].var.value.strip('"').strip("'")
 
+    def is_inherited(self):
+        extra_bits = self.kwargs['extra_bits']
+        for bit in getattr(extra_bits, 'value', extra_bits):
+            if getattr(bit, 'value', bit.var.value) == 'inherit':
+                return True
+        return False
+
 
 register.tag(Placeholder)
 
@@ -442,15 +551,6 @@ class CleanAdminListFilter(InclusionTag):
         return {'title': spec.title(), 'choices': unique_choices}
 
 
-def _restore_sekizai(context, changes):
-    varname = get_varname()
-    sekizai_container = context[varname]
-    for key, values in changes.items():
-        sekizai_namespace = sekizai_container[key]
-        for value in values:
-            sekizai_namespace.append(value)
-
-
 def _show_placeholder_for_page(context, placeholder_name, page_lookup, lang=None,
                                site=None, cache_result=True):
     """
@@ -474,32 +574,50 @@ def _show_placeholder_for_page(context, placeholder_name, page_lookup, lang=None
 
     if cache_result:
         base_key = _get_cache_key('_show_placeholder_for_page', page_lookup, lang, site_id)
-        cache_key = _clean_key('%s_placeholder:%s' % (base_key, placeholder_name))
-        cached_value = cache.get(cache_key)
-        if isinstance(cached_value, dict): # new style
+        # a reverse_id may point to another page after a publish or move
+        cache_key = _clean_key('%s_placeholder:%s_v:%s' % (base_key, placeholder_name,
+                                                            get_cache_version(site_id)))
+        built = []
+
+        def build():
+            rendered = _render_placeholder_for_page(context, placeholder_name, page_lookup,
+                                                    request, site_id)
+            built.append(True)
+            if rendered is not None:
+                content, changes = rendered
+                return {'content': content, 'sekizai': changes}
+
+        cached_value = get_or_build(cache_key, build, get_cms_setting('CACHE_DURATIONS')['content'])
+        if cached_value is None:
+            return {'content': ''}
+        if not built:
+            # rendering adds the sekizai data to the context, replay it
             _restore_sekizai(context, cached_value['sekizai'])
-            return {'content': mark_safe(cached_value['content'])}
-        elif isinstance(cached_value, string_types): # old style
-            return {'content': mark_safe(cached_value)}
+        return {'content': mark_safe(cached_value['content'])}
 
+    rendered = _render_placeholder_for_page(context, placeholder_name, page_lookup, request, site_id)
+    if rendered is None or not rendered[0]:
+        return {'content': ''}
+    return {'content': mark_safe(rendered[0])}
+
+
+def _render_placeholder_for_page(context, placeholder_name, page_lookup, request, site_id):
+    """
+    Renders the placeholder of the page and returns the content and the
+    sekizai data it added, or None if the page or placeholder doesn't exist.
+    """
     page = _get_page_by_untyped_arg(page_lookup, request, site_id)
     if not page:
-        return {'content': ''}
+        return None
     try:
         placeholder = page.placeholders.get(slot=placeholder_name)
     except PlaceholderModel.DoesNotExist:
         if settings.DEBUG:
             raise
-        return {'content': ''}
+        return None
     watcher = Watcher(context)
     content = render_placeholder(placeholder, context, placeholder_name)
-    changes = watcher.get_changes()
-    if cache_result:
-        cache.set(cache_key, {'content': content, 'sekizai': changes}, get_cms_setting('CACHE_DURATIONS')['content'])
-
-    if content:
-        return {'content': mark_safe(content)}
-    return {'content': ''}
+    return content, watcher.get_changes()
 
 
 class ShowPlaceholderById(InclusionTag):
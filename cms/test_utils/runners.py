@@ -7,6 +7,15 @@ from django.utils.unittest import TestSuite
 
 
 TIMINGS = {}
+# name -> value, see record_measurement
+MEASUREMENTS = {}
+
+
+def record_measurement(name, value):
+    """
+    Keeps a value measured by a test, the timed runner prints them at the end.
+    """
+    MEASUREMENTS[name] = value
 
 def time_it(func):
     def _inner(*args, **kwargs):
@@ -38,3 +47,7 @@ class TimedTestRunner(DjangoTestSuiteRunner):
         print(u"Ten slowest tests:")
         for func_name, timing in by_time:
             print(u"{t:.2f}s {f}".format(f=func_name, t=timing))
+        if MEASUREMENTS:
+            print(u"Measurements:")
+            for name, value in sorted(MEASUREMENTS.items()):
+                print(u"{v:.0f} {n}".format(n=name, v=value))
@@ -1,4 +1,9 @@
 # -*- coding: utf-8 -*-
+from cms.cache.permissions import clear_view_restrictions_cache
+from cms.cache.menu_snapshot import clear_menu_snapshot
+from cms.cache.page_index import reset_page_indexes
+from cms.cache.page_placeholders import clear_page_placeholders
+from cms.cache.routing import clear_routing_cache, reset_routing_tables
 from cms.models import Page
 from cms.test_utils.util.context_managers import (UserLoginContext,
     SettingsOverride)
@@ -92,6 +97,13 @@ class BaseCMSTestCase(object):
     def _post_teardown(self):
         # Needed to clean the menu keys cache, see menu.menu_pool.clear()
         menu_pool.clear()
+        reset_routing_tables()
+        reset_page_indexes()
+        for site_id in Site.objects.values_list('pk', flat=True):
+            clear_view_restrictions_cache(site_id)
+            clear_routing_cache(site_id)
+            clear_menu_snapshot(site_id)
+        clear_page_placeholders(*Page.objects.values_list('pk', flat=True))
         super(BaseCMSTestCase, self)._post_teardown()
         set_current_user(None)
 
@@ -3,6 +3,7 @@ from contextlib import contextmanager
 from django.conf import settings
 from django.core.signals import request_started
 from django.db import reset_queries
+from cms.utils.compat.dj import setting_changed
 from django.template import context
 from django.utils.translation import get_language, activate
 from shutil import rmtree as _rmtree
@@ -37,6 +38,7 @@ class SettingsOverride(object):
         for key, value in self.overrides.items():
             self.old[key] = getattr(settings, key, NULL)
             setattr(settings, key, value)
+            setting_changed.send(sender=settings._wrapped.__class__, setting=key, value=value)
         
     def __exit__(self, type, value, traceback):
         for key, value in self.old.items():
@@ -45,6 +47,8 @@ class SettingsOverride(object):
             else:
                 delattr(settings,key) # do not pollute the context!
             self.special_handlers.get(key, lambda:None)()
+            setting_changed.send(sender=settings._wrapped.__class__, setting=key,
+                                 value=getattr(settings, key, None))
     
     def template_context_processors(self):
         context._standard_context_processors = None
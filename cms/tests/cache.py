@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from __future__ import with_statement
+import threading
+import time
+from cms.cache import routing, singleflight
+from cms.cache.invalidation import deferred_invalidation
+from cms.cache.permissions import clear_permission_cache, get_cache_version
+from cms.cache.singleflight import acquire_lock, get_or_build, set_entry
+from cms.test_utils.testcases import CMSTestCase
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from menus.menu_pool import menu_pool, _get_generation_key
+
+
+class NoAddCache(LocMemCache):
+    """
+    A cache backend without atomic add.
+    """
+    def add(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+class SingleFlightTests(CMSTestCase):
+    def setUp(self):
+        cache.clear()
+        self._wait_interval = singleflight.WAIT_INTERVAL
+        singleflight.WAIT_INTERVAL = 0.01
+
+    def tearDown(self):
+        singleflight.WAIT_INTERVAL = self._wait_interval
+        singleflight.cache = cache
+        cache.clear()
+
+    def run_workers(self, build, count=8, key='singleflight-test', stale_key=None):
+        """
+        Runs ``count`` workers asking for the same key at the same time and
+        returns their results.
+        """
+        start = threading.Event()
+        results = []
+
+        def worker():
+            start.wait()
+            results.append(get_or_build(key, build, 60, stale_key=stale_key))
+
+        threads = [threading.Thread(target=worker) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def get_slow_build(self, calls, value='built'):
+        def build():
+            calls.append(1)
+            time.sleep(0.1)
+            return value
+        return build
+
+    def test_single_build_for_concurrent_workers(self):
+        calls = []
+        results = self.run_workers(self.get_slow_build(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['built'] * 8)
+
+    def test_stale_value_served_while_building(self):
+        calls = []
+        # an entry whose soft expiry has passed
+        cache.set('singleflight-test', (time.time() - 1, 'stale'), 60)
+        results = self.run_workers(self.get_slow_build(calls, 'fresh'))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results.count('fresh'), 1)
+        self.assertEqual(results.count('stale'), 7)
+        self.assertEqual(get_or_build('singleflight-test', self.get_slow_build(calls), 60), 'fresh')
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_key_served_for_new_key(self):
+        set_entry('singleflight-old', 'old', 60, stale_key='singleflight-latest')
+        release = acquire_lock('singleflight-new')
+        try:
+            value = get_or_build('singleflight-new', lambda: 'new', 60,
+                                 stale_key='singleflight-latest')
+        finally:
+            release()
+        self.assertEqual(value, 'old')
+        value = get_or_build('singleflight-new', lambda: 'new', 60,
+                             stale_key='singleflight-latest')
+        self.assertEqual(value, 'new')
+
+    def test_abandoned_lock(self):
+        release = acquire_lock('singleflight-test')
+        timer = threading.Timer(0.05, release)
+        timer.start()
+        self.assertEqual(get_or_build('singleflight-test', lambda: 'built', 60), 'built')
+        timer.join()
+
+    def test_none_not_cached(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+
+        self.assertEqual(get_or_build('singleflight-test', build, 60), None)
+        self.assertEqual(get_or_build('singleflight-test', build, 60), None)
+        self.assertEqual(len(calls), 2)
+
+    def test_local_lock_without_atomic_add(self):
+        singleflight.cache = NoAddCache('singleflight', {})
+        calls = []
+        results = self.run_workers(self.get_slow_build(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['built'] * 8)
+
+
+class DeferredInvalidationTests(CMSTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_flushed_once_by_outermost_block(self):
+        key = _get_generation_key(site_id=1)
+        cache.set(key, 10)
+        with deferred_invalidation():
+            menu_pool.clear(site_id=1)
+            with deferred_invalidation():
+                menu_pool.clear(1)
+                clear_permission_cache()
+                clear_permission_cache()
+            menu_pool.clear(site_id=1)
+            self.assertEqual(cache.get(key), 10)
+            self.assertEqual(get_cache_version(), 1)
+        self.assertEqual(cache.get(key), 11)
+        self.assertEqual(get_cache_version(), 2)
+
+    def test_flushed_on_error(self):
+        key = _get_generation_key(site_id=1)
+        cache.set(key, 10)
+        try:
+            with deferred_invalidation():
+                menu_pool.clear(site_id=1)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(cache.get(key), 11)
+        menu_pool.clear(site_id=1)
+        self.assertEqual(cache.get(key), 12)
+
+
+class GenerationTests(CMSTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_routing_version_bumped(self):
+        version = routing.get_cache_version(1)
+        self.assertEqual(routing.get_cache_version(1), version)
+        routing.clear_routing_cache(1)
+        self.assertEqual(routing.get_cache_version(1), version + 1)
+
+    def test_routing_version_not_reused_after_expiry(self):
+        version = routing.get_cache_version(1)
+        routing.clear_routing_cache(1)
+        cache.delete(routing.get_cache_version_key(1))
+        time.sleep(0.002)
+        self.assertTrue(routing.get_cache_version(1) > version + 1)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import with_statement
 import uuid
+from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core.management import CommandError
 from cms.models import Page, StaticPlaceholder
@@ -16,6 +17,7 @@ from cms.models.pluginmodel import CMSPlugin
 from cms.models.placeholdermodel import Placeholder
 from djangocms_text_ckeditor.cms_plugins import TextPlugin
 from cms.utils.compat.string_io import StringIO
+from cms.utils.plugins import get_placeholders
 
 
 APPHOOK = "SampleApp"
@@ -34,6 +36,16 @@ class ManagementTestCase(CMSTestCase):
             command.handle("list", "apphooks", interactive=False)
             self.assertEqual(out.getvalue(), "SampleApp\n")
 
+    def test_list_placeholders(self):
+        out = StringIO()
+        templates = (('col_two.html', 'two columns'),)
+        with SettingsOverride(CMS_TEMPLATES=templates):
+            command = cms.Command()
+            command.stdout = out
+            command.handle("list", "placeholders", interactive=False)
+        lines = ["col_two.html"] + ["    %s" % slot for slot in get_placeholders('col_two.html')]
+        self.assertEqual(out.getvalue(), "\n".join(lines) + "\n")
+
     def test_uninstall_apphooks_without_apphook(self):
         out = StringIO()
         command = cms.Command()
@@ -208,6 +220,28 @@ class ManagementTestCase(CMSTestCase):
                 len(text_plugins_report["unsaved_instances"]),
                 0)
 
+    def test_publish(self):
+        User.objects.create_superuser('djangocms', 'cms@example.com', '123456')
+        parent = create_page("parent", "nav_playground.html", "en")
+        create_page("child", "nav_playground.html", "en", parent=parent)
+        out = StringIO()
+        command = cms.Command()
+        command.stdout = out
+        command.handle("publish", "language=en")
+        self.assertEqual(Page.objects.public().published('en').count(), 2)
+        self.assertIn("published 2 pages", out.getvalue())
+
+    def test_publish_nested_pages(self):
+        User.objects.create_superuser('djangocms', 'cms@example.com', '123456')
+        parent = create_page("parent", "nav_playground.html", "en")
+        child = create_page("child", "nav_playground.html", "en", parent=parent)
+        out = StringIO()
+        command = cms.Command()
+        command.stdout = out
+        command.handle("publish", "page=%s" % child.pk, "page=%s" % parent.pk, "language=en")
+        self.assertEqual(Page.objects.public().published('en').count(), 2)
+        self.assertIn("published 2 pages", out.getvalue())
+
     def test_uninstall_plugins_without_plugin(self):
         out = StringIO()
         command = cms.Command()
@@ -1,27 +1,33 @@
 # -*- coding: utf-8 -*-
 from __future__ import with_statement
 import copy
+import pickle
+import time
 from django.db import connection
 from cms.api import create_page
-from cms.menu import CMSMenu, get_visible_pages
+from cms.cache.menu_snapshot import get_menu_snapshot, get_snapshot_pages
+from cms.menu import CMSMenu, get_visible_pages, get_snapshot_url
 from cms.models import Page
-from cms.models.permissionmodels import GlobalPagePermission, PagePermission
+from cms.models.permissionmodels import (GlobalPagePermission, PagePermission,
+    ACCESS_CHILDREN, ACCESS_PAGE_AND_DESCENDANTS)
 from cms.test_utils.fixtures.menus import (MenusFixture, SubMenusFixture, 
     SoftrootFixture, ExtendedMenusFixture)
+from cms.test_utils.runners import record_measurement
 from cms.test_utils.testcases import SettingsOverrideTestCase
 from cms.test_utils.util.context_managers import (SettingsOverride,
     LanguageOverride)
 from cms.test_utils.util.mock import AttributeObject
 from cms.utils import get_cms_setting
-from cms.utils.compat import DJANGO_1_5
 from cms.utils.i18n import force_language
+from cms.utils.permissions import get_view_restrictions
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, User, Permission, Group
 from django.contrib.sites.models import Site
 from django.template import Template, TemplateSyntaxError
 from django.utils.translation import activate
-from menus.base import NavigationNode
-from menus.menu_pool import menu_pool, _build_nodes_inner_for_one_menu
+from menus.base import Menu, NavigationNode, NodeList, index_reverse_ids, pack_nodes, unpack_nodes
+from menus.menu_pool import (menu_pool, _build_nodes_inner_for_one_menu, _build_tree,
+    _get_menu_cache_key)
 from menus.models import CacheKey
 from menus.utils import mark_descendants, find_selected, cut_levels
 from django.utils.unittest import skipUnless
@@ -181,16 +187,12 @@ class FixturesMenuTests(MenusFixture, BaseMenuTest):
     def test_show_menu_num_queries(self):
         context = self.get_context()
         # test standard show_menu
-        with self.assertNumQueries(5 if DJANGO_1_5 else 7):
+        with self.assertNumQueries(3):
             """
             The queries should be:
-                get all pages
+                get the public root pages
                 get all page permissions
                 get all titles
-                get the menu cache key
-                create a savepoint (in django>=1.6)
-                set the menu cache key
-                release the savepoint (in django>=1.6)
             """
             tpl = Template("{% load menu_tags %}{% show_menu %}")
             tpl.render(context)
@@ -198,11 +200,123 @@ class FixturesMenuTests(MenusFixture, BaseMenuTest):
     def test_show_menu_cache_key_leak(self):
         context = self.get_context()
         tpl = Template("{% load menu_tags %}{% show_menu %}")
-        self.assertEqual(CacheKey.objects.count(), 0)
         tpl.render(context)
-        self.assertEqual(CacheKey.objects.count(), 1)
         tpl.render(context)
-        self.assertEqual(CacheKey.objects.count(), 1)
+        self.assertEqual(CacheKey.objects.count(), 0)
+
+    def test_menu_cache_generations(self):
+        context = self.get_context()
+        request = context['request']
+        tpl = Template("{% load menu_tags %}{% show_menu %}")
+        tpl.render(context)
+        with self.assertNumQueries(0):
+            tpl.render(context)
+        key = _get_menu_cache_key(request, settings.SITE_ID, 'en')
+        menu_pool.clear(site_id=settings.SITE_ID, language='en')
+        self.assertNotEqual(key, _get_menu_cache_key(request, settings.SITE_ID, 'en'))
+        key = _get_menu_cache_key(request, settings.SITE_ID, 'en')
+        menu_pool.clear(site_id=settings.SITE_ID, language='de')
+        self.assertEqual(key, _get_menu_cache_key(request, settings.SITE_ID, 'en'))
+        menu_pool.clear(all=True)
+        self.assertNotEqual(key, _get_menu_cache_key(request, settings.SITE_ID, 'en'))
+
+    def test_menu_snapshot_cleared_with_menus(self):
+        site_id = settings.SITE_ID
+        get_menu_snapshot(site_id, 'en')
+        with self.assertNumQueries(0):
+            get_menu_snapshot(site_id, 'en')
+        page = self.get_page(1)
+        Page.objects.filter(pk=page.pk).update(in_navigation=False)
+        menu_pool.clear(site_id)
+        pages = get_snapshot_pages(get_menu_snapshot(site_id, 'en'))
+        self.assertFalse([p.in_navigation for p in pages if p.pk == page.pk][0])
+
+    def test_menu_snapshot_refreshed_on_publish(self):
+        site_id = settings.SITE_ID
+        snapshot = get_menu_snapshot(site_id, 'en')
+        ids = [page.pk for page in get_snapshot_pages(snapshot)]
+        self.assertEqual(len(ids), Page.objects.public().filter(
+            title_set__language='en', title_set__published=True).count())
+        public_parent = self.get_page(2)
+        page = create_page('New', 'nav_playground.html', 'en',
+                           parent=public_parent.publisher_public)
+        page.publish('en')
+        page = self.reload(page)
+        # the tree of the page was reloaded in the existing snapshot
+        with self.assertNumQueries(0):
+            snapshot = get_menu_snapshot(site_id, 'en')
+        pages = get_snapshot_pages(snapshot)
+        self.assertTrue(page.publisher_public_id in [p.pk for p in pages])
+        new = [p for p in pages if p.pk == page.publisher_public_id][0]
+        self.assertEqual(new.parent_id, public_parent.pk)
+        self.assertEqual(get_snapshot_url(new, self.get_pages_root()), page.get_absolute_url())
+        page.unpublish('en')
+        with self.assertNumQueries(0):
+            snapshot = get_menu_snapshot(site_id, 'en')
+        self.assertFalse(page.publisher_public_id in [p.pk for p in get_snapshot_pages(snapshot)])
+
+    def test_menu_not_built_from_snapshot_with_fallbacks(self):
+        # a page with a German title only, English falls back to German
+        create_page('Seite', 'nav_playground.html', 'de', published=True)
+        request = self.get_request(language='en')
+        menu = CMSMenu()
+        calls = []
+
+        def get_snapshot_nodes(*args):
+            calls.append(args)
+            return CMSMenu.get_snapshot_nodes(menu, *args)
+        menu.get_snapshot_nodes = get_snapshot_nodes
+        with force_language('en'):
+            nodes = menu.get_nodes(request)
+        self.assertEqual(calls, [])
+        lang_settings = copy.deepcopy(get_cms_setting('LANGUAGES'))
+        lang_settings[1][0]['hide_untranslated'] = True
+        with SettingsOverride(CMS_LANGUAGES=lang_settings):
+            with force_language('en'):
+                snapshot_nodes = menu.get_nodes(request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([(node.id, node.get_absolute_url()) for node in snapshot_nodes],
+                         [(node.id, node.get_absolute_url()) for node in nodes])
+
+    def test_get_nodes_reused_in_request(self):
+        request = self.get_request()
+        nodes = menu_pool.get_nodes(request)
+        with self.assertNumQueries(0):
+            again = menu_pool.get_nodes(request)
+        self.assertEqual([node.id for node in nodes], [node.id for node in again])
+        self.assertFalse(nodes[0] is again[0])
+        self.assertTrue(nodes[0].children)
+        nodes[0].children = []
+        nodes[0].selected = not nodes[0].selected
+        third = menu_pool.get_nodes(request)
+        self.assertTrue(third[0].children)
+        self.assertEqual(third[0].selected, again[0].selected)
+        self.assertTrue(third[0].children[0].parent is third[0])
+
+    def test_menu_cache_shared_by_permission_profile(self):
+        first_request = self.get_request()
+        first_request.user = self._create_user('first')
+        second_request = self.get_request()
+        second_request.user = self._create_user('second')
+        staff_request = self.get_request()
+        staff_request.user = self._create_user('staff', is_staff=True)
+        first_key = _get_menu_cache_key(first_request, settings.SITE_ID, 'en')
+        self.assertEqual(first_key, _get_menu_cache_key(second_request, settings.SITE_ID, 'en'))
+        self.assertNotEqual(first_key, _get_menu_cache_key(staff_request, settings.SITE_ID, 'en'))
+
+    def test_menu_cache_per_user_for_other_menus(self):
+        first_request = self.get_request()
+        first_request.user = self._create_user('first')
+        second_request = self.get_request()
+        second_request.user = self._create_user('second')
+        class UserMenu(Menu):
+            def get_nodes(self, request):
+                return []
+        menu_pool.menus['UserMenu'] = UserMenu()
+        first_key = _get_menu_cache_key(first_request, settings.SITE_ID, 'en')
+        self.assertNotEqual(first_key, _get_menu_cache_key(second_request, settings.SITE_ID, 'en'))
+        anonymous_key = _get_menu_cache_key(self.get_request(), settings.SITE_ID, 'en')
+        self.assertEqual(anonymous_key, _get_menu_cache_key(self.get_request(), settings.SITE_ID, 'en'))
 
     def test_menu_keys_duplicate_truncates(self):
         """
@@ -541,12 +655,54 @@ class MenuTests(BaseMenuTest):
 
     def test_build_nodes_inner_for_circular_menu(self):
         '''
-        TODO: 
-            To properly handle this test we need to have a circular dependency 
-            detection system.
-            Go nuts implementing it :)
+            node1 -> node2 -> node3 -> node1
+             node4
+            node5
         '''
-        pass
+        node1 = NavigationNode('Test1', '/test1/', 1, 3)
+        node2 = NavigationNode('Test2', '/test2/', 2, 1)
+        node3 = NavigationNode('Test3', '/test3/', 3, 2)
+        node4 = NavigationNode('Test4', '/test4/', 4, 1)
+        node5 = NavigationNode('Test5', '/test5/', 5, None)
+        nodes = [node1, node2, node3, node4, node5]
+
+        final_list, dangling, cyclic = _build_tree(nodes, 'Test')
+        self.assertEqual(final_list, [node5])
+        self.assertEqual(dangling, [])
+        self.assertEqual(set(cyclic), set([node1, node2, node3, node4]))
+        self.assertEqual(node1.children, [])
+
+    def test_build_nodes_inner_keeps_order(self):
+        '''
+        Children listed before their parent come after the ones listed after
+        it, just like with the old queue based implementation.
+        '''
+        child1 = NavigationNode('Child1', '/child1/', 1, 2)
+        parent = NavigationNode('Parent', '/parent/', 2)
+        child2 = NavigationNode('Child2', '/child2/', 3, 2)
+        root = NavigationNode('Root', '/root/', 4)
+        final_list = _build_nodes_inner_for_one_menu([child1, parent, child2, root], 'Test')
+        self.assertEqual(final_list, [parent, child2, root, child1])
+        self.assertEqual(parent.children, [child2, child1])
+
+    def test_build_nodes_inner_scaling(self):
+        '''
+        Benchmark: the worst case (every child listed before its parent) used
+        to be quadratic. The nodes built per second are reported by the timed
+        test runner (develop.py timed test), they should stay about the same
+        for all sizes.
+        '''
+        for size in (10000, 50000, 100000):
+            nodes = [NavigationNode('Test%s' % i, '/test%s/' % i, i, i + 1 if i < size else None)
+                     for i in range(1, size + 1)]
+            start = time.time()
+            final_list = _build_nodes_inner_for_one_menu(nodes, 'Test')
+            elapsed = time.time() - start
+            record_measurement('menu nodes/s building a %d node menu' % size,
+                               size / max(elapsed, 1e-6))
+            self.assertEqual(len(final_list), size)
+            self.assertEqual(final_list[0].id, size)
+            self.assertEqual(final_list[-1].id, 1)
 
     def test_build_nodes_inner_for_broken_menu(self):
         '''
@@ -569,6 +725,12 @@ class MenuTests(BaseMenuTest):
         menu_class_name = 'Test'
         nodes = [node1, node2, node3, node4, node5, ]
 
+        final_list, dangling, cyclic = _build_tree(list(nodes), menu_class_name)
+        self.assertEqual(set(dangling), set([node1, node2]))
+        self.assertEqual(cyclic, [])
+        for node in nodes:
+            node.parent = None
+            node.children = []
         final_list = _build_nodes_inner_for_one_menu(nodes, menu_class_name)
         self.assertEqual(len(final_list), 3)
         self.assertFalse(node1 in final_list)
@@ -586,6 +748,54 @@ class MenuTests(BaseMenuTest):
         self.assertEqual(node4.children, [node3])
         self.assertEqual(node5.children, [node4])
 
+    def test_pack_nodes(self):
+        tree, nodes = self._get_nodes()
+        flat = [node for node in nodes if node in tree]
+        packed = pickle.loads(pickle.dumps(pack_nodes(flat), pickle.HIGHEST_PROTOCOL))
+        unpacked = unpack_nodes(packed)
+        self.assertEqual([node.id for node in unpacked], [node.id for node in flat])
+        self.assertEqual([node.get_absolute_url() for node in unpacked], [node.url for node in flat])
+        self.assertEqual([child.id for child in unpacked[1].children], [3, 4])
+        self.assertTrue(unpacked[2].parent is unpacked[1])
+        self.assertEqual(unpacked[0].selected, flat[0].selected)
+        self.assertEqual(unpack_nodes([]), None)
+
+    def test_mark_selected_uses_url_index(self):
+        tree, nodes = self._get_nodes()
+        unpacked = unpack_nodes(pack_nodes(tree))
+        self.assertEqual(unpacked.url_index['/3/'].id, 3)
+        request = self.get_request('/3/some/sub/path/')
+        menu_pool._mark_selected(request, unpacked)
+        self.assertEqual([node.id for node in unpacked if node.selected], [3])
+        request = self.get_request('/other/')
+        menu_pool._mark_selected(request, unpacked)
+        self.assertEqual([node.id for node in unpacked if node.selected], [])
+        # plain lists of nodes get indexed on the fly
+        menu_pool._mark_selected(self.get_request('/4/'), tree)
+        self.assertEqual([node.id for node in tree if node.selected], [4])
+
+    def test_get_node_by_reverse_id(self):
+        tree, nodes = self._get_nodes()
+        tree[1].attr['reverse_id'] = 'hello'
+        self.assertEqual(index_reverse_ids(tree), {'hello': 1})
+        indexed = NodeList(tree)
+        indexed.reverse_id_index = index_reverse_ids(tree)
+        self.assertTrue(menu_pool.get_node_by_reverse_id(indexed, 'hello') is tree[1])
+        self.assertEqual(menu_pool.get_node_by_reverse_id(indexed, 'other'), None)
+        # plain lists of nodes are scanned
+        self.assertTrue(menu_pool.get_node_by_reverse_id(tree, 'hello') is tree[1])
+        self.assertEqual(menu_pool.get_node_by_reverse_id(tree, 'other'), None)
+
+    def test_navigation_node_slots(self):
+        node = NavigationNode('1', '/1/', 1)
+        self.assertFalse(hasattr(node, 'selected'))
+        node.selected = True
+        node.custom = 'value'
+        copied = pickle.loads(pickle.dumps(node, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(copied.selected, True)
+        self.assertEqual(copied.custom, 'value')
+        self.assertEqual(copy.copy(node).custom, 'value')
+
     def test_utils_mark_descendants(self):
         tree_nodes, flat_nodes = self._get_nodes()
         mark_descendants(tree_nodes)
@@ -801,16 +1011,12 @@ class ShowSubMenuCheck(SubMenusFixture, BaseMenuTest):
         context = self.get_context(page.get_absolute_url())
 
         # test standard show_menu
-        with self.assertNumQueries(5 if DJANGO_1_5 else 7):
+        with self.assertNumQueries(3):
             """
             The queries should be:
-                get all pages
+                get the public root pages
                 get all page permissions
                 get all titles
-                get the menu cache key
-                create a savepoint (in django>=1.6)
-                set the menu cache key
-                release the savepoint (in django>=1.6)
             """
             tpl = Template("{% load menu_tags %}{% show_sub_menu %}")
             tpl.render(context)
@@ -870,16 +1076,12 @@ class ShowMenuBelowIdTests(BaseMenuTest):
 
         with LanguageOverride('en'):
             context = self.get_context(a.get_absolute_url())
-            with self.assertNumQueries(5 if DJANGO_1_5 else 7):
+            with self.assertNumQueries(3):
                 """
                 The queries should be:
-                    get all pages
+                    get the public root pages
                     get all page permissions
                     get all titles
-                    get the menu cache key
-                    create a savepoint (in django>=1.6)
-                    set the menu cache key
-                    release the savepoint (in django>=1.6)
                 """
                 # Actually seems to run:
                 tpl = Template("{% load menu_tags %}{% show_menu_below_id 'a' 0 100 100 100 %}")
@@ -926,6 +1128,15 @@ class ViewPermissionMenuTests(SettingsOverrideTestCase):
             """
             get_visible_pages(request, pages)
 
+    def test_anonymous_does_not_read_site_from_request(self):
+        request = type('Request', (object,), {'user': AnonymousUser()})
+        page = Page()
+        page.pk = 1
+        page.level = 0
+        page.tree_id = 1
+        # the request has neither REQUEST nor session
+        self.assertEqual(get_visible_pages(request, [page]), [1])
+
     def test_public_for_all(self):
         user = User.objects.create_user('user', 'user@domain.com', 'user')
         request = self.get_request(user)
@@ -1127,10 +1338,31 @@ class ViewPermissionMenuTests(SettingsOverrideTestCase):
                 The queries are:
                 PagePermission query for affected pages
                 GlobalpagePermission query for user
-                Group query via PagePermission
+                Group ids of the user
                 """
                 get_visible_pages(request, pages)
 
+    def test_view_restrictions_descendants(self):
+        user = User.objects.create_user('user', 'user@domain.com', 'user')
+        page_a = create_page('A', 'nav_playground.html', 'en')
+        page_b = create_page('B', 'nav_playground.html', 'en', parent=page_a)
+        page_c = create_page('C', 'nav_playground.html', 'en', parent=page_b)
+        page_d = create_page('D', 'nav_playground.html', 'en')
+        PagePermission.objects.create(can_view=True, user=user, page=page_a,
+                                      grant_on=ACCESS_CHILDREN)
+        with self.assertNumQueries(2):
+            restrictions = get_view_restrictions(page_a.site_id)
+        self.assertEqual(sorted(restrictions), [page_b.pk])
+        self.assertEqual(restrictions[page_b.pk], [(user.pk, None)])
+        with self.assertNumQueries(0):
+            get_view_restrictions(page_a.site_id)
+        # saving a permission invalidates the cached restrictions
+        PagePermission.objects.create(can_view=True, user=user, page=page_a,
+                                      grant_on=ACCESS_PAGE_AND_DESCENDANTS)
+        restrictions = get_view_restrictions(page_a.site_id)
+        self.assertEqual(sorted(restrictions), [page_a.pk, page_b.pk, page_c.pk])
+        self.assertFalse(page_d.pk in restrictions)
+
     def test_global_permission(self):
         with SettingsOverride(CMS_PUBLIC_FOR='staff'):
             user = User.objects.create_user('user', 'user@domain.com', 'user')
@@ -9,6 +9,7 @@ from django.contrib.sites.models import Site
 from django.contrib import admin
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.http import HttpRequest, HttpResponse, HttpResponseNotFound
 from django.utils import timezone
 
@@ -29,6 +30,7 @@ from cms.test_utils.util.context_managers import (LanguageOverride, SettingsOver
 from cms.utils import get_cms_setting
 from cms.utils.page_resolver import get_page_from_request, is_valid_url
 from cms.utils.page import is_valid_page_slug, get_available_slug
+from cms.utils.plugins import reset_placeholders_cache
 
 
 class PageMigrationTestCase(CMSTestCase):
@@ -439,6 +441,7 @@ class PagesTestCase(CMSTestCase):
             )
             with open(path, 'w') as fobj:
                 fobj.write(new)
+            reset_placeholders_cache()
             response = self.client.get(url)
             self.assertEqual(200, response.status_code)
         finally:
@@ -615,6 +618,37 @@ class PagesTestCase(CMSTestCase):
         self.assertIsNotNone(found_page)
         self.assertFalse(found_page.publisher_is_draft)
 
+    def test_get_page_from_request_uses_routing_table(self):
+        root = create_page("root", "nav_playground.html", "en", slug="root",
+                           published=True)
+        page = create_page("page", "nav_playground.html", "en", slug="page",
+                           published=True, parent=root)
+        page.publish('en')
+        # warm up the routing table
+        get_page_from_request(self.get_request('/en/page/'))
+        with self.assertNumQueries(0):
+            found_page = get_page_from_request(self.get_request('/en/page/'))
+        self.assertEqual(found_page.pk, page.reload().publisher_public_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_page_from_request(self.get_request('/en/nope/')), None)
+        # every lookup gets an instance of its own
+        found_page.soft_root = True
+        self.assertFalse(get_page_from_request(self.get_request('/en/page/')).soft_root)
+        # saving the page drops the row kept with the table
+        public = page.reload().publisher_public
+        public.soft_root = True
+        public.save()
+        self.assertTrue(get_page_from_request(self.get_request('/en/page/')).soft_root)
+
+    def test_routing_table_invalidated_on_unpublish(self):
+        create_page("home", "nav_playground.html", "en", slug="home",
+                    published=True)
+        page = create_page("page", "nav_playground.html", "en", slug="page",
+                           published=True)
+        self.assertTrue(get_page_from_request(self.get_request('/en/page/')))
+        page.unpublish('en')
+        self.assertEqual(get_page_from_request(self.get_request('/en/page/')), None)
+
     def test_get_page_from_request_on_cms_admin_with_editplugin(self):
         page = create_page("page", "nav_playground.html", "en")
         request = self.get_request(
@@ -758,6 +792,39 @@ class PagesTestCase(CMSTestCase):
                 bar.publish('en')
             self.assertFalse(bar.is_published('en'))
 
+    def test_descendant_paths_rewritten(self):
+        create_page('home', 'nav_playground.html', 'en')
+        section = create_page('section', 'nav_playground.html', 'en')
+        child = create_page('child', 'nav_playground.html', 'en', parent=section)
+        grandchild = create_page('grandchild', 'nav_playground.html', 'en', parent=child)
+        custom = create_page('custom', 'nav_playground.html', 'en', parent=section, overwrite_url='custom/url')
+        below_custom = create_page('below', 'nav_playground.html', 'en', parent=custom)
+        german = create_page('german', 'nav_playground.html', 'de', parent=child)
+
+        def get_path(page, language='en'):
+            return Title.objects.get(page=page, language=language).path
+
+        german_path = get_path(german, 'de')
+        title = section.get_title_obj('en')
+        title.slug = 'renamed'
+        connection.use_debug_cursor = True
+        try:
+            del connection.queries[:]
+            title.save()
+        finally:
+            connection.use_debug_cursor = False
+        # the paths of the descendants are written with one update
+        self.assertEqual(len([query for query in connection.queries
+                              if query['sql'].startswith('UPDATE') and ' CASE ' in query['sql']]), 1)
+
+        self.assertEqual(get_path(section), 'renamed')
+        self.assertEqual(get_path(child), 'renamed/child')
+        self.assertEqual(get_path(grandchild), 'renamed/child/grandchild')
+        self.assertEqual(get_path(custom), 'custom/url')
+        self.assertEqual(get_path(below_custom), 'custom/url/below')
+        # other languages are left alone
+        self.assertEqual(get_path(german, 'de'), german_path)
+
     def test_valid_url_multisite(self):
         site1 = Site.objects.get_current()
         site3 = Site.objects.create(domain="sample3.com", name="sample3.com")
@@ -813,7 +880,8 @@ class PagesTestCase(CMSTestCase):
             # trigger the get_languages query so it doesn't get in our way
             context = self.get_context(page=page)
             context['request'].current_page.get_languages()
-            with self.assertNumQueries(4):
+            # one query for the plugins of all placeholders, one per plugin type
+            with self.assertNumQueries(3):
                 for i, placeholder in enumerate(placeholders):
                     content = get_placeholder_content(context, context['request'], page, placeholder.slot, False, None)
                     for j in range(5):
@@ -4,11 +4,13 @@ from django.utils.numberformat import format
 from django.db import models
 from cms import constants
 from cms.api import add_plugin, create_page, create_title
+from cms.cache.placeholder import get_placeholder_cache
 from cms.exceptions import DuplicatePlaceholderWarning
 from cms.models.fields import PlaceholderField
 from cms.models.placeholdermodel import Placeholder
 from cms.plugin_pool import plugin_pool
 from cms.plugin_rendering import render_placeholder
+from cms.signals import pre_save_plugin_placeholder
 from cms.plugins.link.cms_plugins import LinkPlugin
 from cms.utils.compat.tests import UnittestCompatMixin
 from djangocms_text_ckeditor.cms_plugins import TextPlugin
@@ -26,17 +28,18 @@ from cms.test_utils.util.context_managers import (SettingsOverride, UserLoginCon
 from cms.test_utils.util.mock import AttributeObject
 from cms.utils.compat.dj import force_unicode
 from cms.utils.placeholder import PlaceholderNoAction, MLNGPlaceholderActions
-from cms.utils.plugins import get_placeholders
+from cms.utils.plugins import get_placeholders, reset_placeholders_cache
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.models import User, Permission
 from cms.test_utils.project.objectpermissionsapp.models import UserObjectPermission
 from django.contrib.messages.storage import default_storage
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_started
 from django.core.urlresolvers import reverse
 from django.db.models import Model
 from django.http import HttpResponseForbidden, HttpResponse
-from django.template import TemplateSyntaxError, Template
+from django.template import TemplateSyntaxError, Template, TemplateDoesNotExist
 from django.template.context import Context, RequestContext
 from django.test import TestCase
 import itertools
@@ -86,7 +89,42 @@ class PlaceholderTestCase(CMSTestCase, UnittestCompatMixin):
         placeholders = get_placeholders('placeholder_tests/test_six.html')
         self.assertEqual(sorted(placeholders), sorted([u'new_one', u'new_two', u'new_three']))
 
+    def test_placeholder_scanning_memoized(self):
+        from cms.utils import plugins
+
+        reset_placeholders_cache()
+        placeholders = get_placeholders('placeholder_tests/test_one.html')
+
+        def get_template(template):
+            raise TemplateDoesNotExist(template)
+
+        original_get_template = plugins.get_template
+        plugins.get_template = get_template
+        try:
+            # the template is not loaded again
+            self.assertEqual(get_placeholders('placeholder_tests/test_one.html'), placeholders)
+            with SettingsOverride(DEBUG=True):
+                self.assertRaises(TemplateDoesNotExist, get_placeholders,
+                                  'placeholder_tests/test_one.html')
+        finally:
+            plugins.get_template = original_get_template
+
+    def test_placeholders_scanned_on_first_request(self):
+        from cms import startup
+        from cms.utils import plugins
+
+        request_started.connect(startup.warm_caches, dispatch_uid="cms.startup")
+        with SettingsOverride(CMS_TEMPLATES=(('col_two.html', 'two columns'),)):
+            request_started.send(sender=self.__class__)
+            self.assertTrue('col_two.html' in plugins._placeholders_cache)
+            # only the first request of the process scans the templates
+            reset_placeholders_cache()
+            request_started.send(sender=self.__class__)
+            self.assertFalse('col_two.html' in plugins._placeholders_cache)
+
     def test_placeholder_scanning_duplicate(self):
+        # the warning is only issued when the template is scanned
+        reset_placeholders_cache()
         placeholders = self.assertWarns(DuplicatePlaceholderWarning,
                                         'Duplicate {% placeholder "one" %} in template placeholder_tests/test_seven.html.',
                                         get_placeholders, 'placeholder_tests/test_seven.html')
@@ -421,6 +459,111 @@ class PlaceholderTestCase(CMSTestCase, UnittestCompatMixin):
             content = render_placeholder(placeholder, context)
             self.assertRegexpMatches(content, "^<p>en default body 1</p>\s*<p>en default body 2</p>$")
 
+    def test_plugins_prepopulate_current_draft_only(self):
+        """ Default plugins are not created in ancestors nor in public pages """
+        from cms.templatetags.cms_tags import _load_placeholders
+
+        conf = {
+            'col_left': {
+                'default_plugins': [
+                    {'plugin_type': 'TextPlugin', 'values': {'body': '<p>default body</p>'}},
+                ]
+            },
+        }
+        with SettingsOverride(CMS_PLACEHOLDER_CONF=conf):
+            parent = create_page('parent', 'col_two.html', 'en', published=True)
+            child = create_page('child', 'col_two.html', 'en', parent=parent)
+            request = self.get_request(language="en", page=child)
+            request.user = self.get_superuser()
+            context = Context({'request': request})
+            _load_placeholders(child, [child, parent.reload()], context)
+            self.assertEqual(child.placeholders.get(slot='col_left').cmsplugin_set.count(), 1)
+            self.assertEqual(parent.placeholders.get(slot='col_left').cmsplugin_set.count(), 0)
+
+            public = parent.reload().publisher_public
+            request = self.get_request(language="en", page=public)
+            request.user = self.get_superuser()
+            _load_placeholders(public, [public], Context({'request': request}))
+            self.assertEqual(public.placeholders.get(slot='col_left').cmsplugin_set.count(), 0)
+
+    def test_placeholder_cache(self):
+        class NoPushPopContext(Context):
+            def push(self):
+                pass
+
+            pop = push
+
+        page = create_page('page_en', 'col_two.html', 'en')
+        placeholder = page.placeholders.get(slot='col_left')
+        plugin = add_plugin(placeholder, TextPlugin, 'en', body='en body')
+        context = NoPushPopContext()
+        context['request'] = self.get_request(language="en", page=page)
+        with SettingsOverride(CMS_PLACEHOLDER_CACHE=True):
+            content = render_placeholder(placeholder, context)
+            self.assertRegexpMatches(content, "^en body$")
+            del(placeholder._plugins_cache)
+            with self.assertNumQueries(0):
+                content = render_placeholder(placeholder, context)
+            self.assertRegexpMatches(content, "^en body$")
+            # editing a plugin invalidates the cache
+            plugin.body = 'changed body'
+            plugin.save()
+            content = render_placeholder(placeholder, context)
+            self.assertRegexpMatches(content, "^changed body$")
+            # and so does adding one
+            del(placeholder._plugins_cache)
+            add_plugin(placeholder, TextPlugin, 'en', body='second body')
+            content = render_placeholder(placeholder, context)
+            self.assertRegexpMatches(content, "^changed body\s*second body$")
+            del(placeholder._plugins_cache)
+            TextPlugin.cache = False
+            try:
+                plugin.save()
+                render_placeholder(placeholder, context)
+                self.assertEqual(get_placeholder_cache(placeholder, 'en', context['request']), None)
+            finally:
+                del TextPlugin.cache
+
+    def test_placeholder_cache_plugin_moved(self):
+        page = create_page('page_en', 'col_two.html', 'en')
+        left = page.placeholders.get(slot='col_left')
+        right = page.placeholders.get(slot='col_sidebar')
+        add_plugin(left, TextPlugin, 'en', body='moved body')
+        context = Context({'request': self.get_request(language="en", page=page)})
+        with SettingsOverride(CMS_PLACEHOLDER_CACHE=True):
+            render_placeholder(left, context)
+            render_placeholder(right, context)
+            self.assertNotEqual(get_placeholder_cache(left, 'en', context['request']), None)
+            plugin = Text.objects.get(placeholder=left)
+            plugin.placeholder = right
+            # the old placeholder is known without asking the database
+            with self.assertNumQueries(0):
+                pre_save_plugin_placeholder(instance=plugin, raw=False)
+            plugin.save()
+            self.assertEqual(get_placeholder_cache(left, 'en', context['request']), None)
+            self.assertEqual(get_placeholder_cache(right, 'en', context['request']), None)
+
+    def test_rescan_placeholders_cached(self):
+        page = create_page('page_en', 'col_two.html', 'en', published=True)
+        slots = set(get_placeholders('col_two.html'))
+        self.assertEqual(set(page.rescan_placeholders()), slots)
+        page = page.reload()
+        with self.assertNumQueries(0):
+            found = page.rescan_placeholders()
+        self.assertEqual(set(found), slots)
+        self.assertEqual(set(ph.pk for ph in found.values()),
+                         set(page.placeholders.values_list('pk', flat=True)))
+        # missing placeholders are only created for drafts
+        public = page.get_public_object()
+        public.placeholders.filter(slot='col_left').delete()
+        public = public.reload()
+        self.assertFalse('col_left' in public.rescan_placeholders(create=False))
+        self.assertFalse(public.placeholders.filter(slot='col_left').exists())
+        page.placeholders.filter(slot='col_left').delete()
+        page = page.reload()
+        self.assertTrue('col_left' in page.rescan_placeholders())
+        self.assertEqual(page.placeholders.filter(slot='col_left').count(), 1)
+
     def test_placeholder_pk_thousands_format(self):
         page = create_page("page", "nav_playground.html", "en", published=True)
         for placeholder in page.placeholders.all():
@@ -13,7 +13,7 @@ from cms.plugin_base import CMSPluginBase
 from cms.plugin_pool import plugin_pool
 from cms.plugins.googlemap.models import GoogleMap
 from cms.plugins.inherit.cms_plugins import InheritPagePlaceholderPlugin
-from cms.plugins.utils import get_plugins_for_page
+from cms.plugins.utils import get_plugins_for_page, downcast_plugins
 from cms.plugins.file.models import File
 from cms.plugins.inherit.models import InheritPagePlaceholder
 from cms.plugins.link.forms import LinkForm
@@ -384,6 +384,76 @@ class PluginsTestCase(PluginsTestBaseCase):
         mcol1 = self.reload(mcol1)
         self.assertEquals(mcol1.get_descendants().count(), 2)
 
+    def test_copy_plugins_tree(self):
+        page_en = create_page("CopyPluginTestPage (EN)", "nav_playground.html", "en")
+        page_de = create_page("CopyPluginTestPage (DE)", "nav_playground.html", "de")
+        ph_en = page_en.placeholders.get(slot="body")
+        ph_de = page_de.placeholders.get(slot="body")
+        mcol1 = add_plugin(ph_en, "MultiColumnPlugin", "en")
+        col1 = add_plugin(ph_en, "ColumnPlugin", "en", target=mcol1)
+        col2 = add_plugin(ph_en, "ColumnPlugin", "en", target=mcol1)
+        add_plugin(ph_en, "LinkPlugin", "en", target=col1, name="A Link", url="https://www.django-cms.org")
+        add_plugin(ph_en, "LinkPlugin", "en", target=self.reload(col2), name="B Link", url="https://www.django-cms.org")
+        add_plugin(ph_en, "MultiColumnPlugin", "en")
+        old_plugins = ph_en.get_plugins_list()
+        ziplist = copy_plugins_to(old_plugins, ph_de, 'de')
+        self.assertEqual([old.pk for new, old in ziplist], [plugin.pk for plugin in old_plugins])
+        copies = dict((new.pk, old) for new, old in ziplist)
+        new_pks = dict((old.pk, new.pk) for new, old in ziplist)
+        new_plugins = ph_de.get_plugins_list()
+        self.assertEqual(len(new_plugins), 6)
+        for new in new_plugins:
+            old = copies[new.pk]
+            self.assertEqual(new.language, 'de')
+            self.assertEqual(new.parent_id, new_pks.get(old.parent_id))
+            self.assertEqual((new.level, new.lft, new.rght, new.position),
+                             (old.level, old.lft, old.rght, old.position))
+        self.assertEqual(len(set(new.tree_id for new in new_plugins)), 2)
+        self.assertEqual(sorted(Link.objects.filter(placeholder=ph_de).values_list('name', flat=True)),
+                         ["A Link", "B Link"])
+        # the tree stays usable
+        mcol = new_plugins[0]
+        self.assertEqual(mcol.get_descendants().count(), 4)
+        add_plugin(ph_de, "ColumnPlugin", "de", target=mcol)
+        self.assertEqual(self.reload(mcol).get_descendants().count(), 5)
+
+    def test_copy_plugins_queries(self):
+        page_en = create_page("CopyPluginTestPage (EN)", "nav_playground.html", "en")
+        page_de = create_page("CopyPluginTestPage (DE)", "nav_playground.html", "de")
+        ph_en = page_en.placeholders.get(slot="body")
+        ph_de = page_de.placeholders.get(slot="body")
+        for i in range(20):
+            add_plugin(ph_en, "LinkPlugin", "en", name="Link %s" % i, url="https://www.django-cms.org")
+        plugins = ph_en.get_plugins_list()
+        # the lock and the next tree_id, the CMSPlugin rows and their pks, the
+        # Link rows of the originals and of the copies
+        with self.assertNumQueries(6):
+            copy_plugins_to(plugins, ph_de, 'de')
+        self.assertEqual(Link.objects.filter(placeholder=ph_de).count(), 20)
+
+    def test_copy_plugins_calls_own_save(self):
+        page_en = create_page("CopyPluginTestPage (EN)", "nav_playground.html", "en")
+        page_de = create_page("CopyPluginTestPage (DE)", "nav_playground.html", "de")
+        ph_en = page_en.placeholders.get(slot="body")
+        ph_de = page_de.placeholders.get(slot="body")
+        add_plugin(ph_en, "TextPlugin", "en", body="Hello World")
+        add_plugin(ph_en, "LinkPlugin", "en", name="A Link", url="https://www.django-cms.org")
+        saved = []
+
+        def save(instance, *args, **kwargs):
+            saved.append(instance)
+            super(Text, instance).save(*args, **kwargs)
+
+        Text.save = save
+        try:
+            copy_plugins_to(ph_en.get_plugins_list(), ph_de, 'de')
+        finally:
+            del Text.save
+        # post_copy of the text plugin saves it again
+        self.assertEqual(set(text.placeholder_id for text in saved), set([ph_de.pk]))
+        self.assertEqual(Text.objects.get(placeholder=ph_de).body, "Hello World")
+        self.assertEqual(Link.objects.filter(placeholder=ph_de).count(), 1)
+
 
 
     def test_remove_plugin_before_published(self):
@@ -1266,6 +1336,18 @@ class PluginManyToManyTestCase(PluginsTestBaseCase):
         self.assertEqual(expected, db_counts)
 
 
+    def test_publish_plugin_with_changed_m2m(self):
+        page = create_page("page", "nav_playground.html", "en", published=True)
+        placeholder = page.placeholders.get(slot='body')
+        plugin = add_plugin(placeholder, "ArticlePlugin", "en", title="Articles")
+        plugin.sections = self.sections[:1]
+        page.publish('en')
+        # changing the relations doesn't touch the plugin
+        plugin.sections = self.sections
+        page.publish('en')
+        public = ArticlePluginModel.objects.get(placeholder__page=page.reload().publisher_public)
+        self.assertEqual(public.sections.count(), self.section_count)
+
 class PluginsMetaOptionsTests(TestCase):
     ''' TestCase set for ensuring that bugs like #992 are caught '''
 
@@ -1372,6 +1454,17 @@ class LinkPluginTestCase(PluginsTestBaseCase):
             'url': 'http://www.nonexistant.test', 'target': 'artificial'})
         self.assertFalse(form.is_valid())
 
+    def test_page_link_selected_with_plugin(self):
+        page = create_page('link target', 'nav_playground.html', 'en')
+        placeholder = page.placeholders.get(slot='body')
+        add_plugin(placeholder, 'LinkPlugin', 'en', name='page link', page_link=page)
+        plugins = list(CMSPlugin.objects.filter(placeholder=placeholder))
+        with self.assertNumQueries(1):
+            link = downcast_plugins(plugins, [placeholder])[0]
+        with self.assertNumQueries(0):
+            self.assertEqual(link.page_link.pk, page.pk)
+            self.assertEqual(link.placeholder, placeholder)
+
 
 class NoDatabasePluginTests(TestCase):
     def test_render_meta_is_unique(self):
@@ -4,13 +4,15 @@ from cms.constants import PUBLISHER_STATE_PENDING, PUBLISHER_STATE_DEFAULT, PUBL
 from django.contrib.auth.models import User
 from django.core.management.base import CommandError
 from django.core.urlresolvers import reverse
+from django.db.models import signals
 
-from cms.api import create_page, add_plugin, create_title
+from cms.api import create_page, add_plugin, create_title, publish_tree
 from cms.management.commands import publisher_publish
 from cms.models import CMSPlugin, Title
 from cms.models.pagemodel import Page
+from djangocms_text_ckeditor.models import Text
 from cms.test_utils.testcases import SettingsOverrideTestCase as TestCase
-from cms.test_utils.util.context_managers import StdoutOverride
+from cms.test_utils.util.context_managers import StdoutOverride, SettingsOverride
 
 
 class PublisherCommandTests(TestCase):
@@ -222,6 +224,28 @@ class PublishingTests(TestCase):
             self.assertObjectExist(public, title_set__title=name)
             self.assertObjectExist(published, title_set__title=name)
 
+    def test_publish_tree(self):
+        parent = self.create_page('parent', published=False)
+        child = self.create_page('child', published=False, parent=parent)
+        grandchild = self.create_page('grandchild', published=False, parent=child)
+        superuser = self.get_superuser()
+        # nothing is published yet, so there is nothing to republish
+        self.assertEqual(publish_tree(parent, superuser), [])
+
+        report = publish_tree(parent, superuser, ['en'])
+        self.assertEqual([page.pk for page, languages, seconds in report], [parent.pk, child.pk, grandchild.pk])
+        self.assertEqual([languages for page, languages, seconds in report], [['en'], ['en'], ['en']])
+        drafts = Page.objects.drafts()
+        published = Page.objects.public().published('en')
+        for name in ('parent', 'child', 'grandchild'):
+            page = drafts.get(title_set__title=name)
+            self.assertEqual(page.get_publisher_state('en'), PUBLISHER_STATE_DEFAULT, name)
+            self.assertObjectExist(published, title_set__title=name)
+
+        # republishing goes through the published languages
+        report = publish_tree(child, superuser)
+        self.assertEqual([page.pk for page, languages, seconds in report], [child.pk, grandchild.pk])
+
     def test_simple_publisher(self):
         """
         Creates the stuff needed for these tests.
@@ -604,6 +628,67 @@ class PublishingTests(TestCase):
         self.assertEquals(plugins[0].body, "Deleted content")
         self.assertEquals(plugins[1].body, "Public content")
 
+    def test_publish_changed_plugins_only(self):
+        with SettingsOverride(CMS_INCREMENTAL_PUBLISH=True):
+            page = create_page("Page", "nav_playground.html", "en", published=True)
+            placeholder = page.placeholders.get(slot=u"body")
+            add_plugin(placeholder, u"TextPlugin", u"en", body="First")
+            second = add_plugin(placeholder, u"TextPlugin", u"en", body="Second")
+            add_plugin(placeholder, u"TextPlugin", u"en", body="Third")
+            page.publish('en')
+            page = self.reload(page)
+            public_placeholder = page.publisher_public.placeholders.get(slot=u"body")
+
+            def get_public_texts():
+                return dict((text.body, (text.pk, text.position))
+                            for text in Text.objects.filter(placeholder=public_placeholder))
+
+            published = get_public_texts()
+            self.assertEqual(sorted(published), ["First", "Second", "Third"])
+
+            second.body = "Second changed"
+            second.save()
+            page.publish('en')
+            republished = get_public_texts()
+            self.assertEqual(sorted(republished), ["First", "Second changed", "Third"])
+            self.assertEqual(republished["First"], published["First"])
+            self.assertEqual(republished["Third"], published["Third"])
+            self.assertNotEqual(republished["Second changed"][0], published["Second"][0])
+            self.assertEqual(republished["Second changed"][1], published["Second"][1])
+
+            Text.objects.get(placeholder=placeholder, body="First").delete()
+            page = self.reload(page)
+            page.publish('en')
+            drafts = dict((text.body, text.position) for text in Text.objects.filter(placeholder=placeholder))
+            republished = get_public_texts()
+            self.assertEqual(sorted(republished), ["Second changed", "Third"])
+            for body, position in drafts.items():
+                self.assertEqual(republished[body][1], position)
+
+    def test_publish_all_plugins(self):
+        page = create_page("Page", "nav_playground.html", "en", published=True)
+        placeholder = page.placeholders.get(slot=u"body")
+        add_plugin(placeholder, u"TextPlugin", u"en", body="First")
+        page.publish('en')
+        page = self.reload(page)
+        public_pks = list(page.publisher_public.placeholders.get(slot=u"body").get_plugins().values_list('pk', flat=True))
+        deleted = []
+
+        def plugin_deleted(instance, **kwargs):
+            deleted.append(instance.pk)
+
+        # the public plugins are replaced even if they did not change (sqlite
+        # may give the copy the pk of the plugin it replaces)
+        signals.post_delete.connect(plugin_deleted, sender=CMSPlugin)
+        try:
+            page.publish('en')
+        finally:
+            signals.post_delete.disconnect(plugin_deleted, sender=CMSPlugin)
+        self.assertEqual(deleted, public_pks)
+        self.assertEqual(
+            [text.body for text in Text.objects.filter(placeholder__page=page.publisher_public)],
+            ["First"])
+
     def test_revert_move(self):
         parent = create_page("Parent", "nav_playground.html", "en", published=True)
         parent_url = parent.get_absolute_url()
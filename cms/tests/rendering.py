@@ -1,19 +1,28 @@
 # -*- coding: utf-8 -*-
 from __future__ import with_statement
+import threading
+import time
 from cms import plugin_rendering
 from cms.api import create_page, add_plugin
 from cms.models.placeholdermodel import Placeholder
 from cms.models.pluginmodel import CMSPlugin
-from cms.plugin_rendering import render_plugins, PluginContext, render_placeholder_toolbar
+from cms.plugin_base import CMSPluginBase
+from cms.plugin_pool import plugin_pool
+from cms.plugin_rendering import (render_plugins, PluginContext, render_placeholder_toolbar,
+                                  render_concurrently)
+from cms.plugins.utils import downcast_plugins
+from cms.templatetags.cms_tags import _get_placeholder
+from cms.test_utils.runners import record_measurement
 from cms.test_utils.testcases import SettingsOverrideTestCase
 from cms.test_utils.util.context_managers import SettingsOverride, ChangeModel
 from cms.test_utils.util.mock import AttributeObject
 from django.contrib.auth.models import User
-from django.template import Template, RequestContext
+from django.template import Template, Context, RequestContext, TemplateDoesNotExist
 from sekizai.context import SekizaiContext
 from cms.toolbar.toolbar import CMSToolbar
 
 TEMPLATE_NAME = 'tests/rendering/base.html'
+INHERIT_TEMPLATE_NAME = 'tests/rendering/inherit.html'
 
 
 def sample_plugin_processor(instance, placeholder, rendered_content, original_context):
@@ -180,6 +189,122 @@ class RenderingTestCase(SettingsOverrideTestCase):
                                     'text_main'] + '|main|original_context_var_ok')
             plugin_rendering._standard_processors = {}
 
+    def test_processors_loaded_once(self):
+        """
+        Renders a placeholder with 200 plugins, the processors are only
+        imported for the first one. Run with "develop.py timed test" to see
+        the plugins rendered per second with per plugin imports and with the
+        imports kept.
+        """
+        placeholder = self.test_placeholders['main']
+        for index in range(199):
+            add_plugin(placeholder, 'TextPlugin', 'en', body='plugin %s' % index)
+        plugins = downcast_plugins(CMSPlugin.objects.filter(placeholder=placeholder, language='en'))
+        self.assertEqual(len(plugins), 200)
+        loaded = []
+        original_iterload_objects = plugin_rendering.iterload_objects
+
+        def iterload_objects(import_paths):
+            loaded.append(import_paths)
+            return original_iterload_objects(import_paths)
+
+        def render(reset):
+            context = Context({'original_context_var': 'original_context_var_ok'})
+            plugin_rendering.reset_processors_cache()
+            start = time.time()
+            for plugin in plugins:
+                if reset:
+                    plugin_rendering.reset_processors_cache()
+                plugin.render_plugin(context, placeholder)
+            return len(plugins) / (time.time() - start)
+
+        plugin_rendering.iterload_objects = iterload_objects
+        try:
+            with SettingsOverride(
+                    CMS_PLUGIN_PROCESSORS=('cms.tests.rendering.sample_plugin_processor',),
+                    CMS_PLUGIN_CONTEXT_PROCESSORS=('cms.tests.rendering.sample_plugin_context_processor',),
+            ):
+                record_measurement('plugins/s importing the processors per plugin', render(reset=True))
+                self.assertEqual(len(loaded), 400)
+                del loaded[:]
+                record_measurement('plugins/s importing the processors once', render(reset=False))
+                self.assertEqual(len(loaded), 2)
+        finally:
+            plugin_rendering.iterload_objects = original_iterload_objects
+        # the chains are reloaded when the settings change
+        self.assertEqual(plugin_rendering.get_processors('PLUGIN_PROCESSORS'), ())
+
+    def test_plugin_templates_cached(self):
+        instance, plugin = CMSPlugin.objects.all()[0].get_plugin_instance()
+        plugin_rendering.reset_templates_cache()
+        context = Context({})
+        content = instance.render_plugin(context, self.test_placeholders['main'])
+
+        def get_template(template):
+            raise TemplateDoesNotExist(template)
+
+        original_get_template = plugin_rendering.loader.get_template
+        plugin_rendering.loader.get_template = get_template
+        try:
+            # the template is not loaded again
+            self.assertEqual(instance.render_plugin(context, self.test_placeholders['main']), content)
+            with SettingsOverride(DEBUG=True):
+                self.assertRaises(TemplateDoesNotExist, instance.render_plugin,
+                                  context, self.test_placeholders['main'])
+        finally:
+            plugin_rendering.loader.get_template = original_get_template
+
+    def test_concurrent_placeholder_rendering(self):
+        rendering_threads = []
+
+        class ContextPlugin(CMSPluginBase):
+            model = CMSPlugin
+            render_template = Template(
+                u'{% load sekizai_tags %}{{ label }}-{{ plugin.counter }}'
+                u'{% addtoblock "js" %}<script>{{ label }}</script>{% endaddtoblock %}')
+
+            def render(self, context, instance, placeholder):
+                rendering_threads.append(threading.current_thread())
+                return context
+
+        template = (u'{% load cms_tags sekizai_tags %}{% render_block "js" %}|'
+                    u'{% with "with" as label %}{% placeholder "main" %}{% endwith %}|'
+                    u'{% for label in labels %}{% placeholder "sub" %}{% endfor %}|'
+                    u'{% addtoblock "js" %}<script>template</script>{% endaddtoblock %}'
+                    u'{% placeholder "main" %}|{% placeholder "empty" %}')
+
+        def render(template, threads):
+            del rendering_threads[:]
+            with SettingsOverride(CMS_PLACEHOLDER_RENDERING_THREADS=threads):
+                context = self.get_context(self.reload(page.publisher_public), {'labels': ['first', 'second']})
+                content = render_concurrently(context['request'], lambda: Template(template).render(context))
+            return self.strip_rendered(content), set(rendering_threads)
+
+        plugin_pool.register_plugin(ContextPlugin)
+        try:
+            page = self.test_page.publisher_draft
+            add_plugin(self.test_placeholders['main'], ContextPlugin, 'en')
+            add_plugin(self.test_placeholders['sub'], ContextPlugin, 'en')
+            page.publish('en')
+            serial, threads = render(template, 0)
+            self.assertEqual(threads, set([threading.current_thread()]))
+            self.assertEqual(serial, u'<script>with</script><script>first</script><script>second</script>'
+                                     u'<script>template</script><script></script>|'
+                                     u'RenderingTestCase-mainwith-2|'
+                                     u'RenderingTestCase-subfirst-2RenderingTestCase-subsecond-2|'
+                                     u'RenderingTestCase-main-2|')
+            concurrent, threads = render(template, 2)
+            self.assertEqual(concurrent, serial)
+            self.assertFalse(threading.current_thread() in threads)
+            # the upper filter changes the marker, the template is rendered
+            # again without the pool
+            filtered = u'{% load cms_tags %}{% filter upper %}{% placeholder "main" %}{% endfilter %}'
+            self.assertEqual(render(filtered, 2)[0], render(filtered, 0)[0])
+            ContextPlugin.thread_safe = False
+            self.assertEqual(render(template, 2), (serial, set([threading.current_thread()])))
+        finally:
+            plugin_pool.unregister_plugin(ContextPlugin)
+
     def test_placeholder(self):
         """
         Tests the {% placeholder %} templatetag.
@@ -304,6 +429,20 @@ class RenderingTestCase(SettingsOverrideTestCase):
         r = self.render(t, self.test_page3)
         self.assertEqual(r, u'|' + self.test_data['text_main'] + '|' + self.test_data3['text_sub'])
 
+    def test_inherit_placeholder_single_pass(self):
+        page = self.test_page3
+        page.template = INHERIT_TEMPLATE_NAME
+        context = self.get_context(page)
+        # the parent pages are loaded with the current page
+        _get_placeholder(page, page, context, 'sub')
+        pages = (self.test_page, self.test_page2, page)
+        self.assertEqual(set(page._tmp_placeholders_cache), set(p.pk for p in pages))
+        for p in pages:
+            self.assertTrue(hasattr(page._tmp_placeholders_cache[p.pk]['main'], '_plugins_cache'))
+        with self.assertNumQueries(0):
+            placeholder = _get_placeholder(page, self.test_page, context, 'main')
+        self.assertEqual(placeholder._plugins_cache[0].body, self.test_data['text_main'])
+
     def test_extra_context_isolation(self):
         with ChangeModel(self.test_page, template='extra_context.html'):
             response = self.client.get(self.test_page.get_absolute_url())
@@ -5,13 +5,16 @@ from cms.toolbar.toolbar import CMSToolbar
 from django.test import RequestFactory, TestCase
 import os
 from cms.api import create_page, create_title, add_plugin
+from cms.cache.reverse_ids import get_reverse_id_url
 from cms.models.pagemodel import Page, Placeholder
 from djangocms_text_ckeditor.cms_plugins import TextPlugin
+from cms.templatetags import cms_tags
 from cms.templatetags.cms_tags import _get_page_by_untyped_arg, _show_placeholder_for_page, _get_placeholder
 from cms.test_utils.fixtures.templatetags import TwoPagesFixture
 from cms.test_utils.testcases import SettingsOverrideTestCase
 from cms.test_utils.util.context_managers import SettingsOverride
 from cms.utils import get_cms_setting, get_site_id
+from cms.utils.i18n import force_language
 from cms.utils.plugins import get_placeholders
 from django.contrib.sites.models import Site
 from django.core import mail
@@ -92,6 +95,17 @@ class TemplatetagDatabaseTests(TwoPagesFixture, SettingsOverrideTestCase):
         page = _get_page_by_untyped_arg(control.pk, request, 1)
         self.assertEqual(page, control.publisher_draft)
 
+    def test_get_page_by_pk_arg_edit_mode_without_draft(self):
+        control = self._getfirst()
+        Page.objects.filter(pk=control.publisher_public_id).update(publisher_public=None)
+        request = self.get_request('/')
+        request.session['cms_edit'] = True
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        with SettingsOverride(SEND_BROKEN_LINK_EMAILS=True, DEBUG=False,
+                              MANAGERS=[("Jenkins", "tests@django-cms.org")]):
+            self.assertEqual(_get_page_by_untyped_arg(control.pk, request, 1), None)
+        self.assertEqual(len(mail.outbox), 0)
+
     def test_get_page_by_untyped_arg_page(self):
         control = self._getfirst()
         request = self.get_request('/')
@@ -110,6 +124,60 @@ class TemplatetagDatabaseTests(TwoPagesFixture, SettingsOverrideTestCase):
         page = _get_page_by_untyped_arg({'pk': second.pk}, request, 1)
         self.assertEqual(page, second)
 
+    def test_get_page_by_untyped_arg_shared_lookups(self):
+        first = self._getfirst()
+        second = self._getsecond()
+        request = self.get_request('/')
+        # warm up the page index
+        _get_page_by_untyped_arg(second.pk, self.get_request('/'), 1)
+        self.assertEqual(_get_page_by_untyped_arg("myreverseid", request, 1), second)
+        with self.assertNumQueries(0):
+            self.assertEqual(_get_page_by_untyped_arg({'pk': second.pk}, request, 1), second)
+        with self.assertNumQueries(1):
+            self.assertEqual(_get_page_by_untyped_arg(first.pk, request, 1), first)
+        with self.assertNumQueries(0):
+            self.assertEqual(_get_page_by_untyped_arg(first.pk, request, 1), first)
+            self.assertEqual(_get_page_by_untyped_arg("myreverseid", request, 1), second)
+
+    def test_reverse_id_table_read_once_per_request(self):
+        second = self._getsecond()
+        request = self.get_request('/')
+        context = Context({'request': request})
+        template = Template("{% load cms_tags %}{% page_url 'myreverseid' %}")
+        reads = []
+        get_reverse_id_table = cms_tags.get_reverse_id_table
+
+        def counting_get_reverse_id_table(site_id):
+            reads.append(site_id)
+            return get_reverse_id_table(site_id)
+
+        cms_tags.get_reverse_id_table = counting_get_reverse_id_table
+        try:
+            self.assertEqual(_get_page_by_untyped_arg("myreverseid", request, 1), second)
+            self.assertEqual(_get_page_by_untyped_arg("nothere", request, 1), None)
+            with force_language('en'):
+                self.assertEqual(template.render(context), second.get_absolute_url('en'))
+        finally:
+            cms_tags.get_reverse_id_table = get_reverse_id_table
+        self.assertEqual(reads, [1])
+
+    def test_page_url_reverse_id_table(self):
+        second = self._getsecond()
+        request = self.get_request('/')
+        context = Context({'request': request})
+        template = Template("{% load cms_tags %}{% page_url 'myreverseid' %}")
+        with force_language('en'):
+            url = second.get_absolute_url('en')
+            # warm up the reverse_id table
+            self.assertEqual(get_reverse_id_url(1, 'myreverseid', 'en'), url)
+            with self.assertNumQueries(0):
+                self.assertEqual(template.render(context), url)
+            second.publisher_draft.reverse_id = 'otherreverseid'
+            second.publisher_draft.save()
+            second.publisher_draft.publish('en')
+            self.assertEqual(get_reverse_id_url(1, 'myreverseid', 'en'), None)
+            self.assertEqual(get_reverse_id_url(1, 'otherreverseid', 'en'), url)
+
     def test_get_page_by_untyped_arg_dict_fail_debug(self):
         with SettingsOverride(DEBUG=True):
             request = self.get_request('/')
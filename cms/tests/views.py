@@ -5,6 +5,7 @@ import re
 from django.contrib.auth.models import Permission
 from cms.api import create_page
 from cms.apphook_pool import apphook_pool
+from cms.cache.page import get_page_cache, is_cacheable_request, set_page_uncacheable
 from cms.models import PagePermission
 from cms.test_utils.testcases import SettingsOverrideTestCase
 from cms.test_utils.util.context_managers import SettingsOverride
@@ -151,3 +152,50 @@ class ViewTests(SettingsOverrideTestCase):
         PagePermission.objects.create(can_change=True, user=user, page=page)
         response = self.client.get("/en/?edit")
         self.assertContains(response, "cms_toolbar-item_switch", 4, 200)
+
+    def test_page_cache(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        page = create_page("page", "nav_playground.html", "en", published=True)
+        with SettingsOverride(CMS_PAGE_CACHE=True):
+            request = self.get_request('/en/')
+            response = details(request, '')
+            response.render()
+            self.assertEqual(response.status_code, 200)
+            request = self.get_request('/en/')
+            with self.assertNumQueries(0):
+                cached = details(request, '')
+            self.assertEqual(cached.content, response.content)
+            # only plain requests use the cache
+            request = self.get_request('/en/?preview')
+            self.assertFalse(is_cacheable_request(request))
+            request = self.get_request('/en/')
+            request.user = self.get_superuser()
+            self.assertFalse(is_cacheable_request(request))
+            # publishing invalidates the cache
+            title = page.title_set.get(language='en')
+            title.title = 'changed title'
+            title.save()
+            page.publish('en')
+            request = self.get_request('/en/')
+            self.assertEqual(get_page_cache(request, 'en'), None)
+
+    def test_page_cache_invalidation_and_opt_out(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        page = create_page("page", "nav_playground.html", "en", published=True)
+        with SettingsOverride(CMS_PAGE_CACHE=True):
+            details(self.get_request('/en/'), '').render()
+            self.assertNotEqual(get_page_cache(self.get_request('/en/'), 'en'), None)
+            # view restrictions invalidate the cache
+            permission = PagePermission.objects.create(can_view=True, user=self.get_superuser(),
+                                                       page=page)
+            self.assertEqual(get_page_cache(self.get_request('/en/'), 'en'), None)
+            permission.delete()
+            # the output of plugins opting out of the cache is not stored
+            request = self.get_request('/en/')
+            set_page_uncacheable(request)
+            details(request, '').render()
+            self.assertEqual(get_page_cache(self.get_request('/en/'), 'en'), None)
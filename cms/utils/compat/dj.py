@@ -13,4 +13,9 @@ try:
         return klass
 except ImportError:
     force_unicode = lambda s: str(s)
-    from django.utils.encoding import python_2_unicode_compatible
\ No newline at end of file
+    from django.utils.encoding import python_2_unicode_compatible
+try:
+    # setting_changed moved out of django.test in Django 1.8
+    from django.core.signals import setting_changed
+except ImportError:
+    from django.test.signals import setting_changed
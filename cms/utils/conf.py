@@ -52,6 +52,10 @@ DEFAULTS = {
     'UNIHANDECODE_DECODERS': ['ja', 'zh', 'kr', 'vn', 'diacritic'],
     'UNIHANDECODE_DEFAULT_DECODER': 'diacritic',
     'MAX_PAGE_PUBLISH_REVERSIONS': 25,
+    'PLACEHOLDER_CACHE': False,
+    'PAGE_CACHE': False,
+    'PLACEHOLDER_RENDERING_THREADS': 0,
+    'INCREMENTAL_PUBLISH': False,
 }
 
 
@@ -1,36 +1,377 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict
+from hashlib import md5
 
+from cms.utils.compat import DJANGO_1_5
+from cms.utils.compat.dj import force_unicode
+from django.db import router, transaction
+from django.db.models import Max
+
+# rows per INSERT statement, well below the 999 variables sqlite accepts
+INSERT_BATCH_SIZE = 50
+
+
+def _get_known_plugins(plugin_list):
+    """
+    Leaves out the plugins whose type is not registered anymore, together
+    with their children.
+    """
+    from cms.plugin_pool import plugin_pool
+
+    known = []
+    skipped = set()
+    for plugin in plugin_list:
+        if plugin.parent_id in skipped:
+            skipped.add(plugin.pk)
+            continue
+        try:
+            plugin_pool.get_plugin(plugin.plugin_type)
+        except KeyError:  # plugin type not found anymore
+            skipped.add(plugin.pk)
+            continue
+        known.append(plugin)
+    return known
+
+
+def _get_instances(plugin_list):
+    """
+    Returns the plugin instances of the plugins by pk, with one query per
+    plugin model. Plugins without a model of their own are their instance.
+    """
+    from cms.models import CMSPlugin
+    from cms.plugin_pool import plugin_pool
+
+    instances = {}
+    pks_by_model = defaultdict(list)
+    for plugin in plugin_list:
+        model = plugin_pool.get_plugin(plugin.plugin_type).model
+        if model is CMSPlugin or plugin.__class__ is model:
+            instances[plugin.pk] = plugin
+        else:
+            pks_by_model[model].append(plugin.pk)
+    for model, pks in pks_by_model.items():
+        for instance in model.objects.filter(pk__in=pks):
+            instances[instance.pk] = instance
+    return instances
+
+
+def _number_tree(plugin, children, tree_id, level, lft, values):
+    """
+    Computes the MPTT values of ``plugin`` and its descendants as if they
+    were inserted one by one as last children of their parent, and stores
+    them in ``values`` as ``{pk: (tree_id, level, lft, rght)}``.
+
+    Returns the ``rght`` value of ``plugin``.
+    """
+    rght = lft + 1
+    for child in children.get(plugin.pk, ()):
+        rght = _number_tree(child, children, tree_id, level + 1, rght, values) + 1
+    values[plugin.pk] = (tree_id, level, lft, rght)
+    return rght
+
+
+def _overrides(model, name):
+    """
+    Returns True if ``model`` or one of its bases below CMSPlugin has its
+    own method ``name``.
+    """
+    from cms.models import CMSPlugin
+
+    for klass in model.__mro__:
+        if klass is CMSPlugin:
+            return False
+        if name in klass.__dict__:
+            return True
+    return False
+
+
+def _get_first_tree_id(using):
+    """
+    Returns the tree_id following the highest one in use.
+
+    The plugin with the highest tree_id is locked until the end of the
+    transaction, so a concurrent copy waits for this one to be committed and
+    then sees its trees.
+    """
+    from cms.models import CMSPlugin
+
+    plugins = CMSPlugin.objects.using(using)
+    list(plugins.select_for_update().order_by('-tree_id').values_list('pk', flat=True)[:1])
+    return (plugins.aggregate(Max('tree_id'))['tree_id__max'] or 0) + 1
+
+
+def _insert(model, objs):
+    """
+    Inserts the rows of the table of ``model`` only, the parent rows of the
+    multi-table inheritance must exist already.
+    """
+    using = router.db_for_write(model)
+    for start in range(0, len(objs), INSERT_BATCH_SIZE):
+        model._base_manager._insert(objs[start:start + INSERT_BATCH_SIZE],
+                                    fields=model._meta.local_fields, using=using)
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = using
 
 
 def copy_plugins_to(plugin_list, to_placeholder, to_language=None, parent_plugin_id=None):
     """
     Copies a list of plugins to a placeholder to a language.
+
+    The list must hold parents before their children. The first plugin and
+    those whose parent is not copied become root plugins.
+
+    The copies are bulk inserted with their tree values computed in memory:
+    the CMSPlugin rows take an insert and a select per tree level, and the
+    rows of each plugin model one select (of the originals) and one insert.
+    ``copy_relations`` and ``post_copy`` are then called on the copies as
+    usual. No ``post_save`` signal is sent for the copied plugins, unless
+    their model has its own ``save`` method, which is then called instead of
+    the bulk insert.
     """
-    old_parent_cache = {}
-    plugins_ziplist = []
-    first = True
+    from cms.models import CMSPlugin
+
+    using = router.db_for_write(CMSPlugin)
+    if DJANGO_1_5:
+        # queries run in a transaction already, the lock on the tree ids is
+        # kept until the roots are committed or the caller's transaction ends
+        return _copy_plugins_to(plugin_list, to_placeholder, to_language, parent_plugin_id, using)
+    with transaction.atomic(using=using):
+        return _copy_plugins_to(plugin_list, to_placeholder, to_language, parent_plugin_id, using)
+
+
+def _copy_plugins_to(plugin_list, to_placeholder, to_language, parent_plugin_id, using):
+    from cms.cache.placeholder import clear_placeholder_cache
+    from cms.models import CMSPlugin
+
+    plugin_list = _get_known_plugins(plugin_list)
+    if not plugin_list:
+        return []
+    old_instances = _get_instances(plugin_list)
+
+    # every root plugin starts a new tree
+    pks = set(plugin.pk for plugin in plugin_list)
+    roots = []
+    children = defaultdict(list)
+    for plugin in plugin_list:
+        if plugin is plugin_list[0] or plugin.parent_id not in pks:
+            roots.append(plugin)
+        else:
+            children[plugin.parent_id].append(plugin)
+    first_tree_id = _get_first_tree_id(using)
+    values = {}
+    levels = defaultdict(list)
+    for tree_id, root in enumerate(roots, first_tree_id):
+        _number_tree(root, children, tree_id, 0, 1, values)
+    for plugin in plugin_list:
+        levels[values[plugin.pk][1]].append(plugin)
+
+    # children need the pk of their parent, so the rows are inserted level by
+    # level and their pks are read back by tree_id and lft
+    new_plugins = {}
+    for level in sorted(levels):
+        by_position = {}
+        for old_plugin in levels[level]:
+            tree_id, _, lft, rght = values[old_plugin.pk]
+            new_plugin = CMSPlugin(
+                placeholder=to_placeholder,
+                parent=new_plugins[old_plugin.parent_id] if level else None,
+                position=old_plugin.position,
+                language=to_language or old_plugin.language,
+                plugin_type=old_plugin.plugin_type,
+                tree_id=tree_id,
+                level=level,
+                lft=lft,
+                rght=rght,
+            )
+            new_plugins[old_plugin.pk] = new_plugin
+            by_position[(tree_id, lft)] = new_plugin
+        CMSPlugin.objects.bulk_create(list(by_position.values()))
+        rows = CMSPlugin.objects.using(using).filter(
+            placeholder=to_placeholder, tree_id__gte=first_tree_id, tree_id__lt=first_tree_id + len(roots), level=level,
+        ).values_list('pk', 'tree_id', 'lft')
+        for pk, tree_id, lft in rows:
+            new_plugin = by_position[(tree_id, lft)]
+            new_plugin.pk = pk
+            new_plugin._state.adding = False
+            new_plugin._state.db = using
+
+    # the plugin instances are built with their final values, so the tree
+    # fields MPTT remembers on init are right
+    base_fields = [field.attname for field in CMSPlugin._meta.fields]
+    instances_by_model = defaultdict(list)
     for old_plugin in plugin_list:
-        if first:
-            old_plugin.parent = None
-            old_plugin.parent_id = None
-        if to_language:
-            plugin_language = to_language
+        new_plugin = new_plugins[old_plugin.pk]
+        old_instance = old_instances.get(old_plugin.pk)
+        if old_instance is None:
+            new_plugin._inst = None
+            continue
+        model = old_instance.__class__
+        if model is CMSPlugin:
+            new_plugin._inst = new_plugin
+            continue
+        kwargs = dict((field.attname, getattr(old_instance, field.attname))
+                      for field in model._meta.fields)
+        for attname in base_fields:
+            kwargs[attname] = getattr(new_plugin, attname)
+        kwargs[model._meta.pk.attname] = new_plugin.pk
+        new_instance = model(**kwargs)
+        new_plugin._inst = new_instance
+        instances_by_model[model].append(new_instance)
+    for model, instances in instances_by_model.items():
+        if list(model._meta.parents) == [CMSPlugin] and not _overrides(model, 'save'):
+            _insert(model, instances)
         else:
-            plugin_language = old_plugin.language
-            # do the simple copying
-        new_plugin = old_plugin.copy_plugin(to_placeholder, plugin_language, old_parent_cache)
-        if first:
-            first = False
-            if parent_plugin_id:
-                from cms.models import CMSPlugin
-                if parent_plugin_id:
-                    new_plugin.move_to(target=CMSPlugin.objects.get(pk=parent_plugin_id))
-        plugins_ziplist.append((new_plugin, old_plugin))
-        # this magic is needed for advanced plugins like Text Plugins that can have
+            # plugin models inheriting from another plugin model or with a
+            # save method of their own
+            for instance in instances:
+                instance.save()
+    for old_plugin in plugin_list:
+        new_instance = new_plugins[old_plugin.pk]._inst
+        if new_instance is not None:
+            new_instance.copy_relations(old_instances[old_plugin.pk])
+
+    if parent_plugin_id:
+        first = new_plugins[plugin_list[0].pk]
+        first.move_to(target=CMSPlugin.objects.get(pk=parent_plugin_id))
+        # the instances of the moved plugins have stale tree values now
+        for new_plugin in new_plugins.values():
+            del new_plugin._inst
+    clear_placeholder_cache(to_placeholder.pk)
+
+    plugins_ziplist = [(new_plugins[old_plugin.pk], old_plugin) for old_plugin in plugin_list]
+    # this magic is needed for advanced plugins like Text Plugins that can have
     # nested plugins and need to update their content based on the new plugins.
     for new_plugin, old_plugin in plugins_ziplist:
         new_instance = new_plugin.get_plugin_instance()[0]
         if new_instance:
             new_instance.post_copy(old_plugin, plugins_ziplist)
-        # returns information about originals and copies
+    # returns information about originals and copies
     return plugins_ziplist
+
+
+def _get_content(plugin, instance):
+    """
+    Returns the type of a plugin and the values of the fields of its plugin
+    model as bytes.
+    """
+    from cms.models import CMSPlugin
+
+    values = [plugin.plugin_type]
+    if instance is not None and instance.__class__ is not CMSPlugin:
+        base_fields = set(CMSPlugin._meta.fields)
+        for field in instance._meta.fields:
+            if field not in base_fields and not field.primary_key:
+                values.append(u'%s=%s' % (field.attname, force_unicode(field.value_to_string(instance))))
+    return u'\n'.join(values).encode('utf-8')
+
+
+def _summarize_tree(plugin, children, instances, plugins):
+    """
+    Returns a hash of the content and shape of the tree below ``plugin`` and
+    the oldest and newest ``changed_date`` in it. The plugins of the tree are
+    appended to ``plugins``, parents first.
+
+    The hash is None if a plugin of the tree has a ``copy_relations`` method:
+    the related rows it copies are not part of the content and may have
+    changed.
+    """
+    plugins.append(plugin)
+    instance = instances.get(plugin.pk)
+    digest = md5(_get_content(plugin, instance))
+    comparable = instance is None or not _overrides(instance.__class__, 'copy_relations')
+    oldest = newest = plugin.changed_date
+    for child in children.get(plugin.pk, ()):
+        child_digest, child_oldest, child_newest = _summarize_tree(child, children, instances, plugins)
+        if child_digest is None:
+            comparable = False
+        else:
+            digest.update(('%s:%s' % (child.position, child_digest)).encode('utf-8'))
+        oldest = min(oldest, child_oldest)
+        newest = max(newest, child_newest)
+    return digest.hexdigest() if comparable else None, oldest, newest
+
+
+def _summarize_trees(plugin_list):
+    """
+    Returns a ``(root, digest, oldest, newest, plugins)`` tuple for every tree
+    of ``plugin_list``, see _summarize_tree.
+    """
+    plugin_list = _get_known_plugins(plugin_list)
+    instances = _get_instances(plugin_list)
+    pks = set(plugin.pk for plugin in plugin_list)
+    roots = []
+    children = defaultdict(list)
+    for plugin in plugin_list:
+        if plugin.parent_id in pks:
+            children[plugin.parent_id].append(plugin)
+        else:
+            roots.append(plugin)
+    trees = []
+    for root in roots:
+        plugins = []
+        digest, oldest, newest = _summarize_tree(root, children, instances, plugins)
+        trees.append((root, digest, oldest, newest, plugins))
+    return trees
+
+
+def sync_plugins_to(plugin_list, to_placeholder, language):
+    """
+    Makes the plugins of ``to_placeholder`` in ``language`` the same as the
+    plugins of ``plugin_list`` (the plugins of a placeholder in a language,
+    ordered by tree), writing only what differs.
+
+    The plugins are compared tree by tree: a tree of the placeholder is kept
+    if it has the same content and shape as one of the copied trees and it
+    was written after the last change to that tree. The other trees are
+    deleted, and the copied trees without a match are copied with
+    copy_plugins_to. Trees with plugins which copy relations are always
+    copied.
+
+    Returns the list of ``(new_plugin, old_plugin)`` tuples of the copies.
+    """
+    from cms.cache.placeholder import clear_placeholder_cache
+    from cms.models import CMSPlugin
+
+    current = list(to_placeholder.get_plugins(language))
+    available = defaultdict(list)
+    for tree in _summarize_trees(current):
+        available[tree[1]].append(tree)
+    kept = []
+    copied = []
+    for root, digest, oldest, newest, plugins in _summarize_trees(plugin_list):
+        candidates = available.get(digest, ()) if digest is not None else ()
+        for tree in candidates:
+            if tree[2] >= newest:
+                available[digest].remove(tree)
+                kept.append((tree, root.position))
+                break
+        else:
+            copied.extend(plugins)
+
+    # deleting plugins renumbers the positions of the remaining ones, so the
+    # kept plugins get their positions back afterwards
+    positions = {}
+    tree_ids = []
+    for tree, position in kept:
+        for plugin in tree[4]:
+            positions[plugin.pk] = plugin.position
+        positions[tree[0].pk] = position
+        tree_ids.append(tree[0].tree_id)
+    if len(positions) < len(current):
+        stale = CMSPlugin.objects.filter(placeholder=to_placeholder, language=language)
+        if tree_ids:
+            stale = stale.exclude(tree_id__in=tree_ids)
+        stale.delete()
+    plugin_ids = defaultdict(list)
+    rows = CMSPlugin.objects.filter(tree_id__in=tree_ids).values_list('pk', 'position') if tree_ids else ()
+    for pk, position in rows:
+        if positions[pk] != position:
+            plugin_ids[positions[pk]].append(pk)
+    for position, pks in plugin_ids.items():
+        CMSPlugin.objects.filter(pk__in=pks).update(position=position)
+    clear_placeholder_cache(to_placeholder.pk)
+
+    if copied:
+        return copy_plugins_to(copied, to_placeholder, language)
+    return []
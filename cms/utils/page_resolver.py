@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from cms.cache.routing import resolve_page
 from cms.utils.moderator import use_draft
 import re
 
@@ -26,17 +27,18 @@ def get_page_queryset(request=None):
     return Page.objects.public()
 
 
+def _is_admin_path(path):
+    if 'django.contrib.admin' in settings.INSTALLED_APPS:
+        return path.startswith(reverse('admin:index'))
+    return False
+
+
 def get_page_queryset_from_path(path, preview=False, draft=False, site=None):
     """ Returns a queryset of pages corresponding to the path given
     In may returns None or a single page is no page is present or root path is given
     """
-    if 'django.contrib.admin' in settings.INSTALLED_APPS:
-        admin_base = reverse('admin:index')
-    else:
-        admin_base = None
-
     # Check if this is called from an admin request
-    if admin_base and path.startswith(admin_base):
+    if _is_admin_path(path):
         # if so, get the page ID to request it directly
         match = ADMIN_PAGE_RE.search(path)
         if not match:
@@ -84,6 +86,11 @@ def get_page_from_path(path, preview=False, draft=False):
     """ Resolves a url path to a single page object.
     Raises exceptions is page does not exist or multiple pages are found
     """
+    if not _is_admin_path(path):
+        # The routing table answers from memory unless the path is ambiguous
+        found, page = resolve_page(path, Site.objects.get_current().pk, preview, draft)
+        if found:
+            return page
     page_qs = get_page_queryset_from_path(path, preview, draft)
     if page_qs is not None:
         if isinstance(page_qs, Page):
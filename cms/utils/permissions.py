@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
+from bisect import bisect_left, bisect_right
+from hashlib import md5
+from cms.cache.permissions import (get_permission_cache, set_permission_cache,
+    get_view_restrictions_cache, set_view_restrictions_cache)
 from cms.exceptions import NoPermissionsException
 from cms.models import Page, PagePermission, GlobalPagePermission
+from cms.models.permissionmodels import MASK_PAGE, MASK_CHILDREN, MASK_DESCENDANTS
 from cms.plugin_pool import plugin_pool
 from cms.utils import get_cms_setting
 from django.conf import settings
@@ -133,6 +138,95 @@ def get_any_page_view_permissions(request, page):
     return PagePermission.objects.for_page(page=page).filter(can_view=True)
 
 
+def get_user_group_ids(request):
+    """
+    Returns the ids of the groups of the request's user, queried once per
+    request.
+    """
+    if not hasattr(request, '_cms_user_group_ids'):
+        if request.user.is_authenticated():
+            request._cms_user_group_ids = set(request.user.groups.values_list('pk', flat=True))
+        else:
+            request._cms_user_group_ids = set()
+    return request._cms_user_group_ids
+
+
+def get_view_restrictions(site_id):
+    """
+    Returns a dict mapping the ids of the (draft and public) pages of a site
+    which have view restrictions to the list of ``(user_id, group_id)``
+    tuples of the PagePermissions granting the view permission on them.
+
+    Children and descendants are resolved from the MPTT ranges of the granting
+    pages, so this takes at most two queries regardless of the number of
+    grants. The result is cached per site.
+    """
+    restrictions = get_view_restrictions_cache(site_id)
+    if restrictions is not None:
+        return restrictions
+    perms = list(PagePermission.objects.filter(can_view=True, page__site=site_id).values_list(
+        'user_id', 'group_id', 'grant_on', 'page_id', 'page__publisher_public_id',
+        'page__tree_id', 'page__lft', 'page__rght'))
+    # tree_id -> (lft values, (id, publisher_public_id, parent_id) tuples)
+    trees = {}
+    # only grants on pages which actually have descendants need the page tree
+    tree_ids = set(perm[5] for perm in perms
+                   if perm[2] & (MASK_CHILDREN | MASK_DESCENDANTS) and perm[7] - perm[6] > 1)
+    if tree_ids:
+        pages = Page.objects.filter(tree_id__in=tree_ids).order_by('tree_id', 'lft').values_list(
+            'tree_id', 'lft', 'id', 'publisher_public_id', 'parent_id')
+        for tree_id, lft, page_id, public_id, parent_id in pages:
+            lfts, nodes = trees.setdefault(tree_id, ([], []))
+            lfts.append(lft)
+            nodes.append((page_id, public_id, parent_id))
+    restrictions = {}
+    for user_id, group_id, grant_on, page_id, public_id, tree_id, lft, rght in perms:
+        affected = []
+        if grant_on & MASK_PAGE:
+            affected.extend((page_id, public_id))
+        if grant_on & (MASK_CHILDREN | MASK_DESCENDANTS) and tree_id in trees:
+            lfts, nodes = trees[tree_id]
+            # descendants are the nodes with lft between the page's lft and rght
+            for child_id, child_public_id, parent_id in nodes[bisect_right(lfts, lft):bisect_left(lfts, rght)]:
+                if grant_on & MASK_DESCENDANTS or parent_id == page_id:
+                    affected.extend((child_id, child_public_id))
+        grant = (user_id, group_id)
+        for pk in affected:
+            if pk is None:
+                continue
+            grants = restrictions.setdefault(pk, [])
+            if grant not in grants:
+                grants.append(grant)
+    set_view_restrictions_cache(site_id, restrictions)
+    return restrictions
+
+
+def get_view_permission_profile(user):
+    """
+    Returns a short string identifying everything which decides the pages
+    ``user`` is allowed to see (see cms.menu.get_visible_pages). Users sharing
+    a profile see the same pages, so per-user data (like menus) can be cached
+    per profile instead of per user.
+
+    Users with view permissions granted directly to them get a profile of
+    their own.
+    """
+    if not user.is_authenticated():
+        return 'anonymous'
+    profile = get_permission_cache(user, 'view_profile')
+    if profile is None:
+        if (PagePermission.objects.filter(user=user, can_view=True).exists() or
+                GlobalPagePermission.objects.filter(user=user, can_view=True).exists()):
+            profile = 'user-%s' % user.pk
+        else:
+            group_ids = sorted(user.groups.values_list('pk', flat=True))
+            flags = '%d%d' % (user.is_staff, user.has_perm('cms.view_page'))
+            key = '%s:%s' % (flags, ','.join(str(pk) for pk in group_ids))
+            profile = 'groups-%s' % md5(key.encode('utf-8')).hexdigest()
+        set_permission_cache(user, 'view_profile', profile)
+    return profile
+
+
 def get_user_permission_level(user):
     """
     Returns highest user level from the page/permission hierarchy on which
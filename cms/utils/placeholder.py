@@ -6,6 +6,7 @@ from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from cms.utils.compat.dj import force_unicode
 from django.db.models.query_utils import Q
+from sekizai.helpers import get_varname
 
 
 def get_toolbar_plugin_struct(plugins_list, slot, page, parent=None):
@@ -67,6 +68,20 @@ def get_placeholder_conf(setting, placeholder, template=None, default=None):
     return default
 
 
+def restore_sekizai(context, changes):
+    """
+    Replays the sekizai data recorded (with sekizai.helpers.Watcher) while
+    rendering cached content.
+    """
+    if not changes:
+        return
+    sekizai_container = context[get_varname()]
+    for key, values in changes.items():
+        sekizai_namespace = sekizai_container[key]
+        for value in values:
+            sekizai_namespace.append(value)
+
+
 def get_page_from_placeholder_if_exists(placeholder):
     import warnings
 
@@ -109,12 +124,11 @@ class MLNGPlaceholderActions(PlaceholderNoAction):
         source_placeholder = getattr(src, fieldname, None)
         if not source_placeholder:
             return False
+        from cms.utils.copy_plugins import copy_plugins_to
+
         plugins = source_placeholder.get_plugins_list()
-        cache = {}
-        new_plugins = []
-        for p in plugins:
-            new_plugins.append(p.copy_plugin(target_placeholder, target_language, cache))
-        return new_plugins
+        return [new_plugin for new_plugin, old_plugin in
+                copy_plugins_to(plugins, target_placeholder, target_language)]
 
     def get_copy_languages(self, placeholder, model, fieldname, **kwargs):
         manager = model.objects
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
+from cms import constants
 from cms.exceptions import DuplicatePlaceholderWarning
 from cms.models import Page
 from cms.templatetags.cms_tags import Placeholder
+from cms.utils.conf import get_cms_setting
 from cms.utils.placeholder import validate_placeholder_name
+from django.conf import settings
 from django.contrib.sites.models import Site, SITE_CACHE
 from django.shortcuts import get_object_or_404
 from django.template import NodeList, VariableNode, TemplateSyntaxError
 from django.template.loader import get_template
 from django.template.loader_tags import ConstantIncludeNode, ExtendsNode, BlockNode
+from cms.utils.compat.dj import setting_changed
 import warnings
 from sekizai.helpers import is_variable_extend_node
 
@@ -53,8 +57,8 @@ def _find_topmost_template(extend_node):
 
 def _extend_nodelist(extend_node):
     """
-    Returns a list of placeholders found in the parent template(s) of this
-    ExtendsNode
+    Returns a list of placeholder nodes found in the parent template(s) of
+    this ExtendsNode
     """
     # we don't support variable extensions
     if is_variable_extend_node(extend_node):
@@ -83,7 +87,7 @@ def _scan_placeholders(nodelist, current_block=None, ignore_blocks=None):
     for node in nodelist:
         # check if this is a placeholder first
         if isinstance(node, Placeholder):
-            placeholders.append(node.get_name())
+            placeholders.append(node)
         # if it's a Constant Include Node ({% include "template_name.html" %})
         # scan the child template
         elif isinstance(node, ConstantIncludeNode):
@@ -123,31 +127,103 @@ def _scan_placeholders(nodelist, current_block=None, ignore_blocks=None):
     return placeholders
 
 
+# template name -> (slot name, inherit) tuples, see get_placeholders
+_placeholders_cache = {}
+
+
+def _get_scanned_placeholders(template):
+    """
+    The result of the scan of a template is kept for the lifetime of the
+    process, except in DEBUG mode where templates are scanned every time so
+    that changes to them are picked up.
+    """
+    if settings.DEBUG:
+        return _scan_template(template)
+    placeholders = _placeholders_cache.get(template)
+    if placeholders is None:
+        placeholders = _placeholders_cache[template] = _scan_template(template)
+    return placeholders
+
+
 def get_placeholders(template):
+    """
+    Returns the names of the placeholders in the template.
+    """
+    return [name for name, inherit in _get_scanned_placeholders(template)]
+
+
+def get_inherited_placeholders(template):
+    """
+    Returns the names of the placeholders of the template which inherit the
+    content of the parent pages.
+    """
+    return [name for name, inherit in _get_scanned_placeholders(template) if inherit]
+
+
+def _scan_template(template):
     compiled_template = get_template(template)
     placeholders = _scan_placeholders(compiled_template.nodelist)
     clean_placeholders = []
-    for placeholder in placeholders:
-        if placeholder in clean_placeholders:
+    names = []
+    for node in placeholders:
+        placeholder = node.get_name()
+        if placeholder in names:
             warnings.warn("Duplicate {{% placeholder \"{0}\" %}} "
                           "in template {1}."
                           .format(placeholder, template, placeholder),
                           DuplicatePlaceholderWarning)
         else:
             validate_placeholder_name(placeholder)
-            clean_placeholders.append(placeholder)
+            names.append(placeholder)
+            clean_placeholders.append((placeholder, node.is_inherited()))
     return clean_placeholders
 
 
+def reset_placeholders_cache(**kwargs):
+    _placeholders_cache.clear()
+
+
+def warm_placeholders_cache():
+    """
+    Scans every template of CMS_TEMPLATES and returns a dict mapping the
+    template names to their placeholders.
+    """
+    slots = {}
+    for template, name in get_cms_setting('TEMPLATES'):
+        if template == constants.TEMPLATE_INHERITANCE_MAGIC:
+            continue
+        slots[template] = get_placeholders(template)
+    return slots
+
+
+def _reset_placeholders_cache_on_change(setting, **kwargs):
+    if setting.startswith('TEMPLATE') or setting in ('CMS_TEMPLATES', 'INSTALLED_APPS'):
+        reset_placeholders_cache()
+
+setting_changed.connect(_reset_placeholders_cache_on_change, dispatch_uid="cms.placeholders_cache")
+
+
 SITE_VAR = "site__exact"
 
 
-def current_site(request):
+def _get_site_pk(request):
     if SITE_VAR in request.REQUEST:
-        site_pk = request.REQUEST[SITE_VAR]
-    else:
-        session = getattr(request, 'session')
-        site_pk = request.session.get('cms_admin_site', None)
+        return request.REQUEST[SITE_VAR]
+    return request.session.get('cms_admin_site', None)
+
+
+def current_site_id(request):
+    """
+    Returns the id of the site current_site returns, without loading it.
+    """
+    site_pk = _get_site_pk(request)
+    if site_pk:
+        return int(site_pk)
+    return settings.SITE_ID
+
+
+def current_site(request):
+    site_pk = _get_site_pk(request)
     if site_pk:
         try:
             site = SITE_CACHE.get(site_pk) or Site.objects.get(pk=site_pk)
@@ -3,8 +3,10 @@ from __future__ import with_statement
 from django.contrib.auth.views import redirect_to_login
 from django.template.response import TemplateResponse
 from cms.apphook_pool import apphook_pool
+from cms.cache.page import is_cacheable_request, get_page_cache, set_page_cache
 from cms.appresolver import get_app_urls
 from cms.models import Title
+from cms.plugin_rendering import render_concurrently
 from cms.utils import get_template_from_request, get_language_from_request
 from cms.utils.i18n import get_fallback_languages, force_language, get_public_languages, get_redirect_on_fallback, \
     get_language_list, is_language_prefix_patterns_used
@@ -18,6 +20,17 @@ from django.template.context import RequestContext
 from django.utils.http import urlquote
 
 
+class PageTemplateResponse(TemplateResponse):
+    """
+    Renders the placeholders of the page on the rendering pool if
+    CMS_PLACEHOLDER_RENDERING_THREADS is set.
+    """
+
+    @property
+    def rendered_content(self):
+        return render_concurrently(self._request, lambda: TemplateResponse.rendered_content.fget(self))
+
+
 def _handle_no_page(request, slug):
     if not slug and settings.DEBUG:
         return TemplateResponse(request, "cms/welcome.html", RequestContext(request))
@@ -29,6 +42,12 @@ def details(request, slug):
     The main view of the Django-CMS! Takes a request and a slug, renders the
     page.
     """
+    current_language = get_language_from_request(request)
+    use_page_cache = is_cacheable_request(request)
+    if use_page_cache:
+        response = get_page_cache(request, current_language)
+        if response is not None:
+            return response
     # get the right model
     context = RequestContext(request)
     # Get a Page model object from the request
@@ -36,7 +55,6 @@ def details(request, slug):
     if not page:
         return _handle_no_page(request, slug)
 
-    current_language = get_language_from_request(request)
     # Check that the current page is available in the desired (current) language
     available_languages = []
     page_languages = list(page.get_languages())
@@ -145,4 +163,8 @@ def details(request, slug):
     if not context['has_view_permissions']:
         return _handle_no_page(request, slug)
 
-    return TemplateResponse(request, template_name, context)
+    response = PageTemplateResponse(request, template_name, context)
+    if use_page_cache:
+        response.add_post_render_callback(
+            lambda response: set_page_cache(request, current_language, response))
+    return response
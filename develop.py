@@ -23,7 +23,7 @@ dj-database-url compatible value.
 
 Usage:
     develop.py test [--parallel | --failfast] [--migrate] [<test-label>...]
-    develop.py timed test [test-label...]
+    develop.py timed test [<test-label>...]
     develop.py isolated test [<test-label>...] [--parallel] [--migrate]
     develop.py server [--port=<port>] [--bind=<bind>] [--migrate]
     develop.py shell
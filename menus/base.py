@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 from django.utils.translation import get_language
 from django.utils.encoding import smart_str
+import copy
 
 
 class Menu(object):
     namespace = None
+    # Set to True if the nodes only depend on the pages a user may view (see
+    # cms.utils.permissions.get_view_permission_profile). If every menu does,
+    # users sharing a profile share the cached nodes; otherwise they are
+    # cached per user.
+    shared_by_permission_profile = False
     
     def __init__(self):
         if not self.namespace:
@@ -21,8 +27,25 @@ class Modifier(object):
     def modify(self, request, nodes, namespace, root_id,  post_cut, breadcrumb):
         pass
     
+# Attributes every node has, set in __init__
+NODE_FIELDS = ('title', 'url', 'id', 'parent_id', 'parent_namespace',
+               'namespace', 'visible', 'attr', 'parent', 'children')
+
+# The NODE_FIELDS stored as columns by pack_nodes (parent and children are
+# stored as indexes). Changing it changes the packed layout: bump PACK_FORMAT.
+PACKED_FIELDS = ('title', 'url', 'id', 'parent_id', 'parent_namespace',
+                 'namespace', 'visible', 'attr')
+
+# Attributes set on nodes by the menu pool, modifiers and the menu tags
+NODE_FLAGS = ('selected', 'sibling', 'ancestor', 'descendant', 'level',
+              'menu_level', 'is_leaf_node')
+
+
 class NavigationNode(object):
-    
+    # Known attributes live in slots. __dict__ is only allocated if some
+    # other attribute is set, which keeps third party modifiers working.
+    __slots__ = NODE_FIELDS + NODE_FLAGS + ('__dict__',)
+
     def __init__(self, title, url, id, parent_id=None, parent_namespace=None, attr=None, visible=True):
         self.children = [] # do not touch
         self.parent = None # do not touch, code depends on this
@@ -38,6 +61,25 @@ class NavigationNode(object):
             self.attr = attr
         else:
             self.attr = {} # To avoid declaring a dict in defaults...
+
+    def __getstate__(self):
+        # A plain dict keeps the pickle format independent of the slots
+        state = dict(self.__dict__)
+        for name in NODE_FIELDS + NODE_FLAGS:
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __copy__(self):
+        new = self.__class__.__new__(self.__class__)
+        new.__setstate__(self.__getstate__())
+        return new
             
     def __repr__(self):
         return "<Navigation Node: %s>" % smart_str(self.title)
@@ -64,3 +106,130 @@ class NavigationNode(object):
             nodes.append(self.parent)
             nodes += self.parent.get_ancestors()
         return nodes
+
+
+def copy_nodes(nodes):
+    """
+    Returns copies of ``nodes`` which can be modified freely: the tree
+    structure (parent and children) and the flags set by modifiers are private
+    to the copies, everything else (titles, urls, attr) is shared with the
+    originals.
+
+    This is a lot cheaper than copy.deepcopy and is used to hand out the same
+    menu to several menu tags of a request.
+    """
+    copies = {}
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if id(node) in copies:
+            continue
+        copies[id(node)] = copy.copy(node)
+        if node.parent is not None:
+            stack.append(node.parent)
+        stack.extend(node.children)
+    for new in copies.values():
+        if new.parent is not None:
+            new.parent = copies[id(new.parent)]
+        new.children = [copies[id(child)] for child in new.children]
+    return [copies[id(node)] for node in nodes]
+
+
+class NodeList(list):
+    """
+    A list of nodes that knows its nodes by url. ``url_index`` maps the
+    absolute url of the nodes to the first node with that url.
+
+    The lists handed out by ``MenuPool.get_nodes`` also carry a
+    ``reverse_id_index`` mapping the reverse_ids of the nodes to their
+    position in the list (see index_reverse_ids).
+    """
+    url_index = None
+    reverse_id_index = None
+
+
+def index_urls(nodes):
+    """
+    Maps the absolute urls of ``nodes`` to the index of the first node
+    having that url.
+    """
+    url_index = {}
+    for index, node in enumerate(nodes):
+        url = node.get_absolute_url()
+        if url is not None and url not in url_index:
+            url_index[url] = index
+    return url_index
+
+
+def index_reverse_ids(nodes):
+    """
+    Maps the reverse_ids of ``nodes`` to the index of the first node having
+    that reverse_id.
+    """
+    reverse_id_index = {}
+    for index, node in enumerate(nodes):
+        reverse_id = node.attr.get('reverse_id', None)
+        if reverse_id and reverse_id not in reverse_id_index:
+            reverse_id_index[reverse_id] = index
+    return reverse_id_index
+
+
+# Bump this whenever the layout produced by pack_nodes changes
+PACK_FORMAT = 2
+
+
+def pack_nodes(nodes):
+    """
+    Packs a flat list of nodes (as built by the menu pool: parents come before
+    their children and children are in list order) into parallel lists of
+    plain values, which pickle and unpickle a lot faster than node objects.
+
+    Attributes other than the PACKED_FIELDS are kept per node in ``extras``.
+    """
+    index = dict((id(node), i) for i, node in enumerate(nodes))
+    classes = []
+    class_indexes = []
+    parents = []
+    columns = dict((name, []) for name in PACKED_FIELDS)
+    extras = {}
+    for i, node in enumerate(nodes):
+        if node.__class__ not in classes:
+            classes.append(node.__class__)
+        class_indexes.append(classes.index(node.__class__))
+        state = node.__getstate__()
+        parent = state.pop('parent', None)
+        state.pop('children', None)
+        parents.append(index.get(id(parent), -1))
+        for name in PACKED_FIELDS:
+            columns[name].append(state.pop(name, None))
+        if state:
+            extras[i] = state
+    return (PACK_FORMAT, classes, class_indexes, parents,
+            [columns[name] for name in PACKED_FIELDS], extras, index_urls(nodes))
+
+
+def unpack_nodes(packed):
+    """
+    Rebuilds the NodeList packed by pack_nodes. Returns None if ``packed`` is
+    not in the current format.
+    """
+    if not isinstance(packed, tuple) or not packed or packed[0] != PACK_FORMAT:
+        return None
+    version, classes, class_indexes, parents, columns, extras, url_index = packed
+    nodes = NodeList()
+    for i, cls_index in enumerate(class_indexes):
+        cls = classes[cls_index]
+        node = cls.__new__(cls)
+        for name, column in zip(PACKED_FIELDS, columns):
+            setattr(node, name, column[i])
+        node.parent = None
+        node.children = []
+        if i in extras:
+            node.__setstate__(extras[i])
+        nodes.append(node)
+    for node, parent in zip(nodes, parents):
+        if parent >= 0:
+            node.parent = nodes[parent]
+            nodes[parent].children.append(node)
+    nodes.url_index = dict((url, nodes[index]) for url, index in url_index.items())
+    return nodes
@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
+from collections import deque
 from logging import getLogger
+from cms.cache import bump_generation, get_generation
+from cms.cache.invalidation import defer
+from cms.cache.menu_snapshot import clear_menu_snapshot
+from cms.cache.singleflight import get_or_build, set_entry
 from cms.utils import get_cms_setting
 from cms.utils.django_load import load
 
@@ -8,68 +13,190 @@ from django.contrib.sites.models import Site
 from django.core.cache import cache
 from django.core.urlresolvers import NoReverseMatch
 from django.utils.translation import get_language
+from menus.base import (copy_nodes, index_urls, index_reverse_ids, pack_nodes, unpack_nodes,
+    NodeList)
 from menus.exceptions import NamespaceAllreadyRegistered
-from menus.models import CacheKey
 from django.utils.translation import ugettext_lazy as _
 from django.contrib import messages
-import copy
 
 logger = getLogger('menus')
 
-def _build_nodes_inner_for_one_menu(nodes, menu_class_name):
+def _build_tree(nodes, menu_class_name):
     '''
-    This is an easier to test "inner loop" building the menu tree structure
-    for one menu (one language, one site) 
+    Builds the tree structure for one menu (one language, one site) in linear
+    time and returns ``(final_nodes, dangling, cyclic)``.
+
+    The result is the same as processing the nodes as a queue where a node
+    whose parent wasn't seen yet is put back at the end of the queue: the
+    queue is handled in rounds, each round visits the remaining nodes in
+    their original order, so a node is added in the round of its parent if it
+    comes after the parent in the list, or in the following round otherwise.
+    Nodes are added ordered by (round, index).
+
+    ``dangling`` are the nodes whose parent doesn't exist (and their
+    descendants), ``cyclic`` the nodes that are part of (or below) a cycle.
+    Neither are part of the final list.
     '''
-    done_nodes = {} # Dict of node.id:Node
-    final_nodes = []
-    
-    # This is to prevent infinite loops - we need to compare the number of 
-    # times we see a specific node to "something", and for the time being, 
-    # it's the total number of nodes
-    list_total_length = len(nodes)
-    
-    while nodes:
-        # For when the node has a parent_id but we haven't seen it yet. 
-        # We must not append it to the final list in this case!
-        should_add_to_final_list = True 
-        
-        node = nodes.pop(0)
-        
-        # Increment the "seen" counter for this specific node.
-        node._counter = getattr(node,'_counter',0) + 1  
-        
+    # (namespace, id) of the nodes
+    registered = set()
+    # (namespace, parent_id) -> indexes of the nodes waiting for that parent
+    pending = {}
+    rounds = [None] * len(nodes)
+    queue = deque()
+    for index, node in enumerate(nodes):
         # Implicit namespacing by menu.__name__
         if not node.namespace:
             node.namespace = menu_class_name
-        if node.namespace not in done_nodes:
-            # We need to create the namespace dict to avoid KeyErrors
-            done_nodes[node.namespace] = {} 
-        
-        # If we have seen the parent_id already...
-        if node.parent_id in done_nodes[node.namespace] :
-            # Implicit parent namespace by menu.__name__
-            if not node.parent_namespace:
-                node.parent_namespace = menu_class_name
-            parent = done_nodes[node.namespace][node.parent_id]
-            parent.children.append(node)
-            node.parent = parent
-        # If it has a parent_id but we haven't seen it yet...
-        elif node.parent_id:
-            # We check for infinite loops here, by comparing the number of 
-            # times we "saw" this node to the number of nodes in the list
-            if node._counter < list_total_length:
-                nodes.append(node)
-            # Never add this node to the final list until it has a real 
-            # parent (node.parent)
-            should_add_to_final_list = False
-            
-        if should_add_to_final_list:
+        registered.add((node.namespace, node.id))
+        if node.parent_id:
+            pending.setdefault((node.namespace, node.parent_id), []).append(index)
+        else:
+            rounds[index] = 0
+            queue.append(index)
+
+    # Children in the round of their parent go to the front of the queue,
+    # the others to the back, so nodes are reached round by round and the
+    # first node reached with a key is the one its children wait for.
+    while queue:
+        index = queue.popleft()
+        node = nodes[index]
+        turn = rounds[index]
+        for child in pending.pop((node.namespace, node.id), ()):
+            if child > index:
+                rounds[child] = turn
+                queue.appendleft(child)
+            else:
+                rounds[child] = turn + 1
+                queue.append(child)
+
+    # Sort the reached nodes by (round, index): going through the indexes in
+    # order fills every round in index order.
+    by_round = []
+    for index, turn in enumerate(rounds):
+        if turn is not None:
+            while len(by_round) <= turn:
+                by_round.append([])
+            by_round[turn].append(index)
+
+    # Replay the additions in order, this keeps the original semantics for
+    # duplicated ids (the last node added with an id is the parent)
+    done_nodes = {}
+    final_nodes = []
+    for indexes in by_round:
+        for index in indexes:
+            node = nodes[index]
+            namespace_nodes = done_nodes.setdefault(node.namespace, {})
+            if node.parent_id:
+                # Implicit parent namespace by menu.__name__
+                if not node.parent_namespace:
+                    node.parent_namespace = menu_class_name
+                parent = namespace_nodes[node.parent_id]
+                parent.children.append(node)
+                node.parent = parent
             final_nodes.append(node)
-            # add it to the "seen" list
-            done_nodes[node.namespace][node.id] = node
+            namespace_nodes[node.id] = node
+
+    dangling = []
+    cyclic = []
+    if len(final_nodes) < len(nodes):
+        # Whatever is still pending waits for a parent which either doesn't
+        # exist or is itself waiting
+        below_dangling = []
+        for key, children in pending.items():
+            if key not in registered:
+                below_dangling.extend(children)
+        while below_dangling:
+            index = below_dangling.pop()
+            dangling.append(nodes[index])
+            node = nodes[index]
+            below_dangling.extend(pending.pop((node.namespace, node.id), []))
+        dangling_ids = set(id(node) for node in dangling)
+        cyclic = [node for index, node in enumerate(nodes)
+                  if rounds[index] is None and id(node) not in dangling_ids]
+    return final_nodes, dangling, cyclic
+
+
+def _build_nodes_inner_for_one_menu(nodes, menu_class_name):
+    '''
+    This is an easier to test "inner loop" building the menu tree structure
+    for one menu (one language, one site) 
+    '''
+    final_nodes, dangling, cyclic = _build_tree(nodes, menu_class_name)
+    if dangling:
+        logger.warning("Menu %s: skipped %d node(s) with a non-existent parent: %s" % (
+            menu_class_name, len(dangling), _describe_nodes(dangling)))
+    if cyclic:
+        logger.warning("Menu %s: skipped %d node(s) in a parent cycle: %s" % (
+            menu_class_name, len(cyclic), _describe_nodes(cyclic)))
     return final_nodes
 
+
+def _describe_nodes(nodes, limit=10):
+    description = ", ".join("%s (parent %s)" % (node.id, node.parent_id) for node in nodes[:limit])
+    if len(nodes) > limit:
+        description += ", ..."
+    return description
+
+
+def _get_cache_prefix():
+    return getattr(settings, "CMS_CACHE_PREFIX", "menu_cache_")
+
+
+def _get_generation_key(site_id=None, language=None):
+    key = "%smenu_generation" % _get_cache_prefix()
+    if site_id:
+        key += "_site_%s" % site_id
+    if language:
+        key += "_lang_%s" % language
+    return key
+
+
+def _get_generations(site_id, language):
+    """
+    Returns the generation counters (global, per site, per language and per
+    site and language) that version the menu of a site and language.
+    """
+    keys = [
+        _get_generation_key(),
+        _get_generation_key(site_id=site_id),
+        _get_generation_key(language=language),
+        _get_generation_key(site_id, language),
+    ]
+    generations = cache.get_many(keys)
+    return [generations[key] if key in generations else get_generation(key) for key in keys]
+
+
+def _get_menu_key_suffix(request):
+    from cms.utils.moderator import use_draft
+    from cms.utils.permissions import get_view_permission_profile
+
+    suffix = ""
+    if use_draft(request):
+        suffix += "_draft"
+    menus = menu_pool.menus.values()
+    if all(menu.shared_by_permission_profile for menu in menus):
+        suffix += "_%s" % get_view_permission_profile(request.user)
+    elif request.user.is_authenticated():
+        suffix += "_%s_user" % request.user.pk
+    return suffix
+
+
+def _get_menu_cache_key(request, site_id, language):
+    return "%smenu_nodes_%s_%s_%s%s" % (
+        _get_cache_prefix(), language, site_id,
+        ".".join(str(generation) for generation in _get_generations(site_id, language)),
+        _get_menu_key_suffix(request))
+
+
+def _get_menu_stale_key(request, site_id, language):
+    """
+    Key of the latest node set built for a menu, whatever its generation. It
+    is served while the node set of a new generation is being built.
+    """
+    return "%smenu_nodes_latest_%s_%s%s" % (
+        _get_cache_prefix(), language, site_id, _get_menu_key_suffix(request))
+
+
 class MenuPool(object):
     def __init__(self):
         self.menus = {}
@@ -86,16 +213,39 @@ class MenuPool(object):
         
     def clear(self, site_id=None, language=None, all=False):
         '''
-        This invalidates the cache for a given menu (site_id and language)
+        This invalidates the cache for a given menu (site_id and language),
+        along with the snapshot of the pages the CMS builds its menu from (see
+        cms.cache.menu_snapshot). Call it after changing pages without saving
+        them, e.g. with a queryset update.
+
+        Invalidation bumps a generation counter stored in the cache backend,
+        old node sets simply stop being referenced and expire on their own.
+        Within cms.cache.invalidation.deferred_invalidation every counter is
+        bumped once, at the end.
         '''
         if all:
-            cache_keys = CacheKey.objects.get_keys()
+            site_id = None
+        if not defer(('menu_snapshot', site_id), clear_menu_snapshot, site_id):
+            clear_menu_snapshot(site_id)
+        self.clear_nodes(site_id, language, all)
+
+    def clear_nodes(self, site_id=None, language=None, all=False):
+        '''
+        Like clear, but keeps the page snapshot, which the CMS updates itself
+        when pages are saved.
+        '''
+        if all or (not site_id and not language):
+            key = _get_generation_key()
+        elif not language:
+            key = _get_generation_key(site_id=site_id)
+        elif not site_id:
+            key = _get_generation_key(language=language)
         else:
-            cache_keys = CacheKey.objects.get_keys(site_id, language)        
-        to_be_deleted = cache_keys.distinct().values_list('key', flat=True)
-        cache.delete_many(to_be_deleted)
-        cache_keys.delete()
-    
+            key = _get_generation_key(site_id, language)
+        if defer(('menus', key), bump_generation, key):
+            return
+        bump_generation(key)
+
     def register_menu(self, menu):
         from menus.base import Menu
         assert issubclass(menu, Menu)
@@ -129,14 +279,26 @@ class MenuPool(object):
         """
         # Cache key management
         lang = get_language()
-        prefix = getattr(settings, "CMS_CACHE_PREFIX", "menu_cache_")
-        key = "%smenu_nodes_%s_%s" % (prefix, lang, site_id)
-        if request.user.is_authenticated():
-            key += "_%s_user" % request.user.pk
-        cached_nodes = cache.get(key, None)
-        if cached_nodes:
-            return cached_nodes
-        
+        key = _get_menu_cache_key(request, site_id, lang)
+        timeout = get_cms_setting('CACHE_DURATIONS')['menus']
+
+        def build():
+            return pack_nodes(self._build_all_nodes(request))
+
+        # The generation counters in the key take care of invalidation, so
+        # there's no need to keep track of the keys we set. Only one worker
+        # rebuilds a new generation, the others get the previous node set.
+        packed = get_or_build(key, build, timeout,
+                              stale_key=_get_menu_stale_key(request, site_id, lang))
+        nodes = unpack_nodes(packed)
+        if nodes is None:
+            # stored by an older version
+            packed = build()
+            set_entry(key, packed, timeout)
+            nodes = unpack_nodes(packed)
+        return nodes
+
+    def _build_all_nodes(self, request):
         final_nodes = []
         for menu_class_name in self.menus:
             try:
@@ -151,13 +313,6 @@ class MenuPool(object):
                     logger.error("Menu %s could not be loaded." % menu_class_name, exc_info=True)
             # nodes is a list of navigation nodes (page tree in cms + others)
             final_nodes += _build_nodes_inner_for_one_menu(nodes, menu_class_name)
-        cache.set(key, final_nodes, get_cms_setting('CACHE_DURATIONS')['menus'])
-        # We need to have a list of the cache keys for languages and sites that
-        # span several processes - so we follow the Django way and share through 
-        # the database. It's still cheaper than recomputing every time!
-        # This way we can selectively invalidate per-site and per-language, 
-        # since the cache shared but the keys aren't 
-        CacheKey.objects.get_or_create(key=key, language=lang, site=site_id)
         return final_nodes
 
     def apply_modifiers(self, nodes, request, namespace=None, root_id=None, post_cut=False, breadcrumb=False):
@@ -169,31 +324,48 @@ class MenuPool(object):
         return nodes
 
     def get_nodes(self, request, namespace=None, root_id=None, site_id=None, breadcrumb=False):
+        """
+        The modified nodes are kept on the request, so every menu tag of a
+        request shares one run of the modifiers and gets a cheap copy of the
+        result to cut. The copy is a NodeList whose ``reverse_id_index`` is
+        built once along with the cached nodes.
+        """
         self.discover_menus()
         if not site_id:
             site_id = Site.objects.get_current().pk
-        nodes = self._build_nodes(request, site_id)
-        nodes = copy.deepcopy(nodes)
-        nodes = self.apply_modifiers(nodes, request, namespace, root_id, post_cut=False, breadcrumb=breadcrumb)
-        return nodes 
+        if not hasattr(request, '_menu_nodes_cache'):
+            request._menu_nodes_cache = {}
+        # the cache key changes whenever the menu is invalidated
+        key = (_get_menu_cache_key(request, site_id, get_language()), namespace, root_id, breadcrumb)
+        if key not in request._menu_nodes_cache:
+            nodes = self._build_nodes(request, site_id)
+            nodes = self.apply_modifiers(nodes, request, namespace, root_id, post_cut=False, breadcrumb=breadcrumb)
+            request._menu_nodes_cache[key] = (nodes, index_reverse_ids(nodes))
+        nodes, reverse_id_index = request._menu_nodes_cache[key]
+        copies = NodeList(copy_nodes(nodes))
+        copies.reverse_id_index = reverse_id_index
+        return copies
 
     def _mark_selected(self, request, nodes):
-        sel = None
+        """
+        Selects the node with the longest url that is a prefix of the
+        request's path. The url index of the cached menu is used to look up
+        the prefixes of the path from the longest to the shortest.
+        """
         for node in nodes:
             node.sibling = False
             node.ancestor = False
             node.descendant = False
             node.selected = False
-            if node.get_absolute_url() == request.path[:len(node.get_absolute_url())]:
-                if sel:
-                    if len(node.get_absolute_url()) > len(sel.get_absolute_url()):
-                        sel = node
-                else:
-                    sel = node
-            else:
-                node.selected = False
-        if sel:
-            sel.selected = True
+        url_index = getattr(nodes, 'url_index', None)
+        if url_index is None:
+            url_index = dict((url, nodes[index]) for url, index in index_urls(nodes).items())
+        path = request.path
+        for length in range(len(path), -1, -1):
+            node = url_index.get(path[:length])
+            if node is not None:
+                node.selected = True
+                break
         return nodes
 
     def get_menus_by_attribute(self, name, value):
@@ -204,6 +376,20 @@ class MenuPool(object):
                 found.append((menu[0], menu[1].name))
         return found
 
+    def get_node_by_reverse_id(self, nodes, reverse_id):
+        """
+        Returns the first node with the given reverse_id or None, using the
+        index of the nodes returned by get_nodes when there is one.
+        """
+        reverse_id_index = getattr(nodes, 'reverse_id_index', None)
+        if reverse_id_index is None:
+            found = self.get_nodes_by_attribute(nodes, 'reverse_id', reverse_id)
+            return found[0] if found else None
+        index = reverse_id_index.get(reverse_id)
+        if index is None:
+            return None
+        return nodes[index]
+
     def get_nodes_by_attribute(self, nodes, name, value):
         found = []
         for node in nodes:
@@ -131,9 +131,8 @@ class ShowMenu(InclusionTag):
         #new menu... get all the data so we can save a lot of queries
             nodes = menu_pool.get_nodes(request, namespace, root_id)
             if root_id: # find the root id and cut the nodes
-                id_nodes = menu_pool.get_nodes_by_attribute(nodes, "reverse_id", root_id)
-                if id_nodes:
-                    node = id_nodes[0]
+                node = menu_pool.get_node_by_reverse_id(nodes, root_id)
+                if node is not None:
                     nodes = node.children
                     for remove_parent in nodes:
                         remove_parent.parent = None